@@ -0,0 +1,82 @@
+""" CondConv benchmark script
+This script compares the CondConv2d execution strategies (grouped, auto, experts, the B=1 CPU mixed kernel
+cache and optionally auto w/ sparse routing) for the CondConv EfficientNet models across batch sizes (outputs
+are checked against 'grouped').
+"""
+import argparse
+import time
+import torch
+
+import geffnet
+
+parser = argparse.ArgumentParser(description='CondConv Benchmark')
+parser.add_argument('--models', default='efficientnet_cc_b0_4e,efficientnet_cc_b0_8e,efficientnet_cc_b1_8e',
+                    type=str, help='comma separated list of models to benchmark')
+parser.add_argument('--batch-sizes', default='1,8,64', type=str,
+                    help='comma separated list of batch sizes (default: 1,8,64)')
+parser.add_argument('--modes', default='grouped,auto,experts', type=str,
+                    help='comma separated list of CondConv2d modes (default: grouped,auto,experts)')
+parser.add_argument('--cache-size', default=16, type=int,
+                    metavar='N', help='mixed kernel cache size for the B=1 cached run, 0 to skip (default: 16)')
+parser.add_argument('--routing-eps', default=0., type=float,
+                    help='also run auto mode w/ experts below this max routing weight skipped, 0 to skip (default: 0)')
+parser.add_argument('--img-size', default=0, type=int,
+                    metavar='N', help='Input image dimension, 0 for 224 (240 for b1) (default: 0)')
+parser.add_argument('--warmup', default=3, type=int,
+                    metavar='N', help='number of warmup iterations (default: 3)')
+parser.add_argument('--iters', default=10, type=int,
+                    metavar='N', help='number of timed iterations (default: 10)')
+parser.add_argument('--num-threads', default=0, type=int,
+                    metavar='N', help='number of torch threads, 0 to leave as is (default: 0)')
+parser.add_argument('--num-gpu', type=int, default=0,
+                    help='Number of GPUS to use (default: 0, CPU)')
+
+
+def time_model(model, x, args):
+    sync = torch.cuda.synchronize if x.is_cuda else lambda: None
+    with torch.no_grad():
+        for _ in range(args.warmup):
+            model(x)
+        sync()
+        start = time.time()
+        for _ in range(args.iters):
+            model(x)
+        sync()
+    return (time.time() - start) / args.iters
+
+
+def main():
+    args = parser.parse_args()
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',')]
+    modes = args.modes.split(',')
+
+    for name in args.models.split(','):
+        model = geffnet.create_model(name)
+        model.eval()
+        img_size = args.img_size or (240 if '_b1' in name else 224)
+        for batch_size in batch_sizes:
+            x = torch.randn(batch_size, 3, img_size, img_size)
+            if args.num_gpu > 0:
+                model = model.cuda()
+                x = x.cuda()
+            geffnet.set_cond_conv_mode(model, 'grouped')
+            with torch.no_grad():
+                ref = model(x)
+            runs = [(mode, mode, 0, 0.) for mode in modes]
+            if batch_size == 1 and args.cache_size and args.num_gpu == 0:
+                runs.append(('cached', 'auto', args.cache_size, 0.))
+            if args.routing_eps > 0:
+                runs.append(('sparse', 'auto', 0, args.routing_eps))
+            for label, mode, cache_size, routing_eps in runs:
+                geffnet.set_cond_conv_mode(model, mode, cache_size=cache_size, routing_eps=routing_eps)
+                with torch.no_grad():
+                    max_diff = (model(x) - ref).abs().max().item()
+                elapsed = time_model(model, x, args)
+                print('Model {:<22} batch {:<4} mode {:<8} {:10.3f} ms  {:9.2f} img/s  max diff: {:.2e}'.format(
+                    name, batch_size, label, 1000 * elapsed, batch_size / elapsed, max_diff))
+
+
+if __name__ == '__main__':
+    main()
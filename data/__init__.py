@@ -1,3 +1,4 @@
 from .dataset import Dataset
+from .shard_dataset import ShardDataset, ShardIterableDataset, write_shards, is_shard_dataset
 from .transforms import *
 from .loader import create_loader
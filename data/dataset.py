@@ -5,20 +5,25 @@ from __future__ import print_function
 import torch.utils.data as data
 
 import os
-import re
+from collections.abc import Sequence
+import numpy as np
 import torch
 from PIL import Image
 
+from .file_index import load_file_index, natural_key, pack_strings, unpack_strings
+from .transforms import decodes_image
 
-IMG_EXTENSIONS = ['.png', '.jpg', '.jpeg']
 
+IMG_EXTENSIONS = ['.png', '.jpg', '.jpeg']
 
-def natural_key(string_):
-    """See http://www.codinghorror.com/blog/archives/001018.html"""
-    return [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', string_.lower())]
 
+def find_images_and_targets(folder, types=IMG_EXTENSIONS, class_to_idx=None, leaf_name_only=True, sort=True,
+                            cache_index=False, index_workers=16):
+    """ Find images and their class targets in a folder of class sub-folders
 
-def find_images_and_targets(folder, types=IMG_EXTENSIONS, class_to_idx=None, leaf_name_only=True, sort=True):
+    With `cache_index`, the folder walk is loaded from (and saved to) a persistent file index next to the
+    dataset, see file_index.py. The index is already in natural sort order so no sort is needed.
+    """
     if class_to_idx is None:
         class_to_idx = dict()
         build_class_idx = True
@@ -26,16 +31,29 @@ def find_images_and_targets(folder, types=IMG_EXTENSIONS, class_to_idx=None, lea
         build_class_idx = False
     labels = []
     filenames = []
-    for root, subdirs, files in os.walk(folder, topdown=False):
-        rel_path = os.path.relpath(root, folder) if (root != folder) else ''
-        label = os.path.basename(rel_path) if leaf_name_only else rel_path.replace(os.path.sep, '_')
-        if build_class_idx and not subdirs:
-            class_to_idx[label] = None
-        for f in files:
-            base, ext = os.path.splitext(f)
-            if ext.lower() in types:
-                filenames.append(os.path.join(root, f))
-                labels.append(label)
+    if cache_index:
+        index = load_file_index(folder, types, num_workers=index_workers)
+        dir_labels = []
+        for rel_path, is_leaf in zip(index.dirs, index.dir_is_leaf.tolist()):
+            label = os.path.basename(rel_path) if leaf_name_only else rel_path.replace(os.path.sep, '_')
+            if build_class_idx and is_leaf:
+                class_to_idx[label] = None
+            dir_labels.append(label)
+        for di, f in zip(index.file_dirs.tolist(), index.file_names):
+            filenames.append(os.path.join(folder, index.dirs[di], f))
+            labels.append(dir_labels[di])
+        sort = False
+    else:
+        for root, subdirs, files in os.walk(folder, topdown=False):
+            rel_path = os.path.relpath(root, folder) if (root != folder) else ''
+            label = os.path.basename(rel_path) if leaf_name_only else rel_path.replace(os.path.sep, '_')
+            if build_class_idx and not subdirs:
+                class_to_idx[label] = None
+            for f in files:
+                base, ext = os.path.splitext(f)
+                if ext.lower() in types:
+                    filenames.append(os.path.join(root, f))
+                    labels.append(label)
     if build_class_idx:
         classes = sorted(class_to_idx.keys(), key=natural_key)
         for idx, c in enumerate(classes):
@@ -43,49 +61,92 @@ def find_images_and_targets(folder, types=IMG_EXTENSIONS, class_to_idx=None, lea
     images_and_targets = zip(filenames, [class_to_idx[l] for l in labels])
     if sort:
         images_and_targets = sorted(images_and_targets, key=lambda k: natural_key(k[0]))
+    else:
+        images_and_targets = list(images_and_targets)
     if build_class_idx:
         return images_and_targets, classes, class_to_idx
     else:
         return images_and_targets
 
 
+class _SampleList(Sequence):
+    """ Read-only (path, target) sequence view of a Dataset's sample arrays, items are decoded on access """
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def __len__(self):
+        return len(self._dataset)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('sample index out of range')
+        target = int(self._dataset._targets[index])
+        return self._dataset._path(index), None if target < 0 else target
+
+
 class Dataset(data.Dataset):
+    """ Image folder dataset
+
+    The samples are kept in a few numpy arrays (utf-8 path bytes + offsets, int32 targets) instead of a list of
+    (path, target) tuples. DataLoader workers forked from the main process would otherwise each touch (refcount)
+    and so copy every tuple and string of the table, the array pages stay shared.
+    """
 
     def __init__(
             self,
             root,
             transform=None,
-            load_bytes=False):
+            load_bytes=False,
+            cache_index=False):
 
-        imgs, _, _ = find_images_and_targets(root)
+        imgs, _, _ = find_images_and_targets(root, cache_index=cache_index)
         if len(imgs) == 0:
             raise(RuntimeError("Found 0 images in subfolders of: " + root + "\n"
                                "Supported image extensions are: " + ",".join(IMG_EXTENSIONS)))
         self.root = root
-        self.imgs = imgs
+        self._path_buf, self._path_offsets = pack_strings([x[0] for x in imgs])
+        # -1 for samples w/o a target
+        self._targets = np.array([-1 if x[1] is None else x[1] for x in imgs], dtype=np.int32)
         self.transform = transform
         self.load_bytes = load_bytes
 
+    def _path(self, index):
+        start, end = self._path_offsets[index], self._path_offsets[index + 1]
+        return self._path_buf[start:end].tobytes().decode('utf-8', 'surrogateescape')
+
+    @property
+    def imgs(self):
+        """ (path, target) tuples of all samples, a sequence view that decodes only the accessed items """
+        return _SampleList(self)
+
     def __getitem__(self, index):
-        path, target = self.imgs[index]
-        img = open(path, 'rb').read() if self.load_bytes else Image.open(path).convert('RGB')
+        path = self._path(index)
+        target = int(self._targets[index])
+        if self.load_bytes:
+            img = open(path, 'rb').read()
+        else:
+            img = Image.open(path)
+            if not decodes_image(self.transform):
+                img = img.convert('RGB')
         if self.transform is not None:
             img = self.transform(img)
-        if target is None:
+        if target < 0:
             target = torch.zeros(1).long()
         return img, target
 
     def __len__(self):
-        return len(self.imgs)
+        return len(self._targets)
 
     def filenames(self, indices=[], basename=False):
         if indices:
-            if basename:
-                return [os.path.basename(self.imgs[i][0]) for i in indices]
-            else:
-                return [self.imgs[i][0] for i in indices]
+            names = [self._path(i) for i in indices]
         else:
-            if basename:
-                return [os.path.basename(x[0]) for x in self.imgs]
-            else:
-                return [x[0] for x in self.imgs]
+            names = unpack_strings(self._path_buf, self._path_offsets)
+        if basename:
+            return [os.path.basename(x) for x in names]
+        return names
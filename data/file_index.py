@@ -0,0 +1,226 @@
+""" Persistent image folder index
+
+Walking a large image folder (and natural sorting the paths) on a network file system can take minutes. The
+walk result is saved as a compact index next to the dataset (`.geffnet_index.npz`), flat numpy arrays of the
+directory tree and image files (names, sizes, mtimes), in natural sort order. Later runs load the index and
+only re-scan the directories whose mtime changed, unchanged directories cost a single stat. The cold build
+and the refresh stats are spread over a thread pool.
+
+NOTE a directory mtime only changes when entries are added, removed or renamed. Images overwritten in place
+keep their old size / mtime in the index until their directory is re-scanned.
+"""
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+
+def natural_key(string_):
+    """See http://www.codinghorror.com/blog/archives/001018.html"""
+    return [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', string_.lower())]
+
+
+INDEX_FILENAME = '.geffnet_index.npz'
+_INDEX_VERSION = 1
+
+
+def pack_strings(strings):
+    encoded = [s.encode('utf-8', 'surrogateescape') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(buffer, offsets):
+    data = buffer.tobytes()
+    offsets = offsets.tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8', 'surrogateescape') for i in range(len(offsets) - 1)]
+
+
+def _scan_dir(path, types):
+    mtime = os.stat(path).st_mtime_ns
+    subdirs = []
+    is_leaf = True
+    files = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                is_leaf = False
+                if not entry.is_symlink():
+                    # like os.walk, symlinked dirs make a dir non-leaf but are not followed
+                    subdirs.append(entry.name)
+            elif os.path.splitext(entry.name)[1].lower() in types:
+                st = entry.stat()
+                files.append((entry.name, st.st_size, st.st_mtime_ns))
+    return dict(mtime=mtime, subdirs=subdirs, is_leaf=is_leaf, files=files)
+
+
+def _refresh_dir(path, types, entry):
+    if entry is not None and os.stat(path).st_mtime_ns == entry['mtime']:
+        return entry, False, False
+    new_entry = _scan_dir(path, types)
+    # saving the index touches the mtime of its dir, a re-scan w/ the same contents is not a change
+    changed = entry is None or new_entry['is_leaf'] != entry['is_leaf'] or \
+        sorted(new_entry['subdirs']) != sorted(entry['subdirs']) or sorted(new_entry['files']) != sorted(entry['files'])
+    return new_entry, True, changed
+
+
+class FileIndex:
+    """ Directory tree + image files of a folder, as flat arrays
+
+    `dirs` are relative paths ('' for the root), each file references its directory by index. Files are kept
+    in natural sort order of their relative path.
+    """
+
+    def __init__(self, types, dirs, dir_mtimes, dir_is_leaf, file_dirs, file_names, file_sizes, file_mtimes):
+        self.types = sorted(types)
+        self.dirs = dirs
+        self.dir_mtimes = dir_mtimes
+        self.dir_is_leaf = dir_is_leaf
+        self.file_dirs = file_dirs
+        self.file_names = file_names
+        self.file_sizes = file_sizes
+        self.file_mtimes = file_mtimes
+
+    def __len__(self):
+        return len(self.file_dirs)
+
+    @classmethod
+    def from_tree(cls, tree, types):
+        """ Build from a dict of relative dir path -> scan entry (see _scan_dir) """
+        dirs = sorted(tree.keys(), key=natural_key)
+        dir_idx = {d: i for i, d in enumerate(dirs)}
+        files = []
+        for d in dirs:
+            for name, size, mtime in tree[d]['files']:
+                files.append((os.path.join(d, name), dir_idx[d], name, size, mtime))
+        files.sort(key=lambda f: natural_key(f[0]))
+        return cls(
+            types,
+            dirs,
+            np.array([tree[d]['mtime'] for d in dirs], dtype=np.int64),
+            np.array([tree[d]['is_leaf'] for d in dirs], dtype=np.bool_),
+            np.array([f[1] for f in files], dtype=np.int32),
+            [f[2] for f in files],
+            np.array([f[3] for f in files], dtype=np.int64),
+            np.array([f[4] for f in files], dtype=np.int64))
+
+    def to_tree(self):
+        tree = {d: dict(mtime=int(m), subdirs=[], is_leaf=bool(l), files=[])
+                for d, m, l in zip(self.dirs, self.dir_mtimes, self.dir_is_leaf)}
+        for d in self.dirs:
+            if d:
+                tree[os.path.dirname(d)]['subdirs'].append(os.path.basename(d))
+        for di, name, size, mtime in zip(
+                self.file_dirs.tolist(), self.file_names, self.file_sizes.tolist(), self.file_mtimes.tolist()):
+            tree[self.dirs[di]]['files'].append((name, size, mtime))
+        return tree
+
+    def relpaths(self):
+        dirs = self.dirs
+        return [os.path.join(dirs[di], name) for di, name in zip(self.file_dirs.tolist(), self.file_names)]
+
+    def save(self, path):
+        dir_buf, dir_offsets = pack_strings(self.dirs)
+        name_buf, name_offsets = pack_strings(self.file_names)
+        meta = json.dumps(dict(version=_INDEX_VERSION, types=self.types))
+        tmp_path = path + '.tmp%d.npz' % os.getpid()
+        np.savez(
+            tmp_path, meta=np.array(meta), dir_buf=dir_buf, dir_offsets=dir_offsets, dir_mtimes=self.dir_mtimes,
+            dir_is_leaf=self.dir_is_leaf, file_dirs=self.file_dirs, name_buf=name_buf, name_offsets=name_offsets,
+            file_sizes=self.file_sizes, file_mtimes=self.file_mtimes)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            meta = json.loads(str(f['meta']))
+            if meta.get('version') != _INDEX_VERSION:
+                return None
+            return cls(
+                meta['types'],
+                unpack_strings(f['dir_buf'], f['dir_offsets']),
+                f['dir_mtimes'],
+                f['dir_is_leaf'],
+                f['file_dirs'],
+                unpack_strings(f['name_buf'], f['name_offsets']),
+                f['file_sizes'],
+                f['file_mtimes'])
+
+
+def walk_folder(folder, types, num_workers=16, tree=None):
+    """ Walk `folder` w/ a pool of `num_workers` threads
+
+    If a previous `tree` is given, directories with an unchanged mtime are not re-scanned.
+    Returns:
+        (dict of relative dir path -> scan entry, number of dirs scanned, number of dirs changed)
+    """
+    new_tree = {}
+    num_scanned = 0
+    num_changed = 0
+    with ThreadPoolExecutor(max(1, num_workers)) as pool:
+        def _submit(rel):
+            entry = tree.get(rel) if tree else None
+            return pool.submit(_refresh_dir, os.path.join(folder, rel), types, entry)
+
+        pending = {_submit(''): ''}
+        while pending:
+            done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel = pending.pop(fut)
+                try:
+                    entry, scanned, changed = fut.result()
+                except FileNotFoundError:
+                    # removed since its parent was listed
+                    continue
+                num_scanned += int(scanned)
+                num_changed += int(changed)
+                new_tree[rel] = entry
+                for name in entry['subdirs']:
+                    sub_rel = os.path.join(rel, name)
+                    pending[_submit(sub_rel)] = sub_rel
+    return new_tree, num_scanned, num_changed
+
+
+def load_file_index(folder, types, index_path='', num_workers=16, refresh=True, verbose=False):
+    """ Load the file index of `folder`, building or refreshing (and saving) it as needed
+
+    Args:
+        folder: image folder root
+        types: image file extensions (lower case, incl the '.')
+        index_path: index file, default `<folder>/.geffnet_index.npz`
+        num_workers: threads for the directory walk
+        refresh: re-check directory mtimes of an existing index, if False it is used as is
+    Returns:
+        FileIndex
+    """
+    index_path = index_path or os.path.join(folder, INDEX_FILENAME)
+    types = sorted(t.lower() for t in types)
+    index = None
+    if os.path.isfile(index_path):
+        try:
+            index = FileIndex.load(index_path)
+        except (OSError, ValueError, KeyError):
+            index = None
+        if index is not None and index.types != types:
+            index = None
+    if index is not None and not refresh:
+        return index
+
+    old_tree = index.to_tree() if index is not None else None
+    tree, num_scanned, num_changed = walk_folder(folder, types, num_workers=num_workers, tree=old_tree)
+    if index is not None and num_changed == 0 and len(tree) == len(old_tree):
+        return index
+
+    index = FileIndex.from_tree(tree, types)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        print('Warning: could not save file index to %s (%s)' % (index_path, e), file=sys.stderr)
+    if verbose:
+        print('Indexed %d images in %d dirs (%d scanned) of %s' % (len(index), len(tree), num_scanned, folder))
+    return index
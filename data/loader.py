@@ -1,48 +1,208 @@
+import queue
+import threading
+
+import numpy as np
 import torch
 import torch.utils.data
+from functools import partial
 from .transforms import *
 
 
-def fast_collate(batch):
+def fast_collate(batch, channels_last=False):
+    """ Collate uint8 numpy images into a uint8 NCHW batch tensor
+
+    With `channels_last`, the images are expected in HWC layout and the returned NCHW tensor is a permuted
+    view of the NHWC batch, ie it's in torch.channels_last memory format without any extra copy.
+    """
     targets = torch.tensor([b[1] for b in batch], dtype=torch.int64)
-    batch_size = len(targets)
-    tensor = torch.zeros((batch_size, *batch[0][0].shape), dtype=torch.uint8)
-    for i in range(batch_size):
-        tensor[i] += torch.from_numpy(batch[i][0])
+    tensor = torch.from_numpy(np.stack([b[0] for b in batch]))
+    if channels_last:
+        tensor = tensor.permute(0, 3, 1, 2)
 
     return tensor, targets
 
 
+def list_collate(batch):
+    """ Collate variable size uint8 HWC numpy images into a list of tensors, for BatchResizeCenterCrop """
+    targets = torch.tensor([b[1] for b in batch], dtype=torch.int64)
+    return [torch.from_numpy(b[0]) for b in batch], targets
+
+
+class BufferedCollate:
+    """ fast_collate into a ring of preallocated uint8 batch buffers
+
+    Samples are stacked straight into the next free buffer with one vectorized copy, no per batch allocation
+    or zero fill. With DataLoader workers, each worker gets its own `ring_size` slots in shared memory
+    (allocated before the workers fork). A batch collated into a slot is sent back to the main process as a
+    shared memory handle instead of being copied into a new shared memory tensor. Without workers, the buffers
+    can be pinned for async host to device copies.
+
+    NOTE a buffer is overwritten `ring_size` batches (of the same worker) later. The DataLoader keeps at most
+    `prefetch_factor` batches per worker in flight, `ring_size` must cover that plus the batches the consumer
+    holds on to (incl pending non_blocking copies), at least `prefetch_factor + 2` with workers and 2 for pinned
+    buffers without workers.
+
+    Args:
+        batch_size: max batch size
+        sample_shape: uint8 sample shape, (C, H, W) or (H, W, C) w/ channels_last
+        num_workers: number of DataLoader workers (0 for collate in the main process)
+        ring_size: buffers per worker
+        pin_memory: pin the buffers (only if num_workers == 0)
+        channels_last: samples are HWC, return a channels_last NCHW view
+        prefetch_factor: DataLoader prefetch_factor (batches in flight per worker)
+    """
+
+    def __init__(self, batch_size, sample_shape, num_workers=0, ring_size=4, pin_memory=False,
+                 channels_last=False, prefetch_factor=2):
+        if num_workers > 0:
+            min_ring_size = prefetch_factor + 2
+        else:
+            min_ring_size = 2 if pin_memory else 1
+        assert ring_size >= min_ring_size, \
+            'ring_size (%d) must be >= %d, a buffer would be overwritten while its batch is in use' % (
+                ring_size, min_ring_size)
+        self.batch_size = batch_size
+        self.sample_shape = tuple(sample_shape)
+        self.ring_size = ring_size
+        self.channels_last = channels_last
+        buffers = torch.empty((max(1, num_workers) * ring_size, batch_size) + self.sample_shape, dtype=torch.uint8)
+        if num_workers > 0:
+            buffers.share_memory_()
+        elif pin_memory and torch.cuda.is_available():
+            buffers = buffers.pin_memory()
+        self.buffers = buffers
+        self._next = 0
+
+    def __call__(self, batch):
+        batch_size = len(batch)
+        if batch_size > self.batch_size or batch[0][0].shape != self.sample_shape:
+            return fast_collate(batch, channels_last=self.channels_last)
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id = worker_info.id if worker_info is not None else 0
+        tensor = self.buffers[worker_id * self.ring_size + self._next, :batch_size]
+        self._next = (self._next + 1) % self.ring_size
+        np.stack([b[0] for b in batch], out=tensor.numpy())
+        targets = torch.tensor([b[1] for b in batch], dtype=torch.int64)
+        if self.channels_last:
+            tensor = tensor.permute(0, 3, 1, 2)
+        return tensor, targets
+
+
 class PrefetchLoader:
+    """ Prefetch uint8 batches to the device and normalize them
+
+    On CUDA, the host to device copy and normalize of the next batch run on a side stream. On CPU, a background
+    thread pulls, converts and normalizes the next batch (double buffering) while the current one is in use.
+    The uint8 -> float conversion and normalization is a fused multiply-add per batch, `x * (1 / (255 * std))
+    - mean / std`, instead of a per sample ToTensor + Normalize in the workers.
+
+    Args:
+        loader: DataLoader of uint8 batches (fast_collate)
+        mean, std: normalization constants (0-1 range)
+        channels_last: output in torch.channels_last memory format
+        device: output device, default cuda if available, else cpu
+        fp16: output half precision batches
+        batch_transform: applied to each (device) input batch before normalize, ie BatchResizeCenterCrop for
+            batches of variable size images from list_collate
+    """
 
     def __init__(self,
             loader,
             mean=IMAGENET_DEFAULT_MEAN,
-            std=IMAGENET_DEFAULT_STD):
+            std=IMAGENET_DEFAULT_STD,
+            channels_last=False,
+            device=None,
+            fp16=False,
+            batch_transform=None):
         self.loader = loader
-        self.mean = torch.tensor([x * 255 for x in mean]).cuda().view(1, 3, 1, 1)
-        self.std = torch.tensor([x * 255 for x in std]).cuda().view(1, 3, 1, 1)
+        self.batch_transform = batch_transform
+        self.channels_last = channels_last
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = torch.device(device)
+        self.dtype = torch.float16 if fp16 else torch.float32
+        mean = torch.tensor([x * 255 for x in mean], dtype=torch.float64).view(1, 3, 1, 1)
+        std = torch.tensor([x * 255 for x in std], dtype=torch.float64).view(1, 3, 1, 1)
+        self.scale = (1. / std).to(device=self.device, dtype=self.dtype)
+        self.bias = (-mean / std).to(device=self.device, dtype=self.dtype)
+
+    def _to_device(self, input, non_blocking=False):
+        if isinstance(input, (list, tuple)):
+            return [x.to(self.device, non_blocking=non_blocking) for x in input]
+        return input.to(self.device, non_blocking=non_blocking)
+
+    def _normalize(self, input):
+        if self.batch_transform is not None:
+            input = self.batch_transform(input)
+        if self.channels_last:
+            # no-op for channels_last collated batches
+            input = input.contiguous(memory_format=torch.channels_last)
+        # uint8 * float scale promotes to float in the multiply, no separate conversion pass
+        return torch.mul(input, self.scale).add_(self.bias)
 
     def __iter__(self):
-        stream = torch.cuda.Stream()
+        if self.device.type == 'cuda':
+            return self._iter_cuda()
+        return self._iter_thread()
+
+    def _iter_cuda(self):
+        stream = torch.cuda.Stream(device=self.device)
         first = True
 
         for next_input, next_target in self.loader:
             with torch.cuda.stream(stream):
-                next_input = next_input.cuda(non_blocking=True)
-                next_target = next_target.cuda(non_blocking=True)
-                next_input = next_input.float().sub_(self.mean).div_(self.std)
+                next_input = self._to_device(next_input, non_blocking=True)
+                next_target = next_target.to(self.device, non_blocking=True)
+                next_input = self._normalize(next_input)
 
             if not first:
                 yield input, target
             else:
                 first = False
 
-            torch.cuda.current_stream().wait_stream(stream)
+            torch.cuda.current_stream(self.device).wait_stream(stream)
             input = next_input
             target = next_target
 
-        yield input, target
+        if not first:
+            yield input, target
+
+    def _iter_thread(self):
+        batches = queue.Queue(maxsize=1)
+        done = object()
+        stop = threading.Event()
+
+        def _put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def _worker():
+            try:
+                for input, target in self.loader:
+                    if not _put((self._normalize(self._to_device(input)), target.to(self.device))):
+                        return
+                _put(done)
+            except Exception as e:
+                _put(e)
+
+        thread = threading.Thread(target=_worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
 
     def __len__(self):
         return len(self.loader)
@@ -63,17 +223,31 @@ def create_loader(
         std=IMAGENET_DEFAULT_STD,
         num_workers=1,
         crop_pct=None,
-        tensorflow_preprocessing=False
+        tensorflow_preprocessing=False,
+        channels_last=False,
+        jpeg_draft=False,
+        collate_buffers=0,
+        pin_memory=False,
+        device=None,
+        fp16=False,
+        tensor_resize=False,
+        sampler=None,
 ):
     if isinstance(input_size, tuple):
         img_size = input_size[-2:]
     else:
         img_size = input_size
+    assert not tensor_resize or (use_prefetcher and not tensorflow_preprocessing), \
+        'Tensor resize requires the prefetcher and the default (non TF) preprocessing'
 
     if tensorflow_preprocessing and use_prefetcher:
-        from data.tf_preprocessing import TfPreprocessTransform
+        if is_training:
+            # only the eval preprocessing has a TensorFlow free implementation
+            from data.tf_preprocessing import TfPreprocessTransform
+        else:
+            from data.tf_eval_preprocessing import TfEvalPreprocessTransform as TfPreprocessTransform
         transform = TfPreprocessTransform(
-            is_training=is_training, size=img_size, interpolation=interpolation)
+            is_training=is_training, size=img_size, interpolation=interpolation, channels_last=channels_last)
     else:
         transform = transforms_imagenet_eval(
             img_size,
@@ -81,21 +255,51 @@ def create_loader(
             use_prefetcher=use_prefetcher,
             mean=mean,
             std=std,
-            crop_pct=crop_pct)
+            crop_pct=crop_pct,
+            channels_last=channels_last,
+            jpeg_draft=jpeg_draft,
+            tensor_resize=tensor_resize)
 
     dataset.transform = transform
 
+    batch_transform = None
+    if tensor_resize:
+        # workers only decode, resize + crop is batched on the prefetcher's device
+        batch_transform = BatchResizeCenterCrop(
+            img_size, crop_pct=crop_pct, interpolation=interpolation, channels_last=channels_last)
+        collate_fn = list_collate
+    elif use_prefetcher and collate_buffers:
+        # collate into a ring of `collate_buffers` preallocated (shared or pinned) buffers per worker
+        img_size = img_size if isinstance(img_size, tuple) else (img_size, img_size)
+        collate_fn = BufferedCollate(
+            batch_size,
+            img_size + (3,) if channels_last else (3,) + img_size,
+            num_workers=num_workers,
+            ring_size=collate_buffers,
+            pin_memory=pin_memory,
+            channels_last=channels_last)
+    elif use_prefetcher:
+        collate_fn = partial(fast_collate, channels_last=channels_last)
+    else:
+        collate_fn = torch.utils.data.dataloader.default_collate
+
     loader = torch.utils.data.DataLoader(
         dataset,
         batch_size=batch_size,
         shuffle=False,
+        sampler=sampler,
         num_workers=num_workers,
-        collate_fn=fast_collate if use_prefetcher else torch.utils.data.dataloader.default_collate,
+        collate_fn=collate_fn,
+        pin_memory=pin_memory,
     )
     if use_prefetcher:
         loader = PrefetchLoader(
             loader,
             mean=mean,
-            std=std)
+            std=std,
+            channels_last=channels_last,
+            device=device,
+            fp16=fp16,
+            batch_transform=batch_transform)
 
     return loader
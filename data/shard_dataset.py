@@ -0,0 +1,206 @@
+""" Packed shard dataset
+
+An image folder converted to a few large shard files of the raw encoded image bytes back to back, plus one
+`index.npz` (shard id, byte offset, length and target per sample, the packed relative file names and the
+class names). Reading goes through a memory mapping of each shard, so there is no per-image open / stat, which
+dominates over decode and compute on network storage with millions of small files.
+
+ShardDataset is map-style (random access, drop-in for Dataset w/ create_loader). ShardIterableDataset streams
+the shards sequentially, each DataLoader worker reading its own subset of the shards start to end.
+"""
+import io
+import json
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torch.utils.data as data
+from PIL import Image
+
+from .dataset import find_images_and_targets
+from .file_index import pack_strings, unpack_strings
+from .transforms import decodes_image
+
+INDEX_FILENAME = 'index.npz'
+_SHARD_FILENAME = 'shard-%05d.bin'
+
+
+def is_shard_dataset(path):
+    return os.path.isfile(os.path.join(path, INDEX_FILENAME))
+
+
+def write_shards(folder, output_dir, shard_size=1 << 30, num_workers=16, cache_index=False, verbose=True):
+    """ Pack the images of an image folder (as read by find_images_and_targets) into shards
+
+    Args:
+        folder: image folder root
+        output_dir: output directory for the shards and index (created if necessary)
+        shard_size: a new shard is started once a shard reaches this many bytes
+        num_workers: threads reading the image files ahead of the (sequential) shard writes
+        cache_index: use the persistent file index for the folder walk, see file_index.py
+    Returns:
+        number of shards written
+    """
+    imgs, classes, _ = find_images_and_targets(folder, cache_index=cache_index)
+    assert len(imgs), 'No images found in %s' % folder
+    os.makedirs(output_dir, exist_ok=True)
+    num_samples = len(imgs)
+    shard_ids = np.zeros(num_samples, dtype=np.int32)
+    offsets = np.zeros(num_samples, dtype=np.int64)
+    lengths = np.zeros(num_samples, dtype=np.int64)
+    targets = np.array([-1 if t is None else t for _, t in imgs], dtype=np.int32)
+
+    def _read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    shard_idx = 0
+    shard_file = open(os.path.join(output_dir, _SHARD_FILENAME % shard_idx), 'wb')
+    offset = 0
+    num_workers = max(1, num_workers)
+    with ThreadPoolExecutor(num_workers) as pool:
+        # bounded read-ahead, keeps the sample order w/o holding more than a few reads per thread in memory
+        pending = deque()
+        next_read = 0
+        for i in range(num_samples):
+            while next_read < num_samples and len(pending) < 2 * num_workers:
+                pending.append(pool.submit(_read, imgs[next_read][0]))
+                next_read += 1
+            img_bytes = pending.popleft().result()
+            if offset >= shard_size:
+                shard_file.close()
+                shard_idx += 1
+                shard_file = open(os.path.join(output_dir, _SHARD_FILENAME % shard_idx), 'wb')
+                offset = 0
+            shard_file.write(img_bytes)
+            shard_ids[i] = shard_idx
+            offsets[i] = offset
+            lengths[i] = len(img_bytes)
+            offset += len(img_bytes)
+            if verbose and i % 10000 == 0:
+                print('Packed {}/{} images, {} shards'.format(i, num_samples, shard_idx + 1))
+    shard_file.close()
+
+    name_buf, name_offsets = pack_strings([os.path.relpath(p, folder) for p, _ in imgs])
+    meta = json.dumps(dict(num_shards=shard_idx + 1, classes=classes))
+    np.savez(
+        os.path.join(output_dir, INDEX_FILENAME), meta=np.array(meta), shard_ids=shard_ids, offsets=offsets,
+        lengths=lengths, targets=targets, name_buf=name_buf, name_offsets=name_offsets)
+    if verbose:
+        print('Packed {} images into {} shards in {}'.format(num_samples, shard_idx + 1, output_dir))
+    return shard_idx + 1
+
+
+class _ShardReader:
+    """ Shard index + lazily opened memory mappings of the shards (opened per process, after any fork) """
+
+    def __init__(self, root, load_bytes=False):
+        with np.load(os.path.join(root, INDEX_FILENAME)) as f:
+            meta = json.loads(str(f['meta']))
+            self.shard_ids = f['shard_ids']
+            self.offsets = f['offsets']
+            self.lengths = f['lengths']
+            self.targets = f['targets']
+            self._name_buf = f['name_buf']
+            self._name_offsets = f['name_offsets']
+        self.root = root
+        self.num_shards = meta['num_shards']
+        self.classes = meta['classes']
+        self.load_bytes = load_bytes
+        self._maps = {}
+        self._pid = None
+
+    def shard(self, shard_idx):
+        if self._pid != os.getpid():
+            # don't reuse mappings inherited from a parent process
+            self._maps = {}
+            self._pid = os.getpid()
+        m = self._maps.get(shard_idx, None)
+        if m is None:
+            with open(os.path.join(self.root, _SHARD_FILENAME % shard_idx), 'rb') as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard_idx] = m
+        return m
+
+    def sample(self, index, transform=None):
+        offset = int(self.offsets[index])
+        img = self.shard(int(self.shard_ids[index]))[offset:offset + int(self.lengths[index])]
+        if not self.load_bytes:
+            img = Image.open(io.BytesIO(img))
+            if not decodes_image(transform):
+                img = img.convert('RGB')
+        if transform is not None:
+            img = transform(img)
+        target = int(self.targets[index])
+        if target < 0:
+            target = torch.zeros(1).long()
+        return img, target
+
+    def filenames(self, indices=[], basename=False):
+        names = unpack_strings(self._name_buf, self._name_offsets)
+        if indices:
+            names = [names[i] for i in indices]
+        if basename:
+            return [os.path.basename(x) for x in names]
+        return names
+
+
+class ShardDataset(data.Dataset):
+    """ Map-style dataset over packed shards (see write_shards) """
+
+    def __init__(
+            self,
+            root,
+            transform=None,
+            load_bytes=False):
+        self.root = root
+        self.reader = _ShardReader(root, load_bytes=load_bytes)
+        self.transform = transform
+        self.load_bytes = load_bytes
+
+    def __getitem__(self, index):
+        return self.reader.sample(index, self.transform)
+
+    def __len__(self):
+        return len(self.reader.targets)
+
+    def filenames(self, indices=[], basename=False):
+        return self.reader.filenames(indices, basename=basename)
+
+
+class ShardIterableDataset(data.IterableDataset):
+    """ Iterable dataset streaming packed shards (see write_shards) sequentially
+
+    The shards are split round-robin across the DataLoader workers, each worker reads its shards start to end.
+    NOTE the sample order differs from the map-style order when num_workers > 1, samples are yielded w/ their
+    target as usual, use `num_workers <= num_shards` to keep all workers busy.
+    """
+
+    def __init__(
+            self,
+            root,
+            transform=None,
+            load_bytes=False):
+        self.root = root
+        self.reader = _ShardReader(root, load_bytes=load_bytes)
+        self.transform = transform
+        self.load_bytes = load_bytes
+
+    def __iter__(self):
+        worker_info = data.get_worker_info()
+        if worker_info is None:
+            shards = range(self.reader.num_shards)
+        else:
+            shards = range(worker_info.id, self.reader.num_shards, worker_info.num_workers)
+        for shard_idx in shards:
+            m = self.reader.shard(shard_idx)
+            if hasattr(m, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                m.madvise(mmap.MADV_SEQUENTIAL)
+            for index in np.flatnonzero(self.reader.shard_ids == shard_idx).tolist():
+                yield self.reader.sample(index, self.transform)
+
+    def __len__(self):
+        return len(self.reader.targets)
@@ -0,0 +1,85 @@
+""" TensorFlow free reimplementation of the TF (MnasNet / EfficientNet) eval preprocessing
+
+Reproduces `preprocess_for_eval` of tf_preprocessing.py w/ NumPy + PIL, without importing TensorFlow (and a
+tf.Session) in every DataLoader worker:
+ * center crop of `image_size / (image_size + CROP_PADDING)` of the shorter side, w/ the same float32
+   crop size and offset rounding as `_decode_and_center_crop`
+ * resize to (image_size, image_size) w/ the legacy (TF 1.x `tf.image.resize`, align_corners=False,
+   half_pixel_centers=False) bilinear or bicubic kernels, no antialiasing
+ * round + clip to uint8 as TfPreprocessTransform
+
+The outputs are NOT expected to be bit exact with TF. PIL has no region decode, the crop happens right after a
+full decode, and both use libjpeg but with different IDCTs: TF's `decode_and_crop_jpeg` (dct_method='') uses
+JDCT_IFAST, PIL the accurate JDCT_ISLOW, so the decoded pixels already differ before the resize. Measure the pixel
+and top-1 deltas vs TensorFlow with `preprocess_check.py --tf-preprocessing --top1` before relying on this for the
+tf_* weights.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = 224
+CROP_PADDING = 32
+
+
+def _resize_weights(in_size, out_size, interpolation):
+    """ (out_size, in_size) interpolation matrix of the legacy TF resize kernels """
+    scale = np.float32(in_size / out_size)
+    in_pos = np.arange(out_size, dtype=np.float32) * scale
+    in_idx = np.floor(in_pos).astype(np.int64)
+    delta = in_pos - in_idx.astype(np.float32)
+    rows = np.arange(out_size)
+    weights = np.zeros((out_size, in_size), dtype=np.float32)
+    if interpolation == 'bicubic':
+        # Keys cubic kernel w/ A = -0.75 and edge clamped indices, as TF's legacy resize_bicubic, which also
+        # looks the coefficients up from a table, ie w/ delta rounded to 1/1024
+        a = np.float32(-0.75)
+        delta = np.rint(delta * 1024).astype(np.float32) / np.float32(1024)
+        dist = np.stack([delta + 1, delta, 1 - delta, 2 - delta])
+        near = ((a + 2) * dist - (a + 3)) * dist * dist + 1
+        far = ((a * dist - 5 * a) * dist + 8 * a) * dist - 4 * a
+        coeffs = np.where(dist <= 1, near, far)
+        for k in range(4):
+            np.add.at(weights, (rows, np.clip(in_idx + k - 1, 0, in_size - 1)), coeffs[k])
+    else:
+        np.add.at(weights, (rows, np.clip(in_idx, 0, in_size - 1)), 1 - delta)
+        np.add.at(weights, (rows, np.clip(in_idx + 1, 0, in_size - 1)), delta)
+    return weights
+
+
+def center_crop_window(height, width, image_size, crop_padding=CROP_PADDING):
+    """ (offset_height, offset_width, crop_size) of TF's padded center crop """
+    crop_size = int(np.float32(image_size / (image_size + crop_padding)) * np.float32(min(height, width)))
+    offset_height = ((height - crop_size) + 1) // 2
+    offset_width = ((width - crop_size) + 1) // 2
+    return offset_height, offset_width, crop_size
+
+
+def preprocess_for_eval(image_bytes, image_size=IMAGE_SIZE, interpolation='bicubic'):
+    """ Decode, padded center crop and resize encoded image bytes to a float32 HWC array in the 0-255 range """
+    img = Image.open(io.BytesIO(image_bytes))
+    offset_height, offset_width, crop_size = center_crop_window(img.height, img.width, image_size)
+    img = img.convert('RGB').crop((offset_width, offset_height, offset_width + crop_size, offset_height + crop_size))
+    x = np.asarray(img, dtype=np.float32)
+    weights = _resize_weights(crop_size, image_size, interpolation)
+    # separable resize, rows then columns
+    x = np.einsum('oh,hwc->owc', weights, x)
+    return np.einsum('pw,owc->opc', weights, x)
+
+
+class TfEvalPreprocessTransform:
+    """ Drop-in, TensorFlow free, eval only replacement for TfPreprocessTransform """
+
+    def __init__(self, is_training=False, size=224, interpolation='bicubic', channels_last=False):
+        assert not is_training, 'Only the eval preprocessing is implemented without TensorFlow'
+        self.channels_last = channels_last
+        self.size = size[0] if isinstance(size, tuple) else size
+        self.interpolation = interpolation
+
+    def __call__(self, image_bytes):
+        img = preprocess_for_eval(image_bytes, self.size, self.interpolation)
+        img = img.round().clip(0, 255).astype(np.uint8)
+        if not self.channels_last:
+            img = np.rollaxis(img, 2)  # HWC to CHW
+        return img
@@ -198,8 +198,9 @@ def preprocess_image(image_bytes,
 
 class TfPreprocessTransform:
 
-    def __init__(self, is_training=False, size=224, interpolation='bicubic'):
+    def __init__(self, is_training=False, size=224, interpolation='bicubic', channels_last=False):
         self.is_training = is_training
+        self.channels_last = channels_last
         self.size = size[0] if isinstance(size, tuple) else size
         self.interpolation = interpolation
         self._image_bytes = None
@@ -223,5 +224,6 @@ class TfPreprocessTransform:
         img = img.round().clip(0, 255).astype(np.uint8)
         if img.ndim < 3:
             img = np.expand_dims(img, axis=-1)
-        img = np.rollaxis(img, 2)  # HWC to CHW
+        if not self.channels_last:
+            img = np.rollaxis(img, 2)  # HWC to CHW
         return img
@@ -100,11 +100,15 @@ def get_std_by_model(model_name):
 
 class ToNumpy:
 
+    def __init__(self, channels_last=False):
+        self.channels_last = channels_last
+
     def __call__(self, pil_img):
         np_img = np.array(pil_img, dtype=np.uint8)
         if np_img.ndim < 3:
             np_img = np.expand_dims(np_img, axis=-1)
-        np_img = np.rollaxis(np_img, 2)  # HWC to CHW
+        if not self.channels_last:
+            np_img = np.rollaxis(np_img, 2)  # HWC to CHW
         return np_img
 
 
@@ -121,6 +125,40 @@ class ToTensor:
         return torch.from_numpy(np_img).to(dtype=self.dtype)
 
 
+class DraftDecode:
+    """ Decode a lazily opened PIL image to RGB, w/ JPEG DCT scaling when the image is much larger than needed
+
+    PIL's `draft()` configures the JPEG decoder to output at 1/2, 1/4 or 1/8 scale, the smallest of those that
+    still covers `size` is used, so the following Resize only ever downsamples. Most of the full resolution
+    decode work is skipped for large source images. Non JPEG images are decoded as usual.
+
+    Args:
+        size: int shortest edge (aspect preserving Resize) or (H, W) output size the image will be resized to
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __call__(self, img):
+        if img.format == 'JPEG':
+            w, h = img.size
+            if isinstance(self.size, (tuple, list)):
+                req_size = (self.size[1], self.size[0])
+            else:
+                scale = self.size / min(w, h)
+                req_size = (int(math.ceil(w * scale)), int(math.ceil(h * scale)))
+            if req_size[0] < w and req_size[1] < h:
+                img.draft('RGB', req_size)
+        return img.convert('RGB')
+
+
+def decodes_image(transform):
+    """ True if `transform` does its own image decode (expects a lazily opened, not yet converted, PIL image)
+    """
+    return isinstance(transform, transforms.Compose) and bool(transform.transforms) and \
+        isinstance(transform.transforms[0], DraftDecode)
+
+
 def _pil_interp(method):
     if method == 'bicubic':
         return Image.BICUBIC
@@ -133,32 +171,93 @@ def _pil_interp(method):
         return Image.BILINEAR
 
 
+def _eval_scale_size(img_size, crop_pct):
+    if isinstance(img_size, tuple):
+        assert len(img_size) == 2
+        if img_size[-1] == img_size[-2]:
+            # fall-back to older behaviour so Resize scales to shortest edge if target is square
+            return int(math.floor(img_size[0] / crop_pct))
+        return tuple([int(x / crop_pct) for x in img_size])
+    return int(math.floor(img_size / crop_pct))
+
+
+class BatchResizeCenterCrop:
+    """ Resize + center crop a list of variable size uint8 HWC image tensors into a uint8 NCHW batch
+
+    A tensor approximation of the Resize + CenterCrop of transforms_imagenet_eval (same `crop_pct` scale size,
+    output size and crop offset rounding), w/ antialiased bilinear or bicubic interpolation. Images of the same
+    size are resized together as one batch. Run it in the main process or on the device, see
+    `create_loader(tensor_resize=True)`, so the loader workers only decode.
+
+    NOTE the output is not the same as PIL's. Over 60 JPEGs (PyTorch 2.14) the pixel diff (0-255) was mean 0.18
+    / max 1 for bilinear and mean 0.19 / max 5 for bicubic. The accuracy delta has not been measured, check it
+    with validate.py for a model before relying on it.
+    """
+
+    def __init__(self, img_size=224, crop_pct=None, interpolation='bilinear', channels_last=False):
+        assert interpolation in ('bilinear', 'bicubic'), \
+            'Interpolation (%s) not supported for tensor resize' % interpolation
+        crop_pct = crop_pct or DEFAULT_CROP_PCT
+        self.img_size = tuple(img_size) if isinstance(img_size, tuple) else (img_size, img_size)
+        self.scale_size = _eval_scale_size(img_size, crop_pct)
+        self.interpolation = interpolation
+        self.channels_last = channels_last
+
+    def _resize_size(self, h, w):
+        if isinstance(self.scale_size, tuple):
+            return self.scale_size
+        # shortest edge to scale_size, as torchvision Resize(int)
+        if h <= w:
+            return self.scale_size, int(self.scale_size * w / h)
+        return int(self.scale_size * h / w), self.scale_size
+
+    def __call__(self, images):
+        th, tw = self.img_size
+        output = torch.empty((len(images), 3, th, tw), dtype=torch.uint8, device=images[0].device)
+        groups = {}
+        for i, img in enumerate(images):
+            groups.setdefault(tuple(img.shape), []).append(i)
+        for (h, w, _), indices in groups.items():
+            x = torch.stack([images[i] for i in indices]).permute(0, 3, 1, 2).float()
+            rh, rw = self._resize_size(h, w)
+            assert rh >= th and rw >= tw, 'Resized image smaller than the crop'
+            if (rh, rw) != (h, w):
+                x = torch.nn.functional.interpolate(
+                    x, size=(rh, rw), mode=self.interpolation, align_corners=False, antialias=True)
+            top = int(round((rh - th) / 2.))
+            left = int(round((rw - tw) / 2.))
+            x = x[:, :, top:top + th, left:left + tw]
+            output[indices] = x.round_().clamp_(0, 255).to(torch.uint8)
+        if self.channels_last:
+            output = output.contiguous(memory_format=torch.channels_last)
+        return output
+
+
 def transforms_imagenet_eval(
         img_size=224,
         crop_pct=None,
         interpolation='bilinear',
         use_prefetcher=False,
         mean=IMAGENET_DEFAULT_MEAN,
-        std=IMAGENET_DEFAULT_STD):
+        std=IMAGENET_DEFAULT_STD,
+        channels_last=False,
+        jpeg_draft=False,
+        tensor_resize=False):
     crop_pct = crop_pct or DEFAULT_CROP_PCT
+    scale_size = _eval_scale_size(img_size, crop_pct)
 
-    if isinstance(img_size, tuple):
-        assert len(img_size) == 2
-        if img_size[-1] == img_size[-2]:
-            # fall-back to older behaviour so Resize scales to shortest edge if target is square
-            scale_size = int(math.floor(img_size[0] / crop_pct))
-        else:
-            scale_size = tuple([int(x / crop_pct) for x in img_size])
-    else:
-        scale_size = int(math.floor(img_size / crop_pct))
-
-    tfl = [
+    tfl = [DraftDecode(scale_size)] if jpeg_draft else []
+    if tensor_resize:
+        # decode only, the batch is resized and cropped by BatchResizeCenterCrop
+        assert use_prefetcher, 'Tensor resize requires the prefetcher'
+        return transforms.Compose(tfl + [ToNumpy(channels_last=True)])
+    tfl += [
         transforms.Resize(scale_size, _pil_interp(interpolation)),
         transforms.CenterCrop(img_size),
     ]
     if use_prefetcher:
         # prefetcher and collate will handle tensor conversion and norm
-        tfl += [ToNumpy()]
+        tfl += [ToNumpy(channels_last=channels_last)]
     else:
         tfl += [
             transforms.ToTensor(),
@@ -0,0 +1,84 @@
+""" BatchNorm folding check script
+
+Compares the outputs of models before and after fuse_for_inference. The BatchNorm statistics and affine params
+are randomized first (or use --pretrained), a freshly initialized BN is an identity and would fold trivially.
+The default models cover the plain conv (efficientnet_b0), 'SAME' padded Conv2dSame (tf_efficientnet_b0),
+MixedConv2d (mixnet_s, split and fused) and CondConv2d (efficientnet_cc_b0_4e) paths, plus MobileNet-V3 and an
+as_sequential() model.
+
+    python fuse_check.py --models efficientnet_b0 mixnet_m --batch-size 4
+"""
+import argparse
+import copy
+import sys
+
+import torch
+import torch.nn as nn
+
+import geffnet
+
+parser = argparse.ArgumentParser(description='BatchNorm Folding Check')
+parser.add_argument('--models', nargs='+', type=str, default=[
+    'efficientnet_b0', 'tf_efficientnet_b0', 'mixnet_s', 'efficientnet_cc_b0_4e', 'mobilenetv3_large_100'],
+                    help='models to check (default: one per conv type)')
+parser.add_argument('-b', '--batch-size', default=2, type=int,
+                    metavar='N', help='mini-batch size (default: 2)')
+parser.add_argument('--img-size', default=0, type=int,
+                    metavar='N', help='Input image dimension, 0 for the model default (default: 0)')
+parser.add_argument('--pretrained', action='store_true', default=False,
+                    help='check the pretrained weights instead of randomized BatchNorm layers')
+parser.add_argument('--tol', default=1e-4, type=float,
+                    help='max abs diff relative to the max abs output (default: 1e-4)')
+
+
+def randomize_bn(model, seed=0):
+    """ Randomize BatchNorm running stats and affine params so folding them is not a no-op """
+    gen = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for m in model.modules():
+            if isinstance(m, nn.BatchNorm2d):
+                n = m.num_features
+                m.running_mean.copy_(0.1 * torch.randn(n, generator=gen))
+                m.running_var.copy_(0.5 + torch.rand(n, generator=gen))
+                m.weight.copy_(0.5 + torch.rand(n, generator=gen))
+                m.bias.copy_(0.1 * torch.randn(n, generator=gen))
+    return model
+
+
+def check(name, model, x, tol):
+    model.eval()
+    fused = geffnet.fuse_for_inference(copy.deepcopy(model))
+    num_bn = sum(isinstance(m, nn.BatchNorm2d) for m in fused.modules())
+    with torch.no_grad():
+        ref = model(x)
+        out = fused(x)
+    rel_diff = (ref - out).abs().max().item() / ref.abs().max().item()
+    ok = rel_diff <= tol and num_bn == 0
+    print('{:<40} max rel diff: {:.2e}  BatchNorm left: {}  {}'.format(
+        name, rel_diff, num_bn, 'OK' if ok else 'FAILED'))
+    return ok
+
+
+def main():
+    args = parser.parse_args()
+    torch.manual_seed(42)
+    passed = True
+    for name in args.models:
+        model = geffnet.create_model(name, pretrained=args.pretrained)
+        if not args.pretrained:
+            randomize_bn(model)
+        img_size = args.img_size or geffnet.get_model_cfg(name)['input_size'][-1]
+        x = torch.randn(args.batch_size, 3, img_size, img_size)
+        passed &= check(name, model, x, args.tol)
+        if any(isinstance(m, geffnet.conv2d_layers.MixedConv2d) for m in model.modules()):
+            geffnet.set_mixed_conv_fused(model, True, max_mac_waste=1.)
+            passed &= check(name + ' (MixedConv2d fused)', model, x, args.tol)
+            geffnet.set_mixed_conv_fused(model, False)
+        if hasattr(model, 'as_sequential'):
+            passed &= check(name + ' (as_sequential)', model.as_sequential(), x, args.tol)
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
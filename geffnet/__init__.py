@@ -1,5 +1,62 @@
-from .gen_efficientnet import *
-from .mobilenetv3 import *
-from .model_factory import create_model
-from .config import is_exportable, is_scriptable, set_exportable, set_scriptable
-from .activations import *
\ No newline at end of file
+import sys
+
+from .config import is_exportable, is_export_dynamic, is_scriptable, set_exportable, set_scriptable
+from .registry import list_models, is_model, model_entrypoint, get_model_cfg
+
+if sys.version_info >= (3, 7):
+    # Lazy imports, the model modules (and torch) are only imported when something needing them is accessed
+    import importlib
+
+    _LAZY_ATTRS = {
+        'create_model': 'model_factory',
+        'set_same_padding_input_size': 'conv2d_layers',
+        'set_mixed_conv_fused': 'conv2d_layers',
+        'set_cond_conv_mode': 'conv2d_layers',
+        'fuse_for_inference': 'fuse',
+        'save_weights': 'weight_store',
+        'load_weights': 'weight_store',
+        'bind_weights': 'weight_store',
+        'GenEfficientNet': 'gen_efficientnet',
+    }
+    _SUBMODULES = {
+        'activations', 'benchmark', 'conv2d_layers', 'cost_model', 'efficientnet_builder', 'fuse', 'gen_efficientnet',
+        'helpers', 'mobilenetv3', 'model_factory', 'profiler', 'quantize', 'serve', 'weight_store'}
+
+    # activation fns, layers and the act fn / layer lookups from .activations
+    _ACTIVATION_ATTRS = {
+        'swish', 'Swish', 'mish', 'Mish', 'sigmoid', 'Sigmoid', 'tanh', 'Tanh', 'hard_swish', 'HardSwish',
+        'hard_sigmoid', 'HardSigmoid', 'swish_auto', 'SwishAuto', 'mish_auto', 'MishAuto', 'swish_jit', 'SwishJit',
+        'mish_jit', 'MishJit', 'get_act_fn', 'get_act_layer', 'add_override_act_fn', 'update_override_act_fn',
+        'clear_override_act_fn', 'add_override_act_layer', 'update_override_act_layer', 'clear_override_act_layer'}
+
+    __all__ = [
+        'is_exportable', 'is_export_dynamic', 'is_scriptable', 'set_exportable', 'set_scriptable',
+        'list_models', 'is_model', 'model_entrypoint', 'get_model_cfg'
+    ] + sorted(_LAZY_ATTRS) + list_models() + sorted(_ACTIVATION_ATTRS)
+
+    def __getattr__(name):
+        if name.startswith('_'):
+            # dunder / private lookups (ie __all__, __path__ probes) must not import torch
+            raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+        if name in _LAZY_ATTRS:
+            module = importlib.import_module('.' + _LAZY_ATTRS[name], __name__)
+        elif is_model(name):
+            return model_entrypoint(name)
+        elif name in _SUBMODULES:
+            return importlib.import_module('.' + name, __name__)
+        elif name in _ACTIVATION_ATTRS:
+            module = importlib.import_module('.activations', __name__)
+        else:
+            raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+        return getattr(module, name)
+
+    def __dir__():
+        return sorted(list(globals().keys()) + list(_LAZY_ATTRS.keys()) + list_models())
+else:
+    from .gen_efficientnet import *
+    from .mobilenetv3 import *
+    from .model_factory import create_model
+    from .activations import *
+    from .conv2d_layers import set_same_padding_input_size, set_mixed_conv_fused, set_cond_conv_mode
+    from .fuse import fuse_for_inference
+    from .weight_store import save_weights, load_weights, bind_weights
@@ -7,12 +7,26 @@ __all__ = ['swish_jit', 'SwishJit', 'mish_jit', 'MishJit']
            #'hard_swish_jit', 'HardSwishJit', 'hard_sigmoid_jit', 'HardSigmoidJit']
 
 
-@torch.jit.script
+def _script_on_first_call(fn):
+    """ torch.jit.script `fn` the first time it's called instead of at import time (import cost)
+    """
+    scripted = []
+
+    def _fn(*args):
+        if not scripted:
+            scripted.append(torch.jit.script(fn))
+        return scripted[0](*args)
+    _fn.__name__ = fn.__name__
+    _fn.__doc__ = fn.__doc__
+    return _fn
+
+
+@_script_on_first_call
 def swish_jit_fwd(x):
     return x.mul(torch.sigmoid(x))
 
 
-@torch.jit.script
+@_script_on_first_call
 def swish_jit_bwd(x, grad_output):
     x_sigmoid = torch.sigmoid(x)
     return grad_output * (x_sigmoid * (1 + x * (1 - x_sigmoid)))
@@ -48,12 +62,12 @@ class SwishJit(nn.Module):
         return SwishJitAutoFn.apply(x)
 
 
-@torch.jit.script
+@_script_on_first_call
 def mish_jit_fwd(x):
     return x.mul(torch.tanh(F.softplus(x)))
 
 
-@torch.jit.script
+@_script_on_first_call
 def mish_jit_bwd(x, grad_output):
     x_sigmoid = torch.sigmoid(x)
     x_tanh_sp = F.softplus(x).tanh()
@@ -0,0 +1,186 @@
+""" PyTorch inference benchmark
+
+Times the forward pass of registered models at their native (default cfg) resolution across batch sizes and
+torch thread counts. Each configuration runs a few warmup passes, then `trials` timed trials of `iters` passes,
+and reports the mean per-pass latency with a 95% confidence interval over the trials (Student's t), median,
+min and the resulting throughput. Results are plain dicts, `write_csv` / `write_json` save them.
+
+Usage:
+    results = benchmark_models(['efficientnet_b0', 'mixnet_s'], batch_sizes=(1, 8), num_threads=(1, 4))
+    write_csv(results, 'benchmark.csv')
+
+or from the command line:
+    python -m geffnet.benchmark --models 'efficientnet_b*' --batch-sizes 1 8 --num-threads 1 4 --csv out.csv
+"""
+import argparse
+import csv
+import fnmatch
+import json
+import math
+import statistics
+import time
+
+import torch
+
+from .registry import list_models, get_model_cfg
+from .model_factory import create_model
+from .fuse import fuse_for_inference
+
+__all__ = ['time_model', 'summarize', 'benchmark_model', 'benchmark_models', 'write_csv', 'write_json']
+
+# two-sided 95% critical values of Student's t distribution, by degrees of freedom
+_T95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+    2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def time_model(model, x, warmup=5, trials=10, iters=10):
+    """ Per trial mean forward latency (seconds) of `model` on `x` """
+    sync = torch.cuda.synchronize if x.is_cuda else lambda: None
+    times = []
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(x)
+        sync()
+        for _ in range(trials):
+            start = time.perf_counter()
+            for _ in range(iters):
+                model(x)
+            sync()
+            times.append((time.perf_counter() - start) / iters)
+    return times
+
+
+def summarize(times):
+    """ mean, std, 95% CI half-width, median and min of latency samples, in milliseconds """
+    times = [1000. * t for t in times]
+    n = len(times)
+    mean = statistics.mean(times)
+    std = statistics.stdev(times) if n > 1 else 0.
+    t95 = _T95[n - 2] if n - 1 <= len(_T95) else 1.96
+    return dict(
+        latency_ms=mean, latency_std_ms=std, latency_ci95_ms=t95 * std / math.sqrt(n) if n > 1 else 0.,
+        latency_median_ms=statistics.median(times), latency_min_ms=min(times))
+
+
+def benchmark_model(
+        model_name, batch_sizes=(1,), num_threads=(0,), img_size=0, warmup=5, trials=10, iters=10,
+        device='cpu', fuse_bn=False, channels_last=False, verbose=False):
+    """ Benchmark one model over all batch size x thread count combinations
+
+    Args:
+        model_name: registered model name
+        batch_sizes: batch sizes to time
+        num_threads: torch thread counts to time, 0 leaves the current setting
+        img_size: input resolution, 0 for the model's native resolution
+        fuse_bn: fold BatchNorm layers into the convs first (see fuse_for_inference)
+        channels_last: run in channels last memory format
+    Returns:
+        list of result dicts, one per configuration
+    """
+    model = create_model(model_name)
+    if fuse_bn:
+        fuse_for_inference(model)
+    model.eval()
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    model = model.to(device=device, memory_format=memory_format)
+    img_size = img_size or get_model_cfg(model_name)['input_size'][-1]
+    num_params = sum(p.numel() for p in model.parameters())
+
+    prev_threads = torch.get_num_threads()
+    results = []
+    try:
+        for threads in num_threads:
+            if threads:
+                torch.set_num_threads(threads)
+            for batch_size in batch_sizes:
+                x = torch.randn(batch_size, 3, img_size, img_size, device=device).to(memory_format=memory_format)
+                result = dict(
+                    model=model_name, img_size=img_size, batch_size=batch_size,
+                    num_threads=torch.get_num_threads(), device=str(device), params=num_params)
+                result.update(summarize(time_model(model, x, warmup=warmup, trials=trials, iters=iters)))
+                result['ms_per_img'] = result['latency_ms'] / batch_size
+                result['img_per_sec'] = 1000. * batch_size / result['latency_ms']
+                if verbose:
+                    print('{model:<32} {img_size:4d}px b{batch_size:<4d} t{num_threads:<3d} '
+                          '{latency_ms:9.3f} +/- {latency_ci95_ms:7.3f} ms  {img_per_sec:9.1f} img/s'.format(**result))
+                results.append(result)
+    finally:
+        torch.set_num_threads(prev_threads)
+    return results
+
+
+def benchmark_models(model_names=None, verbose=False, **kwargs):
+    """ Benchmark a list of models (default all registered models), see benchmark_model for kwargs
+
+    A model that fails (ie out of memory for the largest models) is reported and skipped.
+    """
+    results = []
+    for name in model_names or list_models():
+        try:
+            results.extend(benchmark_model(name, verbose=verbose, **kwargs))
+        except RuntimeError as e:
+            print('Skipping {}: {}'.format(name, e))
+    return results
+
+
+def write_csv(results, path):
+    if not results:
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def write_json(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PyTorch Inference Benchmark')
+    parser.add_argument('--models', default=['*'], type=str, nargs='+',
+                        help='model names or wildcard filters (default: all registered models)')
+    parser.add_argument('--batch-sizes', default=[1], type=int, nargs='+',
+                        help='batch sizes (default: 1)')
+    parser.add_argument('--num-threads', default=[0], type=int, nargs='+',
+                        help='torch thread counts, 0 to leave as is (default: 0)')
+    parser.add_argument('--img-size', default=0, type=int, metavar='N',
+                        help='input image dimension, 0 for each model\'s native resolution (default: 0)')
+    parser.add_argument('--warmup', default=5, type=int, metavar='N',
+                        help='number of warmup iterations (default: 5)')
+    parser.add_argument('--trials', default=10, type=int, metavar='N',
+                        help='number of timed trials (default: 10)')
+    parser.add_argument('--iters', default=10, type=int, metavar='N',
+                        help='number of iterations per trial (default: 10)')
+    parser.add_argument('--device', default='cpu', type=str,
+                        help='torch device (default: cpu)')
+    parser.add_argument('--fuse-bn', dest='fuse_bn', action='store_true',
+                        help='fold BatchNorm layers into convolutions before benchmarking')
+    parser.add_argument('--channels-last', dest='channels_last', action='store_true',
+                        help='use channels last memory format')
+    parser.add_argument('--csv', default='', type=str, metavar='PATH',
+                        help='write results to a CSV file')
+    parser.add_argument('--json', default='', type=str, metavar='PATH',
+                        help='write results to a JSON file')
+    args = parser.parse_args(argv)
+
+    all_models = list_models()
+    model_names = []
+    for m in args.models:
+        model_names.extend(n for n in fnmatch.filter(all_models, m) if n not in model_names)
+    assert model_names, 'No models match %s' % args.models
+
+    results = benchmark_models(
+        model_names, batch_sizes=args.batch_sizes, num_threads=args.num_threads, img_size=args.img_size,
+        warmup=args.warmup, trials=args.trials, iters=args.iters, device=args.device, fuse_bn=args.fuse_bn,
+        channels_last=args.channels_last, verbose=True)
+    if args.csv:
+        write_csv(results, args.csv)
+    if args.json:
+        write_json(results, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,14 @@
 """ Global Config and Constants
 """
 
-__all__ = ['is_exportable', 'is_scriptable', 'set_exportable', 'set_scriptable']
+__all__ = ['is_exportable', 'is_export_dynamic', 'is_scriptable', 'set_exportable', 'set_scriptable']
 
 # Set to True if exporting a model with Same padding via ONNX
 _EXPORTABLE = False
 
+# Set (via set_exportable) if the ONNX export has symbolic input sizes, Same padding is then a shape dependent Pad
+_EXPORT_DYNAMIC = False
+
 # Set to True if wanting to use torch.jit.script on a model
 _SCRIPTABLE = False
 
@@ -14,9 +17,14 @@ def is_exportable():
     return _EXPORTABLE
 
 
-def set_exportable(value):
-    global _EXPORTABLE
+def is_export_dynamic():
+    return _EXPORT_DYNAMIC
+
+
+def set_exportable(value, dynamic=False):
+    global _EXPORTABLE, _EXPORT_DYNAMIC
     _EXPORTABLE = value
+    _EXPORT_DYNAMIC = bool(value and dynamic)
 
 
 def is_scriptable():
@@ -1,10 +1,11 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch._six import container_abcs
 
 from itertools import repeat
 from functools import partial
+from collections import OrderedDict
+from collections import abc as container_abcs
 from typing import Union, List, Tuple, Optional, Callable
 import numpy as np
 import math
@@ -47,6 +48,34 @@ def _same_pad_arg(input_size, kernel_size, stride, dilation):
     return [pad_w // 2, pad_w - pad_w // 2, pad_h // 2, pad_h - pad_h // 2]
 
 
+def _same_pad_dynamic(i, k: int, s: int, d: int):
+    """ 'SAME' pad total w/o python ceil / max, so a traced input size `i` stays symbolic in an ONNX export
+
+    Equivalent to _calc_same_pad, `i` may be an int or a (traced) 0-dim tensor.
+    """
+    k_eff = (k - 1) * d + 1
+    if s == 1:
+        return k_eff - 1
+    pad = k_eff - s + (s - i % s) % s
+    if k_eff < s:
+        pad = pad.clamp(min=0) if isinstance(pad, torch.Tensor) else max(pad, 0)
+    return pad
+
+
+def _same_pad_static(i: int, k: int, s: int, d: int):
+    """ Symmetric conv padding + output offset that reproduces 'SAME' padding for a fixed input size
+
+    TF 'SAME' places any odd pad element on the right/bottom. Padding both sides by the larger amount
+    would shift the output grid by one input pixel, so the left/top side is over-padded by a multiple of
+    the stride instead. The TF outputs then start `offset` elements into the conv output.
+    """
+    pad = _calc_same_pad(i, k, s, d)
+    pad_l = pad // 2
+    pad_r = pad - pad_l
+    extra = -(-(pad_r - pad_l) // s) * s
+    return pad_l + extra, extra // s
+
+
 def _split_channels(num_chan, num_groups):
     split = [num_chan // num_groups for _ in range(num_groups)]
     split[0] += num_chan - sum(split)
@@ -67,6 +96,11 @@ def conv2d_same(
 
 class Conv2dSame(nn.Conv2d):
     """ Tensorflow like 'SAME' convolution wrapper for 2D convolutions
+
+    By default the padding is calculated and applied (as a padded copy of the input) on every forward. Once
+    the input size is fixed via `set_input_size` the padding is calculated once and, in 'slice' mode, the pad
+    copy is avoided entirely by convolving with symmetric padding and slicing the TF output grid from the result.
+    Inputs that don't match the fixed size fall back to the dynamic path.
     """
 
     # pylint: disable=unused-argument
@@ -74,14 +108,51 @@ class Conv2dSame(nn.Conv2d):
                  padding=0, dilation=1, groups=1, bias=True):
         super(Conv2dSame, self).__init__(
             in_channels, out_channels, kernel_size, stride, 0, dilation, groups, bias)
+        self.static_mode = ''  # one of '' (dynamic), 'slice', 'pad'
+        self.static_input_size = (0, 0)
+        self.static_output_size = (0, 0)
+        self.static_padding = (0, 0)
+        self.static_offset = (0, 0)
+        self.static_pad_arg = [0, 0, 0, 0]
+
+    def set_input_size(self, input_size=None, mode='slice'):
+        """ Fix the input (H, W) of this conv and precompute its padding, None restores dynamic padding
+        """
+        if input_size is None:
+            self.static_mode = ''
+            return
+        assert mode in ('slice', 'pad')
+        ih, iw = input_size
+        kh, kw = self.weight.shape[-2:]
+        ph, oh = _same_pad_static(ih, kh, self.stride[0], self.dilation[0])
+        pw, ow = _same_pad_static(iw, kw, self.stride[1], self.dilation[1])
+        self.static_mode = mode
+        self.static_input_size = (int(ih), int(iw))
+        self.static_output_size = (-(-ih // self.stride[0]), -(-iw // self.stride[1]))
+        self.static_padding = (ph, pw)
+        self.static_offset = (oh, ow)
+        self.static_pad_arg = _same_pad_arg(input_size, (kh, kw), self.stride, self.dilation)
 
     def forward(self, x):
+        if self.static_mode and x.shape[-2] == self.static_input_size[0] and x.shape[-1] == self.static_input_size[1]:
+            if self.static_mode == 'pad':
+                x = F.pad(x, self.static_pad_arg)
+                return F.conv2d(x, self.weight, self.bias, self.stride, (0, 0), self.dilation, self.groups)
+            x = F.conv2d(x, self.weight, self.bias, self.stride, self.static_padding, self.dilation, self.groups)
+            if self.static_offset[0] > 0 or self.static_offset[1] > 0:
+                oh, ow = self.static_offset
+                x = x[:, :, oh:oh + self.static_output_size[0], ow:ow + self.static_output_size[1]]
+            return x
         return conv2d_same(x, self.weight, self.bias, self.stride, self.padding, self.dilation, self.groups)
 
 
 class Conv2dSameExport(nn.Conv2d):
     """ ONNX export friendly Tensorflow like 'SAME' convolution wrapper for 2D convolutions
 
+    By default the padding is fixed by the input size of the first call. If created with dynamic export enabled
+    (`set_exportable(True, dynamic=True)`), the padding is computed from the input shape on every call w/ ops the
+    tracer records, the export then has a shape dependent Pad and accepts any input size.
+
     NOTE: This does not currently work with torch.jit.script
     """
 
@@ -92,8 +163,17 @@ class Conv2dSameExport(nn.Conv2d):
             in_channels, out_channels, kernel_size, stride, 0, dilation, groups, bias)
         self.pad = None
         self.pad_input_size = (0, 0)
+        self.dynamic_size = is_export_dynamic()
 
     def forward(self, x):
+        if self.dynamic_size:
+            kh, kw = self.kernel_size
+            pad_h = _same_pad_dynamic(x.size(-2), kh, self.stride[0], self.dilation[0])
+            pad_w = _same_pad_dynamic(x.size(-1), kw, self.stride[1], self.dilation[1])
+            x = F.pad(x, [pad_w // 2, pad_w - pad_w // 2, pad_h // 2, pad_h - pad_h // 2])
+            return F.conv2d(
+                x, self.weight, self.bias, self.stride, self.padding, self.dilation, self.groups)
+
         input_size = x.size()[-2:]
         if self.pad is None:
             pad_arg = _same_pad_arg(input_size, self.weight.size()[-2:], self.stride, self.dilation)
@@ -148,7 +228,18 @@ class MixedConv2d(nn.ModuleDict):
     """ Mixed Grouped Convolution
     Based on MDConv and GroupedConv in MixNet impl:
       https://github.com/tensorflow/tpu/blob/master/models/official/mnasnet/mixnet/custom_layers.py
+
+    By default the input is split, each kernel group is convolved separately and the results concatenated.
+    With `set_fused(True)` the smaller kernels are zero padded (centered) up to the largest kernel size and the
+    whole layer runs as one grouped conv. This is numerically equivalent and avoids the split/cat copies. It's
+    possible for depthwise layers and for non-depthwise layers with equal channel splits, as long as the kernel
+    sizes differ by multiples of 2 and the padding is calculated ('' or 'same'). The padded kernels cost extra
+    (zero) MACs, see `fused_mac_waste`.
+
+    The padded and concatenated weight (and bias) is built once and reused while the sub-conv weights are
+    unchanged (same storage and version). It's rebuilt per call when gradients w.r.t. the weights are needed.
     """
+    __jit_ignored_attributes__ = ['_fused_key', '_fused_weight_bias']
 
     def __init__(self, in_channels, out_channels, kernel_size=3,
                  stride=1, padding='', dilation=1, depthwise=False, **kwargs):
@@ -170,7 +261,77 @@ class MixedConv2d(nn.ModuleDict):
             )
         self.splits = in_splits
 
+        # single grouped conv (fused) execution setup
+        max_k = max(kernel_size)
+        self.fusable = isinstance(padding, str) and padding.lower() in ('', 'same') and \
+            all((max_k - k) % 2 == 0 for k in kernel_size) and \
+            (depthwise or (len(set(in_splits)) == 1 and len(set(out_splits)) == 1))
+        self.fused = False
+        self.fused_groups = self.out_channels if depthwise else num_groups
+        self.fused_kernel_size = max_k
+        self.stride = _pair(stride)
+        self.dilation = _pair(dilation)
+        fused_padding, self.fused_dynamic_padding = get_padding_value(
+            padding if self.fusable else '', max_k, stride=stride, dilation=dilation)
+        self.fused_padding = _pair(fused_padding)
+        # fraction of the fused conv MACs spent on the zero padding of the smaller kernels
+        self.fused_mac_waste = 1. - sum(k * k * out_ch for k, out_ch in zip(kernel_size, out_splits)) / float(
+            max_k * max_k * self.out_channels)
+        self._fused_key = None
+        self._fused_weight_bias = None
+
+    def set_fused(self, fused=True):
+        """ Switch between split/cat (False) and single grouped conv (True) execution
+        """
+        assert not fused or self.fusable, 'This MixedConv2d configuration cannot be fused'
+        self.fused = fused
+        self._fused_key = None
+        self._fused_weight_bias = None
+        if fused and next(iter(self.values())).weight.device.type != 'meta':
+            self._cached_fused_weight_bias()
+
+    def _fuse_weight_bias(self):
+        weights = []
+        biases = []
+        for conv in self.values():
+            p = (self.fused_kernel_size - conv.weight.shape[-1]) // 2
+            weights.append(F.pad(conv.weight, [p, p, p, p]))
+            bias = conv.bias
+            if bias is not None:
+                biases.append(bias)
+        weight = torch.cat(weights, 0)
+        bias: Optional[torch.Tensor] = None
+        if len(biases) == len(weights):
+            bias = torch.cat(biases, 0)
+        return weight, bias
+
+    @torch.jit.unused
+    def _cached_fused_weight_bias(self):
+        # keyed on the weight objects (new Parameters, ie bind_weights), their storage and dtype (.to() / .half()
+        # swap the .data of the same Parameter) and version (in-place updates)
+        params = [t for conv in self.values() for t in (conv.weight, conv.bias) if t is not None]
+        key = [(t.data_ptr(), t._version, t.dtype) for t in params]
+        if self._fused_key is None or len(self._fused_key[0]) != len(params) or \
+                any(a is not b for a, b in zip(self._fused_key[0], params)) or self._fused_key[1] != key:
+            with torch.no_grad():
+                self._fused_weight_bias = self._fuse_weight_bias()
+            self._fused_key = (params, key)
+        return self._fused_weight_bias
+
+    @torch.jit.unused
+    def _use_fused_cache(self) -> bool:
+        return not torch.is_grad_enabled() or not any(p.requires_grad for p in self.parameters())
+
     def forward(self, x):
+        if self.fused:
+            if not torch.jit.is_scripting() and self._use_fused_cache():
+                weight, bias = self._cached_fused_weight_bias()
+            else:
+                weight, bias = self._fuse_weight_bias()
+            if self.fused_dynamic_padding:
+                return conv2d_same(
+                    x, weight, bias, self.stride, self.fused_padding, self.dilation, self.fused_groups)
+            return F.conv2d(x, weight, bias, self.stride, self.fused_padding, self.dilation, self.fused_groups)
         x_split = torch.split(x, self.splits, 1)
         x_out = [conv(x_split[i]) for i, conv in enumerate(self.values())]
         x = torch.cat(x_out, 1)
@@ -196,8 +357,24 @@ class CondConv2d(nn.Module):
 
     Grouped convolution hackery for parallel execution of the per-sample kernel filters inspired by this discussion:
     https://github.com/pytorch/pytorch/issues/17983
+
+    The per-sample convolution can be executed in several ways, selected by `mode`:
+      * 'grouped' - mix the expert kernels per sample and run one conv with groups * B on a (1, B * C, H, W) view
+      * 'bmm' - mix the expert kernels per sample and run a batched matmul, pointwise (1x1, stride 1) convs only
+      * 'experts' - run one conv per active expert over the whole batch and sum the outputs weighted by routing
+      * 'auto' - 'experts' if at most one expert is active for the batch, else 'bmm' for pointwise convs with
+        batch > 1, otherwise 'grouped'
+    An expert is active if its max routing weight over the batch is >= `routing_eps`. With the default 0 every
+    expert is active (the sigmoid routing is never exactly 0) and the routing isn't inspected. With `routing_eps`
+    > 0, inactive experts are dropped (an approximation, each skipped expert contributes < routing_eps times its
+    conv output), and a batch routed to a single expert runs as one plain conv. Checking the routing costs a
+    device sync on GPU.
+    With `cache_size` > 0, the mixed kernel of single sample (B=1) CPU inference calls is kept in an LRU cache
+    keyed on the routing weights (quantized to multiples of `cache_quant` if > 0, else exact). The key is read
+    back from the routing tensor, so the cache is not used for GPU inputs.
     """
     __constants__ = ['bias', 'in_channels', 'out_channels', 'dynamic_padding']
+    __jit_ignored_attributes__ = ['cache', 'cache_tag']
 
     def __init__(self, in_channels, out_channels, kernel_size=3,
                  stride=1, padding='', dilation=1, groups=1, bias=False, num_experts=4):
@@ -219,13 +396,24 @@ class CondConv2d(nn.Module):
         weight_num_param = 1
         for wd in self.weight_shape:
             weight_num_param *= wd
-        self.weight = torch.nn.Parameter(torch.Tensor(self.num_experts, weight_num_param))
+        self.weight = torch.nn.Parameter(torch.empty(self.num_experts, weight_num_param))
 
         if bias:
             self.bias_shape = (self.out_channels,)
-            self.bias = torch.nn.Parameter(torch.Tensor(self.num_experts, self.out_channels))
+            self.bias = torch.nn.Parameter(torch.empty(self.num_experts, self.out_channels))
         else:
             self.register_parameter('bias', None)
+        # expert independent bias, only present after a following BatchNorm has been folded in
+        self.register_parameter('bias_static', None)
+
+        self.mode = 'auto'
+        self.is_pointwise = self.kernel_size == (1, 1) and self.stride == (1, 1) and \
+            self.padding == (0, 0) and not self.dynamic_padding and self.groups == 1
+        self.routing_eps = 0.
+        self.cache_size = 0
+        self.cache_quant = 0.
+        self.cache = OrderedDict()
+        self.cache_tag = None
 
         self.reset_parameters()
 
@@ -240,26 +428,129 @@ class CondConv2d(nn.Module):
                 partial(nn.init.uniform_, a=-bound, b=bound), self.num_experts, self.bias_shape)
             init_bias(self.bias)
 
-    def forward(self, x, routing_weights):
-        B, C, H, W = x.shape
-        weight = torch.matmul(routing_weights, self.weight)
-        new_weight_shape = (B * self.out_channels, self.in_channels // self.groups) + self.kernel_size
-        weight = weight.view(new_weight_shape)
-        bias = None
+    def set_mode(self, mode='auto', cache_size=0, cache_quant=0., routing_eps=0.):
+        """ Select the execution strategy, the active expert routing threshold and the B=1 mixed kernel
+        cache size / routing quantization step
+        """
+        assert mode in ('auto', 'grouped', 'bmm', 'experts')
+        assert mode != 'bmm' or self.is_pointwise, "'bmm' mode is only valid for pointwise convs"
+        self.mode = mode
+        self.routing_eps = routing_eps
+        self.cache_size = cache_size
+        self.cache_quant = cache_quant
+        self.cache.clear()
+
+    def _mix_bias(self, routing_weights):
+        bias: Optional[torch.Tensor] = None
         if self.bias is not None:
             bias = torch.matmul(routing_weights, self.bias)
-            bias = bias.view(B * self.out_channels)
-        # move batch elements with channels so each batch element can be efficiently convolved with separate kernel
-        x = x.view(1, B * C, H, W)
+            if self.bias_static is not None:
+                bias = bias + self.bias_static
+        elif self.bias_static is not None:
+            bias = self.bias_static.expand(routing_weights.shape[0], self.out_channels)
+        return bias
+
+    @torch.jit.unused
+    def _cached_weight_bias(self, routing_weights) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        # LRU cache of mixed kernels, invalidated if the weight, bias or bias_static storage, dtype or version
+        # changes (new Parameters, .to() / .half(), param.data = ..., in-place updates, BN folding)
+        tag = tuple((t.data_ptr(), t._version, t.dtype) for t in (self.weight, self.bias, self.bias_static)
+                    if t is not None)
+        if tag != self.cache_tag:
+            self.cache.clear()
+            self.cache_tag = tag
+        if self.cache_quant > 0:
+            key = tuple(torch.round(routing_weights[0] / self.cache_quant).long().tolist())
+        else:
+            key = tuple(routing_weights[0].tolist())
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if self.cache_quant > 0:
+            routing_weights = routing_weights.new_tensor(key).unsqueeze(0) * self.cache_quant
+        weight = torch.matmul(routing_weights, self.weight)
+        bias = self._mix_bias(routing_weights)
+        if bias is not None:
+            bias = bias.view(self.out_channels)
+        self.cache[key] = (weight, bias)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return weight, bias
+
+    def _conv(self, x, weight, bias: Optional[torch.Tensor], groups: int):
         if self.dynamic_padding:
-            out = conv2d_same(
+            return conv2d_same(
                 x, weight, bias, stride=self.stride, padding=self.padding,
-                dilation=self.dilation, groups=self.groups * B)
+                dilation=self.dilation, groups=groups)
         else:
-            out = F.conv2d(
+            return F.conv2d(
                 x, weight, bias, stride=self.stride, padding=self.padding,
-                dilation=self.dilation, groups=self.groups * B)
-        out = out.permute([1, 0, 2, 3]).view(B, self.out_channels, out.shape[-2], out.shape[-1])
+                dilation=self.dilation, groups=groups)
+
+    def forward(self, x, routing_weights):
+        B, C, H, W = x.shape
+        mode = self.mode
+        active: List[bool] = [True for _ in range(self.num_experts)]
+        num_active = self.num_experts
+        if self.routing_eps > 0 and (mode == 'auto' or mode == 'experts'):
+            active_mask = routing_weights.max(dim=0)[0] >= self.routing_eps
+            active = [bool(active_mask[e]) for e in range(self.num_experts)]
+            num_active = int(active_mask.sum())
+        if mode == 'auto':
+            if num_active <= 1:
+                mode = 'experts'
+            elif self.is_pointwise and B > 1:
+                mode = 'bmm'
+            else:
+                mode = 'grouped'
+
+        if mode == 'experts':
+            # linearity of the conv, sum_e(r_e * conv(x, W_e)) == conv(x, sum_e(r_e * W_e)), inactive experts
+            # (max routing weight over the batch < routing_eps) are skipped
+            out: Optional[torch.Tensor] = None
+            for e in range(self.num_experts):
+                if active[e]:
+                    out_e = self._conv(x, self.weight[e].view(self.weight_shape), None, self.groups)
+                    out_e = out_e * routing_weights[:, e].view(B, 1, 1, 1)
+                    out = out_e if out is None else out + out_e
+            if out is None:
+                out = self._conv(x, self.weight.new_zeros(self.weight_shape), None, self.groups)
+            bias = self._mix_bias(routing_weights)
+            if bias is not None:
+                out = out + bias.view(B, self.out_channels, 1, 1)
+            return out
+
+        if mode == 'bmm':
+            weight = torch.matmul(routing_weights, self.weight).view(B, self.out_channels, C)
+            if x.is_contiguous(memory_format=torch.channels_last):
+                # NHWC, (B, H * W, C) is a view, the output permute back to NCHW dims is channels_last as well
+                out = torch.bmm(x.permute(0, 2, 3, 1).reshape(B, H * W, C), weight.transpose(1, 2))
+                out = out.view(B, H, W, self.out_channels).permute(0, 3, 1, 2)
+            else:
+                out = torch.bmm(weight, x.reshape(B, C, H * W)).view(B, self.out_channels, H, W)
+            bias = self._mix_bias(routing_weights)
+            if bias is not None:
+                out = out + bias.view(B, self.out_channels, 1, 1)
+            return out
+
+        if B == 1 and self.cache_size > 0 and routing_weights.device.type == 'cpu' and not self.training \
+                and not torch.jit.is_scripting() and not torch.is_grad_enabled():
+            weight, bias = self._cached_weight_bias(routing_weights)
+        else:
+            weight = torch.matmul(routing_weights, self.weight)
+            bias = self._mix_bias(routing_weights)
+            if bias is not None:
+                bias = bias.reshape(B * self.out_channels)
+        new_weight_shape = (B * self.out_channels, self.in_channels // self.groups) + self.kernel_size
+        weight = weight.view(new_weight_shape)
+        # move batch elements with channels so each batch element can be efficiently convolved with separate kernel
+        channels_last = x.is_contiguous(memory_format=torch.channels_last)
+        x = x.reshape(1, B * C, H, W)
+        out = self._conv(x, weight, bias, self.groups * B)
+        out = out.reshape(B, self.out_channels, out.shape[-2], out.shape[-1])
+        if channels_last:
+            # the batch folding needs NCHW, keep the memory format of the input for the following layers
+            out = out.contiguous(memory_format=torch.channels_last)
 
         # Literal port (from TF definition)
         # x = torch.split(x, 1, 0)
@@ -296,3 +587,92 @@ def select_conv2d(in_chs, out_chs, kernel_size, **kwargs):
         else:
             m = create_conv2d_pad(in_chs, out_chs, kernel_size, groups=groups, **kwargs)
     return m
+
+
+def set_same_padding_input_size(model, input_size=None, mode='slice'):
+    """ Fix the input resolution of a model and precompute the 'SAME' padding of every Conv2dSame layer
+
+    A single forward pass at the given size is used to record the input size seen by each Conv2dSame.
+    Inputs of any other size still work, they take the (slower) dynamic padding path.
+
+    Args:
+        model: model containing Conv2dSame layers (ie the tf_* variants)
+        input_size: int, (H, W), or (C, H, W) model input size. None restores dynamic padding.
+        mode: 'slice' to avoid the pad copy via symmetric conv padding + output slice,
+            'pad' to apply the precomputed padding as a separate (copy) pad op
+    Returns:
+        the model
+    """
+    same_convs = [m for m in model.modules() if isinstance(m, Conv2dSame)]
+    if input_size is None:
+        for m in same_convs:
+            m.set_input_size(None)
+        return model
+    if isinstance(input_size, int):
+        input_size = (input_size, input_size)
+    first_conv = next(m for m in model.modules() if isinstance(m, nn.Conv2d))
+    in_chans = input_size[0] if len(input_size) == 3 else first_conv.in_channels
+
+    conv_input_sizes = {}
+
+    def _hook(m, inputs):
+        conv_input_sizes[m] = tuple(inputs[0].shape[-2:])
+
+    handles = [m.register_forward_pre_hook(_hook) for m in same_convs]
+    for m in same_convs:
+        m.set_input_size(None)  # record with dynamic padding active
+    was_training = model.training
+    model.eval()
+    try:
+        with torch.no_grad():
+            model(first_conv.weight.new_zeros((1, in_chans) + tuple(input_size[-2:])))
+    finally:
+        for h in handles:
+            h.remove()
+        model.train(was_training)
+    for m in same_convs:
+        if m in conv_input_sizes:
+            m.set_input_size(conv_input_sizes[m], mode=mode)
+    return model
+
+
+def set_mixed_conv_fused(model, fused=True, max_mac_waste=0.45):
+    """ Enable (or disable) single grouped conv execution for the fusable MixedConv2d layers in a model
+
+    Fusing trades the split/cat copies for the zero MACs of the padded kernels. Layers where those exceed
+    `max_mac_waste` of the fused conv MACs are left on the split/cat path. The default keeps the 3.5 (32% waste)
+    and 3.5.7 (44%) layers and skips 3.5.7.9 (49%) and wider, so a fused layer does at most 1.8x the MACs of
+    its split equivalent. Whether that is faster depends on the hardware, 1.0 fuses every fusable layer.
+
+    Args:
+        model: model containing MixedConv2d layers (ie the MixNet variants)
+        fused: True for the single grouped conv path, False for the default split/cat path
+        max_mac_waste: max fraction of zero padding MACs for a layer to be fused
+    Returns:
+        the model
+    """
+    for m in model.modules():
+        if isinstance(m, MixedConv2d) and m.fusable:
+            m.set_fused(fused and m.fused_mac_waste <= max_mac_waste)
+    return model
+
+
+def set_cond_conv_mode(model, mode='auto', cache_size=0, cache_quant=0., routing_eps=0.):
+    """ Set the execution strategy of all CondConv2d layers in a model
+
+    Args:
+        model: model containing CondConv2d layers (ie the efficientnet_cc_* variants)
+        mode: one of 'auto', 'grouped', 'bmm', 'experts' (see CondConv2d), 'bmm' only applies to pointwise
+            convs, other CondConv2d layers are set to 'auto' in that case
+        cache_size: max number of mixed kernels cached per layer for batch size 1 inference, 0 to disable
+        cache_quant: routing weight quantization step for the cache key, 0 for exact matches only
+        routing_eps: experts w/ a max routing weight over the batch below this are skipped in 'experts' and
+            'auto' modes, 0 to always run every expert (exact)
+    Returns:
+        the model
+    """
+    for m in model.modules():
+        if isinstance(m, CondConv2d):
+            m_mode = 'auto' if mode == 'bmm' and not m.is_pointwise else mode
+            m.set_mode(m_mode, cache_size=cache_size, cache_quant=cache_quant, routing_eps=routing_eps)
+    return model
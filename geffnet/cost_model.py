@@ -0,0 +1,338 @@
+""" Analytic cost model
+
+Computes per layer MAdds, parameter counts, activation sizes and memory traffic of GenEfficientNet / MobileNetV3
+architectures straight from the decoded arch_def (`decode_arch_def` output) and the channel multiplier / input
+resolution, following the same channel rounding, expansion, SE reduction and stride rules as
+EfficientNetBuilder and the blocks. No modules or tensors are created, so costing a scaled configuration takes
+microseconds, not the seconds (and GBs) of building the model.
+
+Conventions, per sample (batch size 1) inference:
+ * MAdds count the conv and linear multiply-adds only, including the MixedConv2d kernel groups, and for CondConv
+   layers the per sample mixing of the expert kernels and the routing fn
+ * params match `model.parameters()` (BN weight + bias, CondConv experts)
+ * memory traffic is the bytes read (inputs, weights) + written (outputs) by each layer when every layer runs
+   unfused, activations are in place
+ * peak activation memory is the largest sum of live tensors (layer input, output, residual shortcut and SE input
+   held for later) over all layers, an estimate for no-grad inference w/o a caching allocator
+
+Usage:
+    cost = model_cost('efficientnet_b3')
+    print(cost['madds'], cost['params'], cost['peak_act_bytes'])
+
+    # sweep scaled variants of an arch_def
+    for cm, dm, res in configs:
+        cost = arch_def_cost(arch_def, channel_multiplier=cm, depth_multiplier=dm, img_size=res)
+
+or from the command line:
+    python -m geffnet.cost_model 'efficientnet_b*' 'mixnet_*' --layers
+"""
+import argparse
+import fnmatch
+import importlib
+import math
+
+from .conv2d_layers import _split_channels
+from .efficientnet_builder import decode_arch_def, round_channels, make_divisible
+from .registry import list_models, get_model_cfg, default_cfgs
+
+__all__ = ['arch_cost', 'arch_def_cost', 'model_arch', 'model_cost']
+
+_COST_KEYS = ('madds', 'params', 'act_bytes', 'traffic_bytes')
+
+
+class _CostCounter:
+    """ Walks the layers of a network, tracking the current (chs, height, width) and the live activations """
+
+    def __init__(self, in_chs, img_size, bytes_per_elem=4):
+        self.chs = in_chs
+        self.hw = (img_size, img_size) if isinstance(img_size, int) else tuple(img_size)
+        self.bpe = bytes_per_elem
+        self.held = 0  # bytes of tensors kept alive across layers (residual shortcut, SE input)
+        self._hold_next = 0
+        self.layers = []
+
+    def _bytes(self, chs, hw):
+        return chs * hw[0] * hw[1] * self.bpe
+
+    def _add(self, name, op, out_chs, out_hw, madds=0, params=0, in_place=False, reads=1, **info):
+        in_bytes = self._bytes(self.chs, self.hw)
+        out_bytes = self._bytes(out_chs, out_hw)
+        live = self.held + in_bytes + (0 if in_place else out_bytes)
+        self.layers.append(dict(
+            name=name, op=op, in_chs=self.chs, out_chs=out_chs, in_hw=self.hw, out_hw=out_hw, madds=madds,
+            params=params, act_bytes=out_bytes, traffic_bytes=reads * in_bytes + params * self.bpe + out_bytes,
+            live_bytes=live, **info))
+        self.chs = out_chs
+        self.hw = out_hw
+        self.held += self._hold_next
+        self._hold_next = 0
+
+    def hold(self):
+        """ Keep the current tensor alive, from after the next layer (which reads it) on """
+        nbytes = self._bytes(self.chs, self.hw)
+        self._hold_next += nbytes
+        return nbytes
+
+    def conv(self, name, out_chs, kernel_size, stride=1, depthwise=False, bias=False, num_experts=0):
+        """ select_conv2d equivalent, list kernel sizes are MixedConv2d groups """
+        out_hw = tuple(int(math.ceil(s / stride)) for s in self.hw)
+        out_area = out_hw[0] * out_hw[1]
+        if isinstance(kernel_size, list):
+            num_groups = len(kernel_size)
+            splits = zip(kernel_size, _split_channels(self.chs, num_groups), _split_channels(out_chs, num_groups))
+        else:
+            splits = [(kernel_size, self.chs, out_chs)]
+        madds = 0
+        params = 0
+        for k, in_split, out_split in splits:
+            groups = out_split if depthwise else 1
+            weight = out_split * (in_split // groups) * k * k
+            madds += out_area * weight
+            params += weight + (out_split if bias else 0)
+        if num_experts:
+            # per sample kernel = routing weighted sum of the expert kernels
+            madds += num_experts * params
+            params *= num_experts
+        kernel = '.'.join(str(k) for k in kernel_size) if isinstance(kernel_size, list) else str(kernel_size)
+        op = 'dwconv' if depthwise else 'conv'
+        self._add(name, op, out_chs, out_hw, madds=madds, params=params, kernel_size=kernel, stride=stride,
+                  num_experts=num_experts)
+
+    def bn(self, name):
+        self._add(name, 'bn', self.chs, self.hw, params=2 * self.chs)
+
+    def act(self, name):
+        self._add(name, 'act', self.chs, self.hw, in_place=True)
+
+    def pool(self, name):
+        self._add(name, 'pool', self.chs, (1, 1))
+
+    def linear(self, name, out_features, bias=True):
+        self._add(name, 'linear', out_features, (1, 1), madds=self.chs * out_features,
+                  params=self.chs * out_features + (out_features if bias else 0))
+
+    def squeeze_excite(self, name, se_ratio, reduced_base_chs=None, divisor=1):
+        chs, hw = self.chs, self.hw
+        reduced_chs = make_divisible((reduced_base_chs or chs) * se_ratio, divisor)
+        held = self.hold()
+        self.pool(name + '.avg_pool')
+        self.conv(name + '.conv_reduce', reduced_chs, 1, bias=True)
+        self.act(name + '.act1')
+        self.conv(name + '.conv_expand', chs, 1, bias=True)
+        self.held -= held
+        # gate multiply of the held input, in place
+        self.chs, self.hw = chs, hw
+        self._add(name + '.mul', 'mul', chs, hw, in_place=True)
+
+    def routing(self, name, num_experts):
+        """ CondConv routing fn on the pooled block input, the block input remains the current tensor """
+        chs, hw = self.chs, self.hw
+        held = self.hold()
+        self.pool(name + '.pool')
+        self.linear(name, num_experts)
+        self.held -= held
+        self.chs, self.hw = chs, hw
+
+    def residual_add(self, name):
+        self._add(name, 'add', self.chs, self.hw, in_place=True, reads=2)
+
+
+def _block_cost(c, name, ba, in_chs, se_kwargs):
+    bt = ba['block_type']
+    out_chs = ba['out_chs']
+    stride = ba['stride']
+    se_ratio = ba.get('se_ratio')
+    has_se = se_ratio is not None and se_ratio > 0.
+    se_kwargs = se_kwargs or {}
+    # as resolve_se_args, the SE reduction is relative to the block input chs unless `reduce_mid`
+    se_args = dict(
+        reduced_base_chs=None if se_kwargs.get('reduce_mid', False) else in_chs, divisor=se_kwargs.get('divisor', 1))
+    has_residual = bt != 'cn' and in_chs == out_chs and stride == 1 and not ba.get('noskip', False)
+    num_experts = ba.get('num_experts', 0) if bt == 'ir' else 0
+    if num_experts:
+        c.routing(name + '.routing_fn', num_experts)
+    if has_residual:
+        shortcut = c.hold()
+
+    if bt == 'ir':
+        mid_chs = make_divisible(in_chs * ba['exp_ratio'])
+        c.conv(name + '.conv_pw', mid_chs, ba['exp_kernel_size'], num_experts=num_experts)
+        c.bn(name + '.bn1')
+        c.act(name + '.act1')
+        c.conv(name + '.conv_dw', mid_chs, ba['dw_kernel_size'], stride=stride, depthwise=True,
+               num_experts=num_experts)
+        c.bn(name + '.bn2')
+        c.act(name + '.act2')
+        if has_se:
+            c.squeeze_excite(name + '.se', se_ratio, **se_args)
+        c.conv(name + '.conv_pwl', out_chs, ba['pw_kernel_size'], num_experts=num_experts)
+        c.bn(name + '.bn3')
+    elif bt in ('ds', 'dsa'):
+        c.conv(name + '.conv_dw', in_chs, ba['dw_kernel_size'], stride=stride, depthwise=True)
+        c.bn(name + '.bn1')
+        c.act(name + '.act1')
+        if has_se:
+            c.squeeze_excite(name + '.se', se_ratio, **se_args)
+        c.conv(name + '.conv_pw', out_chs, ba['pw_kernel_size'])
+        c.bn(name + '.bn2')
+        if ba.get('pw_act', False):
+            c.act(name + '.act2')
+    elif bt == 'er':
+        fake_in_chs = ba.get('fake_in_chs', 0)
+        mid_chs = make_divisible((fake_in_chs or in_chs) * ba['exp_ratio'])
+        c.conv(name + '.conv_exp', mid_chs, ba['exp_kernel_size'])
+        c.bn(name + '.bn1')
+        c.act(name + '.act1')
+        if has_se:
+            c.squeeze_excite(name + '.se', se_ratio, **se_args)
+        c.conv(name + '.conv_pwl', out_chs, ba['pw_kernel_size'], stride=stride)
+        c.bn(name + '.bn2')
+    elif bt == 'cn':
+        c.conv(name + '.conv', out_chs, ba['kernel_size'], stride=stride)
+        c.bn(name + '.bn1')
+        c.act(name + '.act1')
+    else:
+        assert False, 'Unknown block type (%s)' % bt
+
+    if has_residual:
+        c.held -= shortcut
+        c.residual_add(name + '.add')
+
+
+def arch_cost(
+        block_args, img_size=224, in_chans=3, num_classes=1000, stem_size=32, fix_stem=False, num_features=1280,
+        channel_multiplier=1.0, channel_divisor=8, channel_min=None, se_kwargs=None, efficient_head=False,
+        head_bias=True, bytes_per_elem=4, **kwargs):
+    """ Cost of a GenEfficientNet (or MobileNetV3 w/ `efficient_head`) from decoded block args
+
+    The args mirror the GenEfficientNet / MobileNetV3 constructor kwargs, others (act_layer, norm_kwargs,
+    drop rates, etc) don't change the cost and are ignored.
+    Returns:
+        dict w/ totals (madds, params, act_bytes, traffic_bytes, peak_act_bytes), 'layers' (per layer records)
+        and 'blocks' (per block sums of the layer records, in arch_def terms)
+    """
+    c = _CostCounter(in_chans, img_size, bytes_per_elem)
+    if not fix_stem:
+        stem_size = round_channels(stem_size, channel_multiplier, channel_divisor, channel_min)
+    c.conv('conv_stem', stem_size, 3, stride=2)
+    c.bn('bn1')
+    c.act('act1')
+
+    blocks = []
+    for stage_idx, stage in enumerate(block_args):
+        for block_idx, ba in enumerate(stage):
+            ba = dict(ba)
+            ba['out_chs'] = round_channels(ba['out_chs'], channel_multiplier, channel_divisor, channel_min)
+            if ba.get('fake_in_chs', 0):
+                ba['fake_in_chs'] = round_channels(ba['fake_in_chs'], channel_multiplier, channel_divisor, channel_min)
+            if block_idx >= 1:
+                ba['stride'] = 1
+            name = 'blocks.%d.%d' % (stage_idx, block_idx)
+            first_layer = len(c.layers)
+            in_hw = c.hw
+            _block_cost(c, name, ba, c.chs, se_kwargs)
+            block = dict(name=name, stage=stage_idx, block=block_idx, type=ba['block_type'], in_hw=in_hw,
+                         out_hw=c.hw, out_chs=c.chs)
+            for k in _COST_KEYS:
+                block[k] = sum(layer[k] for layer in c.layers[first_layer:])
+            blocks.append(block)
+
+    if efficient_head:
+        c.pool('global_pool')
+        c.conv('conv_head', num_features, 1, bias=head_bias)
+        c.act('act2')
+    else:
+        c.conv('conv_head', num_features, 1)
+        c.bn('bn2')
+        c.act('act2')
+        c.pool('global_pool')
+    c.linear('classifier', num_classes)
+
+    cost = {k: sum(layer[k] for layer in c.layers) for k in _COST_KEYS}
+    cost['peak_act_bytes'] = max(layer['live_bytes'] for layer in c.layers)
+    cost['layers'] = c.layers
+    cost['blocks'] = blocks
+    return cost
+
+
+def arch_def_cost(
+        arch_def, channel_multiplier=1.0, depth_multiplier=1.0, img_size=224, depth_trunc='ceil',
+        experts_multiplier=1, fix_first_last=False, **kwargs):
+    """ Cost of an arch_def (list of stages of block strings) scaled by the given multipliers, see arch_cost """
+    block_args = decode_arch_def(
+        arch_def, depth_multiplier, depth_trunc=depth_trunc, experts_multiplier=experts_multiplier,
+        fix_first_last=fix_first_last)
+    return arch_cost(block_args, img_size=img_size, channel_multiplier=channel_multiplier, **kwargs)
+
+
+def model_arch(model_name, **kwargs):
+    """ Constructor kwargs (block_args, stem_size, num_features, multipliers, ...) of a registered model
+
+    Runs the model's entrypoint w/ the model construction intercepted, so the model is not built.
+    NOTE not thread safe, the model module's `_create_model` is swapped during the call.
+    """
+    module = importlib.import_module('geffnet.' + default_cfgs[model_name]['module'])
+    captured = {}
+
+    def _capture(model_kwargs, variant, pretrained=False):
+        captured.update(model_kwargs)
+
+    create_fn = module._create_model
+    module._create_model = _capture
+    try:
+        getattr(module, model_name)(**kwargs)
+    finally:
+        module._create_model = create_fn
+    if default_cfgs[model_name]['module'] == 'mobilenetv3':
+        captured['efficient_head'] = True
+        # MobileNetV3 defaults that aren't passed explicitly by its entrypoints
+        captured.setdefault('stem_size', 16)
+        captured.setdefault('num_features', 1280)
+    return captured
+
+
+def model_cost(model_name, img_size=0, bytes_per_elem=4, **kwargs):
+    """ Cost of a registered model, at its native resolution unless `img_size` is given """
+    arch = model_arch(model_name, **kwargs)
+    img_size = img_size or get_model_cfg(model_name)['input_size'][-1]
+    return arch_cost(img_size=img_size, bytes_per_elem=bytes_per_elem, **arch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analytic Model Cost')
+    parser.add_argument('models', default=['*'], type=str, nargs='*',
+                        help='model names or wildcard filters (default: all registered models)')
+    parser.add_argument('--img-size', default=0, type=int, metavar='N',
+                        help='input image dimension, 0 for each model\'s native resolution (default: 0)')
+    parser.add_argument('--bytes-per-elem', default=4, type=int, metavar='N',
+                        help='activation / weight element size in bytes (default: 4)')
+    parser.add_argument('--layers', action='store_true',
+                        help='print the per layer costs')
+    parser.add_argument('--blocks', action='store_true',
+                        help='print the per block costs')
+    args = parser.parse_args(argv)
+
+    all_models = list_models()
+    model_names = []
+    for m in args.models or ['*']:
+        model_names.extend(n for n in fnmatch.filter(all_models, m) if n not in model_names)
+
+    mb = float(1 << 20)
+    print('{:<32} {:>5} {:>10} {:>9} {:>10} {:>12}'.format(
+        'model', 'res', 'MAdds (M)', 'Params (M)', 'Peak (MB)', 'Traffic (MB)'))
+    for name in model_names:
+        cost = model_cost(name, img_size=args.img_size, bytes_per_elem=args.bytes_per_elem)
+        res = cost['layers'][0]['in_hw'][0]
+        if args.layers or args.blocks:
+            records = cost['layers'] if args.layers else cost['blocks']
+            for r in records:
+                print('  {:<36} {:>14} {:>10.2f}M {:>10.3f}M {:>9.2f}MB'.format(
+                    r['name'], '%dx%d' % tuple(r['out_hw']), r['madds'] / 1e6, r['params'] / 1e6,
+                    r['act_bytes'] / mb))
+        print('{:<32} {:>5d} {:>10.1f} {:>9.2f} {:>10.1f} {:>12.1f}'.format(
+            name, res, cost['madds'] / 1e6, cost['params'] / 1e6, cost['peak_act_bytes'] / mb,
+            cost['traffic_bytes'] / mb))
+
+
+if __name__ == '__main__':
+    main()
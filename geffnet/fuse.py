@@ -0,0 +1,121 @@
+""" BatchNorm folding for inference
+
+Folds each BatchNorm2d that directly follows a convolution into that convolution's weight and bias so
+the BN ops disappear from eager, TorchScript and exported graphs alike. This is the PyTorch side equivalent
+of the ONNX `fuse_bn_into_conv` optimizer pass used in `onnx_optimize.py`.
+"""
+import torch
+import torch.nn as nn
+
+from .conv2d_layers import MixedConv2d, CondConv2d
+from .efficientnet_builder import ConvBnAct, DepthwiseSeparableConv, InvertedResidual, EdgeResidual
+from .gen_efficientnet import GenEfficientNet
+from .mobilenetv3 import MobileNetV3
+
+__all__ = ['fuse_for_inference', 'fuse_conv_bn']
+
+
+# (conv, bn) attribute name pairs for every module type with conv -> bn sequences
+_FUSE_PAIRS = (
+    (GenEfficientNet, (('conv_stem', 'bn1'), ('conv_head', 'bn2'))),
+    (MobileNetV3, (('conv_stem', 'bn1'),)),
+    (ConvBnAct, (('conv', 'bn1'),)),
+    (DepthwiseSeparableConv, (('conv_dw', 'bn1'), ('conv_pw', 'bn2'))),
+    (InvertedResidual, (('conv_pw', 'bn1'), ('conv_dw', 'bn2'), ('conv_pwl', 'bn3'))),  # incl CondConvResidual
+    (EdgeResidual, (('conv_exp', 'bn1'), ('conv_pwl', 'bn2'))),
+)
+
+
+def _bn_scale_shift(bn):
+    assert bn.running_mean is not None and bn.running_var is not None, \
+        'BatchNorm layers must track running stats to be folded'
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    if bn.weight is not None:
+        scale = scale * bn.weight
+    shift = -bn.running_mean * scale
+    if bn.bias is not None:
+        shift = shift + bn.bias
+    return scale, shift
+
+
+def _fuse_conv2d(conv, scale, shift):
+    # Covers nn.Conv2d and subclasses (Conv2dSame, Conv2dSameExport)
+    weight = conv.weight * scale.view(-1, 1, 1, 1)
+    bias = shift if conv.bias is None else conv.bias * scale + shift
+    conv.weight = nn.Parameter(weight.detach())
+    conv.bias = nn.Parameter(bias.detach())
+
+
+def _fuse_cond_conv2d(conv, scale, shift):
+    # Each expert kernel (and bias) is scaled, the BN shift cannot be split across experts since the
+    # routing weights do not sum to one, so it's kept as a separate expert independent bias.
+    weight = conv.weight.view(conv.num_experts, conv.out_channels, -1) * scale.view(1, -1, 1)
+    conv.weight = nn.Parameter(weight.view(conv.num_experts, -1).detach())
+    if conv.bias is not None:
+        conv.bias = nn.Parameter((conv.bias * scale.view(1, -1)).detach())
+    if conv.bias_static is not None:
+        shift = conv.bias_static * scale + shift
+    conv.bias_static = nn.Parameter(shift.detach())
+
+
+def fuse_conv_bn(conv, bn):
+    """ Fold BatchNorm `bn` into the preceding convolution `conv` (in-place)
+
+    Supports nn.Conv2d (incl Conv2dSame variants), MixedConv2d (each kernel group is folded with its
+    slice of the BN channels) and CondConv2d (folded into every expert).
+    """
+    scale, shift = _bn_scale_shift(bn)
+    with torch.no_grad():
+        if isinstance(conv, MixedConv2d):
+            out_idx = 0
+            for c in conv.values():
+                out_chs = c.out_channels
+                _fuse_conv2d(c, scale[out_idx:out_idx + out_chs], shift[out_idx:out_idx + out_chs])
+                out_idx += out_chs
+            assert out_idx == scale.numel()
+            if conv.fused:
+                conv.set_fused(True)  # rebuild the fused weight / bias from the folded kernels
+        elif isinstance(conv, CondConv2d):
+            _fuse_cond_conv2d(conv, scale, shift)
+        elif isinstance(conv, nn.Conv2d):
+            _fuse_conv2d(conv, scale, shift)
+        else:
+            assert False, 'Unsupported conv type (%s) for BatchNorm folding' % type(conv).__name__
+
+
+def _fuse_sequential(seq):
+    # handle as_sequential() models, a BN directly following a conv in the same container is folded
+    prev = None
+    for name, m in list(seq.named_children()):
+        if isinstance(m, nn.BatchNorm2d) and isinstance(prev, (nn.Conv2d, MixedConv2d)):
+            fuse_conv_bn(prev, m)
+            setattr(seq, name, nn.Identity())
+        prev = m
+
+
+def fuse_for_inference(model):
+    """ Fold all BatchNorm layers of a GenEfficientNet / MobileNetV3 model into their convolutions
+
+    The model is modified in-place, switched to eval mode, and returned. All folded BatchNorm layers
+    are replaced with nn.Identity so the model remains torch.jit.script compatible. Training
+    the model after this is not sensible, BN statistics are gone.
+
+    Args:
+        model: a GenEfficientNet or MobileNetV3 model (or the result of as_sequential())
+    Returns:
+        the fused model
+    """
+    model.eval()
+    for m in list(model.modules()):
+        if isinstance(m, nn.Sequential):
+            _fuse_sequential(m)
+            continue
+        for module_type, pairs in _FUSE_PAIRS:
+            if isinstance(m, module_type):
+                for conv_name, bn_name in pairs:
+                    bn = getattr(m, bn_name)
+                    if isinstance(bn, nn.BatchNorm2d):
+                        fuse_conv_bn(getattr(m, conv_name), bn)
+                        setattr(m, bn_name, nn.Identity())
+                break
+    return model
@@ -26,10 +26,12 @@ A generic MobileNet class with building blocks to support a variety of models:
 
 Hacked together by Ross Wightman
 """
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from .helpers import load_pretrained
+from .helpers import load_pretrained, model_init_context
+from .registry import default_cfgs, get_model_cfg
 from .efficientnet_builder import *
 
 __all__ = ['GenEfficientNet', 'mnasnet_050', 'mnasnet_075', 'mnasnet_100', 'mnasnet_b1', 'mnasnet_140',
@@ -53,161 +55,9 @@ __all__ = ['GenEfficientNet', 'mnasnet_050', 'mnasnet_075', 'mnasnet_100', 'mnas
            'tf_efficientnet_lite4',
            'mixnet_s', 'mixnet_m', 'mixnet_l', 'mixnet_xl', 'tf_mixnet_s', 'tf_mixnet_m', 'tf_mixnet_l']
 
+# pretrained weight urls, kept for backwards compatibility, the registry default_cfgs are the source
+model_urls = {k: v['url'] for k, v in default_cfgs.items() if v['module'] == 'gen_efficientnet'}
 
-model_urls = {
-    'mnasnet_050': None,
-    'mnasnet_075': None,
-    'mnasnet_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mnasnet_b1-74cb7081.pth',
-    'mnasnet_140': None,
-    'mnasnet_small': None,
-
-    'semnasnet_050': None,
-    'semnasnet_075': None,
-    'semnasnet_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mnasnet_a1-d9418771.pth',
-    'semnasnet_140': None,
-
-    'mobilenetv2_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_100_ra-b33bc2c4.pth',
-    'mobilenetv2_110d':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_110d_ra-77090ade.pth',
-    'mobilenetv2_120d':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_120d_ra-5987e2ed.pth',
-    'mobilenetv2_140':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_140_ra-21a4e913.pth',
-
-    'fbnetc_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/fbnetc_100-c345b898.pth',
-    'spnasnet_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/spnasnet_100-048bc3f4.pth',
-
-    'efficientnet_b0':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b0_ra-3dd342df.pth',
-    'efficientnet_b1':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b1-533bc792.pth',
-    'efficientnet_b2':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b2_ra-bcdf34b7.pth',
-    'efficientnet_b3':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b3_ra-a5e2fbc7.pth',
-    'efficientnet_b4': None,
-    'efficientnet_b5': None,
-    'efficientnet_b6': None,
-    'efficientnet_b7': None,
-    'efficientnet_b8': None,
-    'efficientnet_l2': None,
-
-    'efficientnet_es':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_es_ra-f111e99c.pth',
-    'efficientnet_em': None,
-    'efficientnet_el': None,
-
-    'efficientnet_cc_b0_4e': None,
-    'efficientnet_cc_b0_8e': None,
-    'efficientnet_cc_b1_8e': None,
-
-    'efficientnet_lite0': None,
-    'efficientnet_lite1': None,
-    'efficientnet_lite2': None,
-    'efficientnet_lite3': None,
-    'efficientnet_lite4': None,
-
-    'tf_efficientnet_b0':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b0_aa-827b6e33.pth',
-    'tf_efficientnet_b1':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b1_aa-ea7a6ee0.pth',
-    'tf_efficientnet_b2':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b2_aa-60c94f97.pth',
-    'tf_efficientnet_b3':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b3_aa-84b4657e.pth',
-    'tf_efficientnet_b4':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b4_aa-818f208c.pth',
-    'tf_efficientnet_b5':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b5_ra-9a3e5369.pth',
-    'tf_efficientnet_b6':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b6_aa-80ba17e4.pth',
-    'tf_efficientnet_b7':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b7_ra-6c08e654.pth',
-    'tf_efficientnet_b8':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b8_ra-572d5dd9.pth',
-
-    'tf_efficientnet_b0_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b0_ap-f262efe1.pth',
-    'tf_efficientnet_b1_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b1_ap-44ef0a3d.pth',
-    'tf_efficientnet_b2_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b2_ap-2f8e7636.pth',
-    'tf_efficientnet_b3_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b3_ap-aad25bdd.pth',
-    'tf_efficientnet_b4_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b4_ap-dedb23e6.pth',
-    'tf_efficientnet_b5_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b5_ap-9e82fae8.pth',
-    'tf_efficientnet_b6_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b6_ap-4ffb161f.pth',
-    'tf_efficientnet_b7_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b7_ap-ddb28fec.pth',
-    'tf_efficientnet_b8_ap':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b8_ap-00e169fa.pth',
-
-    'tf_efficientnet_b0_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b0_ns-c0e6a31c.pth',
-    'tf_efficientnet_b1_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b1_ns-99dd0c41.pth',
-    'tf_efficientnet_b2_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b2_ns-00306e48.pth',
-    'tf_efficientnet_b3_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b3_ns-9d44bf68.pth',
-    'tf_efficientnet_b4_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b4_ns-d6313a46.pth',
-    'tf_efficientnet_b5_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b5_ns-6f26d0cf.pth',
-    'tf_efficientnet_b6_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b6_ns-51548356.pth',
-    'tf_efficientnet_b7_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b7_ns-1dbc32de.pth',
-    'tf_efficientnet_l2_ns_475':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_l2_ns_475-bebbd00a.pth',
-    'tf_efficientnet_l2_ns':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_l2_ns-df73bb44.pth',
-
-    'tf_efficientnet_es':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_es-ca1afbfe.pth',
-    'tf_efficientnet_em':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_em-e78cfe58.pth',
-    'tf_efficientnet_el':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_el-5143854e.pth',
-
-    'tf_efficientnet_cc_b0_4e':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_cc_b0_4e-4362b6b2.pth',
-    'tf_efficientnet_cc_b0_8e':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_cc_b0_8e-66184a25.pth',
-    'tf_efficientnet_cc_b1_8e':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_cc_b1_8e-f7c79ae1.pth',
-
-    'tf_efficientnet_lite0':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite0-0aa007d2.pth',
-    'tf_efficientnet_lite1':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite1-bde8b488.pth',
-    'tf_efficientnet_lite2':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite2-dcccb7df.pth',
-    'tf_efficientnet_lite3':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite3-b733e338.pth',
-    'tf_efficientnet_lite4':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite4-741542c3.pth',
-
-    'mixnet_s': 'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_s-a907afbc.pth',
-    'mixnet_m': 'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_m-4647fc68.pth',
-    'mixnet_l': 'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_l-5a9a2ed8.pth',
-    'mixnet_xl': 'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_xl_ra-aac3c00c.pth',
-
-    'tf_mixnet_s':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mixnet_s-89d3354b.pth',
-    'tf_mixnet_m':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mixnet_m-0f4d8805.pth',
-    'tf_mixnet_l':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mixnet_l-6c92e0c8.pth',
-}
 
 
 class GenEfficientNet(nn.Module):
@@ -225,9 +75,10 @@ class GenEfficientNet(nn.Module):
                  channel_multiplier=1.0, channel_divisor=8, channel_min=None,
                  pad_type='', act_layer=nn.ReLU, drop_rate=0., drop_connect_rate=0.,
                  se_kwargs=None, norm_layer=nn.BatchNorm2d, norm_kwargs=None,
-                 weight_init='goog'):
+                 weight_init='goog', channels_last=False):
         super(GenEfficientNet, self).__init__()
         self.drop_rate = drop_rate
+        self.channels_last = channels_last
 
         if not fix_stem:
             stem_size = round_channels(stem_size, channel_multiplier, channel_divisor, channel_min)
@@ -248,13 +99,16 @@ class GenEfficientNet(nn.Module):
         self.global_pool = nn.AdaptiveAvgPool2d(1)
         self.classifier = nn.Linear(num_features, num_classes)
 
-        for n, m in self.named_modules():
-            if weight_init == 'goog':
-                initialize_weight_goog(m, n)
-            else:
-                initialize_weight_default(m, n)
+        if weight_init != 'skip':  # skip when the weights are going to be overwritten (loaded) anyways
+            for n, m in self.named_modules():
+                if weight_init == 'goog':
+                    initialize_weight_goog(m, n)
+                else:
+                    initialize_weight_default(m, n)
 
     def features(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         x = self.conv_stem(x)
         x = self.bn1(x)
         x = self.act1(x)
@@ -282,12 +136,28 @@ class GenEfficientNet(nn.Module):
 
 
 def _create_model(model_kwargs, variant, pretrained=False):
+    default_cfg = get_model_cfg(variant)
+    url = default_cfg['url']
     as_sequential = model_kwargs.pop('as_sequential', False)
-    model = GenEfficientNet(**model_kwargs)
+    mmap = model_kwargs.pop('mmap', False)
+    init = model_kwargs.pop('init', '')
+    init_fn = initialize_weight_default if model_kwargs.get('weight_init', 'goog') == 'default' \
+        else initialize_weight_goog
+    if pretrained and not url:
+        init = ''  # nothing to load, regular init required
+    if init or (pretrained and url):
+        model_kwargs['weight_init'] = 'skip'
+    with model_init_context(init):
+        model = GenEfficientNet(**model_kwargs)
     if pretrained:
-        load_pretrained(model, model_urls[variant])
+        load_pretrained(model, url, mmap=mmap, init_fn=init_fn)
+    if model.channels_last:
+        # after weight loading, bound or loaded weights are in default (contiguous) format
+        model = model.to(memory_format=torch.channels_last)
+    model.default_cfg = default_cfg
     if as_sequential:
         model = model.as_sequential()
+        model.default_cfg = default_cfg
     return model
 
 
@@ -1,39 +1,117 @@
 import torch
+import hashlib
 import os
 from collections import OrderedDict
+from contextlib import contextmanager
+from .weight_store import is_weight_store, load_weights, save_weights, bind_weights, get_weight_store_dir
 try:
     from torch.hub import load_state_dict_from_url
 except ImportError:
     from torch.utils.model_zoo import load_url as load_state_dict_from_url
 
 
+def _is_meta(model):
+    return any(t.device.type == 'meta' for t in model.parameters())
+
+
+@contextmanager
+def model_init_context(init=''):
+    """ Context for model construction when all weights will be loaded right after
+
+    Nothing process global is patched, models built concurrently in other threads are not affected.
+    The model init pass (goog / default) is skipped by the caller with `weight_init='skip'` in both modes.
+
+    Args:
+        init: '' for regular construction, 'skip' to skip the model init pass, 'meta' to create parameters and
+            buffers on the meta device (no storage), they are materialized when the weights are bound (see
+            weight_store.bind_weights). The torch.device('meta') default device is thread local.
+    """
+    if not init:
+        yield
+        return
+    assert init in ('skip', 'meta'), 'Unknown init mode (%s)' % init
+    if init == 'meta':
+        with torch.device('meta'):
+            yield
+    else:
+        yield
+
+
+def _load_state_dict(model, state_dict, strict=True):
+    # meta device models cannot be loaded into, their parameters are bound to the state dict tensors
+    if _is_meta(model):
+        return bind_weights(model, state_dict, strict=strict)
+    return model.load_state_dict(state_dict, strict=strict)
+
+
+def _checkpoint_state_dict(checkpoint):
+    if isinstance(checkpoint, dict) and 'state_dict' in checkpoint:
+        new_state_dict = OrderedDict()
+        for k, v in checkpoint['state_dict'].items():
+            if k.startswith('module'):
+                name = k[7:]  # remove `module.`
+            else:
+                name = k
+            new_state_dict[name] = v
+        return new_state_dict
+    return checkpoint
+
+
 def load_checkpoint(model, checkpoint_path):
-    if checkpoint_path and os.path.isfile(checkpoint_path):
+    if is_weight_store(checkpoint_path):
+        print("=> Binding weight store '{}'".format(checkpoint_path))
+        bind_weights(model, load_weights(checkpoint_path))
+    elif checkpoint_path and os.path.isfile(checkpoint_path):
         print("=> Loading checkpoint '{}'".format(checkpoint_path))
-        checkpoint = torch.load(checkpoint_path)
-        if isinstance(checkpoint, dict) and 'state_dict' in checkpoint:
-            new_state_dict = OrderedDict()
-            for k, v in checkpoint['state_dict'].items():
-                if k.startswith('module'):
-                    name = k[7:]  # remove `module.`
-                else:
-                    name = k
-                new_state_dict[name] = v
-            model.load_state_dict(new_state_dict)
-        else:
-            model.load_state_dict(checkpoint)
+        _load_state_dict(model, _checkpoint_state_dict(torch.load(checkpoint_path)))
         print("=> Loaded checkpoint '{}'".format(checkpoint_path))
     else:
         print("=> Error: No checkpoint found at '{}'".format(checkpoint_path))
         raise FileNotFoundError()
 
 
-def load_pretrained(model, url, filter_fn=None, strict=True):
+def checkpoint_weight_store(checkpoint_path):
+    """ Convert a checkpoint file (once) to a weight store in the weight store dir, returns the store path
+
+    The store name includes a hash of the checkpoint path, size and mtime, so a changed checkpoint or another
+    one with the same file name gets its own store. Weight stores are returned as is.
+    """
+    if is_weight_store(checkpoint_path):
+        return checkpoint_path
+    stat = os.stat(checkpoint_path)
+    tag = '{}:{}:{}'.format(os.path.abspath(checkpoint_path), stat.st_size, stat.st_mtime_ns)
+    name = os.path.basename(checkpoint_path).split('.')[0]
+    store_path = os.path.join(get_weight_store_dir(), '{}-{}'.format(name, hashlib.sha1(tag.encode()).hexdigest()[:8]))
+    if not is_weight_store(store_path):
+        print("=> Converting checkpoint '{}' to weight store '{}'".format(checkpoint_path, store_path))
+        save_weights(_checkpoint_state_dict(torch.load(checkpoint_path, map_location='cpu')), store_path)
+    return store_path
+
+
+def _pretrained_store_path(url):
+    filename = os.path.basename(url.split('?')[0])
+    return os.path.join(get_weight_store_dir(), os.path.splitext(filename)[0])
+
+
+def load_pretrained(model, url, filter_fn=None, strict=True, mmap=False, init_fn=None):
+    """ Load pretrained weights from `url`
+
+    With `mmap`, the weights are converted (once) to a weight store in the weight store dir, memory-mapped
+    and the model parameters are bound to them without a copy. Parameters that end up without pretrained
+    weights (a discarded input conv or classifier) are initialized with `init_fn(module, name)` if given.
+    """
     if not url:
         print("=> Warning: Pretrained model URL is empty, using random initialization.")
         return
 
-    state_dict = load_state_dict_from_url(url, progress=False, map_location='cpu')
+    if mmap:
+        store_path = _pretrained_store_path(url)
+        if not is_weight_store(store_path):
+            print("=> Converting pretrained weights to weight store '{}'".format(store_path))
+            save_weights(load_state_dict_from_url(url, progress=False, map_location='cpu'), store_path)
+        state_dict = load_weights(store_path)
+    else:
+        state_dict = load_state_dict_from_url(url, progress=False, map_location='cpu')
 
     input_conv = 'conv_stem'
     classifier = 'classifier'
@@ -65,4 +143,14 @@ def load_pretrained(model, url, filter_fn=None, strict=True):
     if filter_fn is not None:
         state_dict = filter_fn(state_dict)
 
-    model.load_state_dict(state_dict, strict=strict)
+    if mmap:
+        missing_keys, _ = bind_weights(model, state_dict, strict=strict)
+    else:
+        missing_keys, _ = _load_state_dict(model, state_dict, strict=strict)
+    if init_fn is not None and missing_keys:
+        missing_modules = set(k.rsplit('.', 1)[0] for k in missing_keys)
+        for n, m in model.named_modules():
+            if n in missing_modules:
+                if hasattr(m, 'reset_running_stats'):
+                    m.reset_running_stats()
+                init_fn(m, n)
@@ -6,10 +6,12 @@ Paper: Searching for MobileNetV3 - https://arxiv.org/abs/1905.02244
 
 Hacked together by Ross Wightman
 """
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from .helpers import load_pretrained
+from .helpers import load_pretrained, model_init_context
+from .registry import default_cfgs, get_model_cfg
 from .efficientnet_builder import *
 
 __all__ = ['mobilenetv3_rw', 'mobilenetv3_large_075', 'mobilenetv3_large_100', 'mobilenetv3_large_minimal_100',
@@ -17,29 +19,8 @@ __all__ = ['mobilenetv3_rw', 'mobilenetv3_large_075', 'mobilenetv3_large_100', '
            'tf_mobilenetv3_large_075', 'tf_mobilenetv3_large_100', 'tf_mobilenetv3_large_minimal_100',
            'tf_mobilenetv3_small_075', 'tf_mobilenetv3_small_100', 'tf_mobilenetv3_small_minimal_100']
 
-model_urls = {
-    'mobilenetv3_rw':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv3_100-35495452.pth',
-    'mobilenetv3_large_075': None,
-    'mobilenetv3_large_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv3_large_100_ra-f55367f5.pth',
-    'mobilenetv3_large_minimal_100': None,
-    'mobilenetv3_small_075': None,
-    'mobilenetv3_small_100': None,
-    'mobilenetv3_small_minimal_100': None,
-    'tf_mobilenetv3_large_075':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_large_075-150ee8b0.pth',
-    'tf_mobilenetv3_large_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_large_100-427764d5.pth',
-    'tf_mobilenetv3_large_minimal_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_large_minimal_100-8596ae28.pth',
-    'tf_mobilenetv3_small_075':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_small_075-da427f52.pth',
-    'tf_mobilenetv3_small_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_small_100-37f49e2b.pth',
-    'tf_mobilenetv3_small_minimal_100':
-        'https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_small_minimal_100-922a7843.pth',
-}
+# pretrained weight urls, kept for backwards compatibility, the registry default_cfgs are the source
+model_urls = {k: v['url'] for k, v in default_cfgs.items() if v['module'] == 'mobilenetv3'}
 
 
 class MobileNetV3(nn.Module):
@@ -53,9 +34,11 @@ class MobileNetV3(nn.Module):
 
     def __init__(self, block_args, num_classes=1000, in_chans=3, stem_size=16, num_features=1280, head_bias=True,
                  channel_multiplier=1.0, pad_type='', act_layer=HardSwish, drop_rate=0., drop_connect_rate=0.,
-                 se_kwargs=None, norm_layer=nn.BatchNorm2d, norm_kwargs=None, weight_init='goog'):
+                 se_kwargs=None, norm_layer=nn.BatchNorm2d, norm_kwargs=None, weight_init='goog',
+                 channels_last=False):
         super(MobileNetV3, self).__init__()
         self.drop_rate = drop_rate
+        self.channels_last = channels_last
 
         stem_size = round_channels(stem_size, channel_multiplier)
         self.conv_stem = select_conv2d(in_chans, stem_size, 3, stride=2, padding=pad_type)
@@ -74,11 +57,12 @@ class MobileNetV3(nn.Module):
         self.act2 = act_layer(inplace=True)
         self.classifier = nn.Linear(num_features, num_classes)
 
-        for m in self.modules():
-            if weight_init == 'goog':
-                initialize_weight_goog(m)
-            else:
-                initialize_weight_default(m)
+        if weight_init != 'skip':  # skip when the weights are going to be overwritten (loaded) anyways
+            for m in self.modules():
+                if weight_init == 'goog':
+                    initialize_weight_goog(m)
+                else:
+                    initialize_weight_default(m)
 
     def as_sequential(self):
         layers = [self.conv_stem, self.bn1, self.act1]
@@ -89,6 +73,8 @@ class MobileNetV3(nn.Module):
         return nn.Sequential(*layers)
 
     def features(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         x = self.conv_stem(x)
         x = self.bn1(x)
         x = self.act1(x)
@@ -107,12 +93,28 @@ class MobileNetV3(nn.Module):
 
 
 def _create_model(model_kwargs, variant, pretrained=False):
+    default_cfg = get_model_cfg(variant)
+    url = default_cfg['url']
     as_sequential = model_kwargs.pop('as_sequential', False)
-    model = MobileNetV3(**model_kwargs)
-    if pretrained and model_urls[variant]:
-        load_pretrained(model, model_urls[variant])
+    mmap = model_kwargs.pop('mmap', False)
+    init = model_kwargs.pop('init', '')
+    init_fn = initialize_weight_default if model_kwargs.get('weight_init', 'goog') == 'default' \
+        else initialize_weight_goog
+    if pretrained and not url:
+        init = ''  # nothing to load, regular init required
+    if init or (pretrained and url):
+        model_kwargs['weight_init'] = 'skip'
+    with model_init_context(init):
+        model = MobileNetV3(**model_kwargs)
+    if pretrained and url:
+        load_pretrained(model, url, mmap=mmap, init_fn=init_fn)
+    if model.channels_last:
+        # after weight loading, bound or loaded weights are in default (contiguous) format
+        model = model.to(memory_format=torch.channels_last)
+    model.default_cfg = default_cfg
     if as_sequential:
         model = model.as_sequential()
+        model.default_cfg = default_cfg
     return model
 
 
@@ -1,5 +1,4 @@
-from .mobilenetv3 import *
-from .gen_efficientnet import *
+from .registry import is_model, model_entrypoint
 from .helpers import load_checkpoint
 
 
@@ -12,9 +11,14 @@ def create_model(
         **kwargs):
 
     margs = dict(num_classes=num_classes, in_chans=in_chans, pretrained=pretrained)
+    if kwargs.get('init', '') and not (pretrained or checkpoint_path):
+        raise RuntimeError('Model init mode (%s) requires pretrained or checkpoint_path' % kwargs['init'])
+    if checkpoint_path and not pretrained:
+        # all weights come from the checkpoint, no point in a random init first
+        kwargs.setdefault('weight_init', 'skip')
 
-    if model_name in globals():
-        create_fn = globals()[model_name]
+    if is_model(model_name):
+        create_fn = model_entrypoint(model_name)
         model = create_fn(**margs, **kwargs)
     else:
         raise RuntimeError('Unknown model (%s)' % model_name)
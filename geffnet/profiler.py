@@ -0,0 +1,307 @@
+""" Per-block latency and cost profiler
+
+Attaches forward hooks to every block built by EfficientNetBuilder (`model.blocks[stage][block]`) and records
+for each block its wall time, MAdds (conv + linear multiply-adds), parameter count and activation bytes (outputs
+of the leaf layers inside the block). Each block is described in arch_def terms (block type, kernel size(s),
+stride, expansion ratio, SE, CondConv experts and output channels), ie `ir_k3.5.7_s2_e6_c40_se`, so the cost
+can be traced back to the arch_def entries in `_gen_efficientnet`, `_gen_mixnet_m`, `_gen_mobilenet_v3`, etc.
+
+Timing and counting are separate passes, the per-layer hooks of the counting pass don't skew the timings.
+
+Usage:
+    records = profile_blocks(model, torch.randn(1, 3, 224, 224))
+    print(format_table(aggregate(records, by=('type', 'kernel_size'))))
+    write_chrome_trace(records, 'trace.json')  # open in chrome://tracing or Perfetto
+
+or from the command line:
+    python -m geffnet.profiler --model mixnet_m --by type kernel_size --trace trace.json
+"""
+import argparse
+import json
+import time
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+
+from .conv2d_layers import MixedConv2d, CondConv2d
+from .efficientnet_builder import ConvBnAct, DepthwiseSeparableConv, InvertedResidual, CondConvResidual, \
+    EdgeResidual
+from .model_factory import create_model
+from .registry import get_model_cfg
+
+__all__ = ['block_info', 'profile_blocks', 'aggregate', 'format_table', 'write_chrome_trace']
+
+_BLOCK_COLUMNS = [
+    'name', 'arch', 'time_ms', 'time_pct', 'madds', 'params', 'act_bytes', 'out_shape']
+_AGG_COLUMNS = ['count', 'time_ms', 'time_pct', 'madds', 'params', 'act_bytes']
+
+
+def _kernel_size(conv):
+    if isinstance(conv, MixedConv2d):
+        return '.'.join(str(c.kernel_size[0]) for c in conv.values())
+    return str(conv.kernel_size[0])
+
+
+def _stride(conv):
+    return conv.stride[0]
+
+
+def block_info(block):
+    """ arch_def style description of a block (type, kernel size, stride, expansion, SE, experts, out chs) """
+    se = not isinstance(getattr(block, 'se', nn.Identity()), nn.Identity)
+    experts = 0
+    if isinstance(block, InvertedResidual):
+        block_type = 'ir'
+        dw = block.conv_dw
+        exp_ratio = block.conv_pw.out_channels / block.conv_pw.in_channels
+        out_chs = block.conv_pwl.out_channels
+        if isinstance(block, CondConvResidual):
+            experts = block.num_experts
+    elif isinstance(block, DepthwiseSeparableConv):
+        block_type = 'dsa' if not isinstance(block.act2, nn.Identity) else 'ds'
+        dw = block.conv_dw
+        exp_ratio = 1.
+        out_chs = block.conv_pw.out_channels
+    elif isinstance(block, EdgeResidual):
+        block_type = 'er'
+        dw = block.conv_exp
+        exp_ratio = block.conv_exp.out_channels / block.conv_exp.in_channels
+        out_chs = block.conv_pwl.out_channels
+    elif isinstance(block, ConvBnAct):
+        block_type = 'cn'
+        dw = block.conv
+        exp_ratio = 1.
+        out_chs = block.conv.out_channels
+    else:
+        block_type = type(block).__name__
+        return dict(type=block_type, kernel_size='', stride=0, exp_ratio=0., se=se, experts=0, arch=block_type)
+    # stride of an EdgeResidual is on its pwl conv
+    stride = _stride(block.conv_pwl) if block_type == 'er' else _stride(dw)
+    info = dict(
+        type=block_type, kernel_size=_kernel_size(dw), stride=stride, exp_ratio=round(exp_ratio, 2),
+        se=se, experts=experts)
+    arch = '{}_k{}_s{}'.format(block_type, info['kernel_size'], stride)
+    if block_type in ('ir', 'er'):
+        arch += '_e{:g}'.format(info['exp_ratio'])
+    arch += '_c{}'.format(out_chs)
+    if se:
+        arch += '_se'
+    if experts:
+        arch += '_cc{}'.format(experts)
+    info['arch'] = arch
+    return info
+
+
+def _named_blocks(model):
+    for stage_idx, stage in enumerate(model.blocks):
+        for block_idx, block in enumerate(stage):
+            yield stage_idx, block_idx, 'blocks.%d.%d' % (stage_idx, block_idx), block
+
+
+def _leaf_madds(module, output):
+    """ multiply-adds of a conv / linear layer for its output (whole batch) """
+    if isinstance(module, MixedConv2d):
+        out_hw = output.shape[-2] * output.shape[-1]
+        return output.shape[0] * out_hw * sum(
+            c.out_channels * c.in_channels // c.groups * c.kernel_size[0] * c.kernel_size[1] for c in module.values())
+    if isinstance(module, (nn.Conv2d, CondConv2d)):
+        return output.numel() * module.in_channels // module.groups * module.kernel_size[0] * module.kernel_size[1]
+    if isinstance(module, nn.Linear):
+        return output.numel() * module.in_features
+    return 0
+
+
+def _leaf_modules(module):
+    """ modules w/o children, MixedConv2d counts as a leaf (its fused path bypasses the child convs) """
+    if isinstance(module, MixedConv2d) or not len(module._modules):
+        yield module
+        return
+    for m in module.children():
+        yield from _leaf_modules(m)
+
+
+def _count_costs(model, x):
+    """ MAdds and leaf activation bytes per block, per sample, from one forward pass w/ per-layer hooks """
+    costs = {}
+    handles = []
+
+    def _make_hook(name):
+        def _hook(module, inputs, output):
+            c = costs[name]
+            c['madds'] += _leaf_madds(module, output) // output.shape[0]
+            c['act_bytes'] += output.numel() * output.element_size() // output.shape[0]
+        return _hook
+
+    for _, _, name, block in _named_blocks(model):
+        costs[name] = dict(madds=0, act_bytes=0)
+        for m in _leaf_modules(block):
+            handles.append(m.register_forward_hook(_make_hook(name)))
+    try:
+        with torch.no_grad():
+            model(x)
+    finally:
+        for h in handles:
+            h.remove()
+    return costs
+
+
+def profile_blocks(model, x, warmup=3, iters=10):
+    """ Profile the blocks of a GenEfficientNet / MobileNetV3 model on input `x`
+
+    Returns:
+        list of per block records (dicts), in execution order. Times (ms) are means over `iters` passes, MAdds
+        and activation bytes are per sample. `start_us` is the block start offset in the last pass, relative to
+        the start of the forward.
+    """
+    model.eval()
+    sync = torch.cuda.synchronize if x.is_cuda else lambda: None
+    blocks = list(_named_blocks(model))
+    timings = {name: [] for _, _, name, _ in blocks}
+    starts = {}
+    shapes = {}
+    handles = []
+
+    def _pre_hook(name):
+        def _hook(module, inputs):
+            sync()
+            starts[name] = time.perf_counter()
+        return _hook
+
+    def _post_hook(name):
+        def _hook(module, inputs, output):
+            sync()
+            timings[name].append(time.perf_counter() - starts[name])
+            shapes[name] = tuple(output.shape[1:])
+        return _hook
+
+    for _, _, name, block in blocks:
+        handles.append(block.register_forward_pre_hook(_pre_hook(name)))
+        handles.append(block.register_forward_hook(_post_hook(name)))
+
+    total_times = []
+    try:
+        with torch.no_grad():
+            for _ in range(warmup):
+                model(x)
+            for t in timings.values():
+                t.clear()
+            for _ in range(iters):
+                sync()
+                forward_start = time.perf_counter()
+                model(x)
+                sync()
+                total_times.append(time.perf_counter() - forward_start)
+    finally:
+        for h in handles:
+            h.remove()
+
+    costs = _count_costs(model, x)
+    total_ms = 1000. * sum(total_times) / len(total_times)
+    records = []
+    for stage_idx, block_idx, name, block in blocks:
+        time_ms = 1000. * sum(timings[name]) / len(timings[name])
+        record = OrderedDict(name=name, stage=stage_idx, block=block_idx)
+        record.update(block_info(block))
+        record.update(
+            time_ms=time_ms, time_pct=100. * time_ms / total_ms, madds=costs[name]['madds'],
+            params=sum(p.numel() for p in block.parameters()), act_bytes=costs[name]['act_bytes'],
+            out_shape='x'.join(str(s) for s in shapes[name]),
+            start_us=1e6 * (starts[name] - forward_start), total_ms=total_ms)
+        records.append(record)
+    return records
+
+
+def aggregate(records, by=('type',)):
+    """ Sum the block records grouped by the given keys (ie 'type', 'kernel_size', 'exp_ratio', 'se', 'stage') """
+    groups = OrderedDict()
+    for r in records:
+        key = tuple(r[k] for k in by)
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = OrderedDict((k, r[k]) for k in by)
+            g.update(count=0, time_ms=0., time_pct=0., madds=0, params=0, act_bytes=0)
+        g['count'] += 1
+        for k in ('time_ms', 'time_pct', 'madds', 'params', 'act_bytes'):
+            g[k] += r[k]
+    return sorted(groups.values(), key=lambda g: g['time_ms'], reverse=True)
+
+
+def format_table(rows, columns=None):
+    """ Plain text table of records or aggregates """
+    if not rows:
+        return ''
+    columns = columns or list(rows[0].keys())
+
+    def _fmt(v):
+        if isinstance(v, float):
+            return '%.3f' % v
+        return str(v)
+
+    cells = [[_fmt(r[c]) for c in columns] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    lines = ['  '.join(c.rjust(w) for c, w in zip(columns, widths))]
+    lines.extend('  '.join(v.rjust(w) for v, w in zip(row, widths)) for row in cells)
+    return '\n'.join(lines)
+
+
+def write_chrome_trace(records, path):
+    """ Write the block timings of the last profiled pass as a Chrome trace (chrome://tracing, Perfetto) """
+    events = []
+    for r in records:
+        events.append(dict(
+            name=r['arch'], cat='stage%d' % r['stage'], ph='X', ts=r['start_us'], dur=1000. * r['time_ms'],
+            pid=0, tid=r['stage'], args=dict(
+                block=r['name'], madds=r['madds'], params=r['params'], act_bytes=r['act_bytes'],
+                out_shape=r['out_shape'])))
+    with open(path, 'w') as f:
+        json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-block Profiler')
+    parser.add_argument('--model', '-m', metavar='MODEL', default='efficientnet_b0',
+                        help='model architecture (default: efficientnet_b0)')
+    parser.add_argument('-b', '--batch-size', default=1, type=int, metavar='N',
+                        help='mini-batch size (default: 1)')
+    parser.add_argument('--img-size', default=0, type=int, metavar='N',
+                        help='input image dimension, 0 for the model\'s native resolution (default: 0)')
+    parser.add_argument('--warmup', default=3, type=int, metavar='N',
+                        help='number of warmup iterations (default: 3)')
+    parser.add_argument('--iters', default=10, type=int, metavar='N',
+                        help='number of timed iterations (default: 10)')
+    parser.add_argument('--num-threads', default=0, type=int, metavar='N',
+                        help='number of torch threads, 0 to leave as is (default: 0)')
+    parser.add_argument('--device', default='cpu', type=str,
+                        help='torch device (default: cpu)')
+    parser.add_argument('--by', default=['type'], type=str, nargs='+',
+                        help='keys to aggregate blocks by: type kernel_size stride exp_ratio se experts stage')
+    parser.add_argument('--trace', default='', type=str, metavar='PATH',
+                        help='write a Chrome trace JSON of the block timings')
+    parser.add_argument('--json', default='', type=str, metavar='PATH',
+                        help='write the per block records to a JSON file')
+    args = parser.parse_args(argv)
+
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+    model = create_model(args.model).to(args.device)
+    img_size = args.img_size or get_model_cfg(args.model)['input_size'][-1]
+    x = torch.randn(args.batch_size, 3, img_size, img_size, device=args.device)
+    records = profile_blocks(model, x, warmup=args.warmup, iters=args.iters)
+
+    print(format_table(records, _BLOCK_COLUMNS))
+    print()
+    print(format_table(aggregate(records, by=args.by), list(args.by) + _AGG_COLUMNS))
+    blocks_ms = sum(r['time_ms'] for r in records)
+    total_ms = records[0]['total_ms'] if records else 0.
+    print('\nBlocks {:.3f} ms of {:.3f} ms total ({:.1f}%), stem / head / classifier {:.3f} ms'.format(
+        blocks_ms, total_ms, 100. * blocks_ms / max(total_ms, 1e-9), total_ms - blocks_ms))
+    if args.trace:
+        write_chrome_trace(records, args.trace)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(records, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+""" Post-training static INT8 quantization
+
+Prepares the ReLU / ReLU6 / HardSwish models (EfficientNet-Lite, MobileNet-V2/V3, MNASNet, FBNet, SPNASNet,
+etc) for eager mode or FX graph mode static quantization with the torch.ao.quantization APIs (PyTorch >= 2.0).
+
+The float model is first made quantization friendly:
+ * Conv2dSame ('SAME' padding, tf_* models) layers are replaced by Conv2d w/ static padding for a fixed input size
+ * HardSwish / HardSigmoid / Sigmoid layers and SE gate fns are replaced by their torch.nn equivalents
+Eager mode then folds BN into the convs, fuses conv + ReLU pairs, swaps the blocks for variants that do the
+residual add and SE multiply with FloatFunctional and wraps the model in quant / dequant stubs. FX mode traces
+the model and handles all of that itself.
+
+Usage:
+    model = prepare(geffnet.create_model('tf_efficientnet_lite0', pretrained=True), input_size=224)
+    calibrate(model, loader, num_batches=32)
+    model = convert(model)
+"""
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .activations import HardSwish, HardSigmoid, Sigmoid, hard_sigmoid, sigmoid
+from .conv2d_layers import Conv2dSame, MixedConv2d, CondConv2d, set_same_padding_input_size
+from .efficientnet_builder import SqueezeExcite, ConvBnAct, DepthwiseSeparableConv, InvertedResidual, \
+    CondConvResidual, EdgeResidual
+from .fuse import fuse_for_inference
+from .gen_efficientnet import GenEfficientNet
+from .mobilenetv3 import MobileNetV3
+
+__all__ = ['prepare', 'calibrate', 'convert', 'quantize_model', 'make_quantizable']
+
+
+class QuantizableSqueezeExcite(SqueezeExcite):
+    """ SqueezeExcite w/ the gate as a module and a FloatFunctional multiply """
+
+    def forward(self, x):
+        x_se = self.avg_pool(x)
+        x_se = self.conv_reduce(x_se)
+        x_se = self.act1(x_se)
+        x_se = self.conv_expand(x_se)
+        return self.skip_mul.mul(x, self.gate(x_se))
+
+
+class QuantizableDepthwiseSeparableConv(DepthwiseSeparableConv):
+    """ DepthwiseSeparableConv w/ a FloatFunctional residual add """
+
+    def forward(self, x):
+        residual = x
+        x = self.conv_dw(x)
+        x = self.bn1(x)
+        x = self.act1(x)
+        x = self.se(x)
+        x = self.conv_pw(x)
+        x = self.bn2(x)
+        x = self.act2(x)
+        if self.has_residual:
+            x = self.skip_add.add(x, residual)
+        return x
+
+
+class QuantizableInvertedResidual(InvertedResidual):
+    """ InvertedResidual w/ a FloatFunctional residual add """
+
+    def forward(self, x):
+        residual = x
+        x = self.conv_pw(x)
+        x = self.bn1(x)
+        x = self.act1(x)
+        x = self.conv_dw(x)
+        x = self.bn2(x)
+        x = self.act2(x)
+        x = self.se(x)
+        x = self.conv_pwl(x)
+        x = self.bn3(x)
+        if self.has_residual:
+            x = self.skip_add.add(x, residual)
+        return x
+
+
+class QuantizableEdgeResidual(EdgeResidual):
+    """ EdgeResidual w/ a FloatFunctional residual add """
+
+    def forward(self, x):
+        residual = x
+        x = self.conv_exp(x)
+        x = self.bn1(x)
+        x = self.act1(x)
+        x = self.se(x)
+        x = self.conv_pwl(x)
+        x = self.bn2(x)
+        if self.has_residual:
+            x = self.skip_add.add(x, residual)
+        return x
+
+
+_QUANTIZABLE_BLOCKS = (
+    (SqueezeExcite, QuantizableSqueezeExcite, 'skip_mul'),
+    (DepthwiseSeparableConv, QuantizableDepthwiseSeparableConv, 'skip_add'),
+    (InvertedResidual, QuantizableInvertedResidual, 'skip_add'),
+    (EdgeResidual, QuantizableEdgeResidual, 'skip_add'),
+)
+
+# (conv, act) attribute name pairs that can be fused into a single quantized conv + relu
+_CONV_ACT_PAIRS = (
+    (GenEfficientNet, (('conv_stem', 'act1'), ('conv_head', 'act2'))),
+    (MobileNetV3, (('conv_stem', 'act1'), ('conv_head', 'act2'))),
+    (SqueezeExcite, (('conv_reduce', 'act1'),)),
+    (ConvBnAct, (('conv', 'act1'),)),
+    (DepthwiseSeparableConv, (('conv_dw', 'act1'), ('conv_pw', 'act2'))),
+    (InvertedResidual, (('conv_pw', 'act1'), ('conv_dw', 'act2'))),
+    (EdgeResidual, (('conv_exp', 'act1'),)),
+)
+
+_ACT_LAYER_MAP = (
+    (HardSwish, nn.Hardswish),
+    (HardSigmoid, nn.Hardsigmoid),
+    (Sigmoid, nn.Sigmoid),
+)
+
+_BACKENDS = ('onednn', 'x86', 'fbgemm', 'qnnpack')
+
+_UNSUPPORTED = (MixedConv2d, CondConv2d, CondConvResidual)
+
+
+def _gate_layer(gate_fn):
+    if gate_fn is hard_sigmoid or gate_fn is F.hardsigmoid:
+        return nn.Hardsigmoid()
+    if gate_fn is sigmoid or gate_fn is torch.sigmoid:
+        return nn.Sigmoid()
+    assert False, 'Unsupported SE gate fn (%s) for quantization' % getattr(gate_fn, '__name__', gate_fn)
+
+
+class _Crop(nn.Module):
+    """ Slice the 'SAME' padding output grid from a conv w/ (over) symmetric padding, see Conv2dSame """
+
+    def __init__(self, offset, output_size):
+        super(_Crop, self).__init__()
+        self.offset = offset
+        self.output_size = output_size
+
+    def forward(self, x):
+        oh, ow = self.offset
+        return x[:, :, oh:oh + self.output_size[0], ow:ow + self.output_size[1]]
+
+
+def _replace_same_convs(model, input_size):
+    # Conv2d w/ the 'SAME' padding precomputed for the fixed input size, quantized pad ops are slow so the
+    # 'slice' scheme of Conv2dSame is used (symmetric padding + crop of the conv output where needed)
+    set_same_padding_input_size(model, input_size, mode='slice')
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if not isinstance(child, Conv2dSame):
+                continue
+            conv = nn.Conv2d(
+                child.in_channels, child.out_channels, child.kernel_size, stride=child.stride,
+                padding=child.static_padding, dilation=child.dilation, groups=child.groups,
+                bias=child.bias is not None)
+            conv.weight = child.weight
+            conv.bias = child.bias
+            if child.static_offset[0] > 0 or child.static_offset[1] > 0:
+                conv = nn.Sequential(conv, _Crop(child.static_offset, child.static_output_size))
+            setattr(module, name, conv)
+
+
+def _replace_activations(model):
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            for act_type, quant_act_type in _ACT_LAYER_MAP:
+                if type(child) is act_type:
+                    setattr(module, name, quant_act_type())
+                    break
+            else:
+                assert not type(child).__module__.startswith('geffnet.activations'), \
+                    'Unsupported activation (%s) for quantization' % type(child).__name__
+
+
+def make_quantizable(model, input_size=None, mode='eager'):
+    """ Convert a float model into a quantization friendly float model (in-place)
+
+    Args:
+        model: a GenEfficientNet or MobileNetV3 model w/ ReLU, ReLU6, HardSwish or HardSigmoid activations
+        input_size: int, (H, W), or (C, H, W) fixed model input size, required for models with 'SAME' padding
+        mode: 'eager' to also fold BN, fuse conv + ReLU and swap in the FloatFunctional blocks, 'fx' for
+            a model that will be traced by FX graph mode quantization
+    Returns:
+        the model
+    """
+    assert mode in ('eager', 'fx')
+    assert isinstance(model, (GenEfficientNet, MobileNetV3)), 'Only GenEfficientNet and MobileNetV3 are supported'
+    for m in model.modules():
+        assert not isinstance(m, _UNSUPPORTED), 'Unsupported layer (%s) for quantization' % type(m).__name__
+    model.eval()
+    if mode == 'eager':
+        fuse_for_inference(model)
+    if any(isinstance(m, Conv2dSame) for m in model.modules()):
+        assert input_size is not None, "A fixed input_size is required to quantize models with 'SAME' padding"
+        _replace_same_convs(model, input_size)
+    _replace_activations(model)
+
+    if mode == 'fx':
+        for m in model.modules():
+            if isinstance(m, SqueezeExcite):
+                m.gate_fn = F.hardsigmoid if isinstance(_gate_layer(m.gate_fn), nn.Hardsigmoid) else torch.sigmoid
+        return model
+
+    fuse_names = []
+    for name, m in model.named_modules():
+        prefix = name + '.' if name else ''
+        for module_type, pairs in _CONV_ACT_PAIRS:
+            if isinstance(m, module_type):
+                for conv_name, act_name in pairs:
+                    conv = getattr(m, conv_name)
+                    if type(getattr(m, act_name)) is nn.ReLU and isinstance(conv, (nn.Conv2d, nn.Sequential)):
+                        conv_name = conv_name + '.0' if isinstance(conv, nn.Sequential) else conv_name
+                        fuse_names.append([prefix + conv_name, prefix + act_name])
+                break
+    if fuse_names:
+        torch.ao.quantization.fuse_modules(model, fuse_names, inplace=True)
+
+    for m in model.modules():
+        for module_type, quant_type, func_name in _QUANTIZABLE_BLOCKS:
+            if type(m) is module_type:
+                if isinstance(m, SqueezeExcite):
+                    m.gate = _gate_layer(m.gate_fn)
+                m.__class__ = quant_type
+                setattr(m, func_name, torch.ao.nn.quantized.FloatFunctional())
+                break
+    return model
+
+
+def prepare(model, backend='', input_size=None, mode='eager'):
+    """ Make a float model quantizable and insert the observers for post-training static quantization
+
+    Args:
+        model: float GenEfficientNet or MobileNetV3 model (modified in-place in eager mode)
+        backend: quantized engine, one of 'onednn', 'x86', 'fbgemm' for x86 CPUs, 'qnnpack' for ARM, the first
+            supported in that order by default. NOTE x86 / fbgemm depthwise convs are very slow w/ padding
+            other than kernel_size // 2, as used for the 'SAME' padded (tf_*) models
+        input_size: int, (H, W), or (C, H, W) fixed model input size, required for models with 'SAME' padding
+        mode: 'eager' or 'fx'
+    Returns:
+        the prepared model, ready for calibration
+    """
+    if not backend:
+        backend = next((b for b in _BACKENDS if b in torch.backends.quantized.supported_engines), None)
+        if backend is None:
+            raise RuntimeError('None of the quantized engines ({}) is supported by this PyTorch build, '
+                               'supported: {}'.format(', '.join(_BACKENDS),
+                                                      ', '.join(torch.backends.quantized.supported_engines)))
+    assert backend in torch.backends.quantized.supported_engines, \
+        'Quantized engine %s is not supported by this PyTorch build' % backend
+    torch.backends.quantized.engine = backend
+    default_cfg = getattr(model, 'default_cfg', None)
+    model = make_quantizable(model, input_size=input_size, mode=mode)
+    if mode == 'fx':
+        from torch.ao.quantization import get_default_qconfig_mapping, quantize_fx
+        if input_size is None:
+            input_size = default_cfg['input_size'] if default_cfg else (3, 224, 224)
+        elif isinstance(input_size, int):
+            input_size = (input_size, input_size)
+        in_chans = next(m for m in model.modules() if isinstance(m, nn.Conv2d)).in_channels
+        example_inputs = (torch.randn((1, in_chans) + tuple(input_size[-2:])),)
+        model = quantize_fx.prepare_fx(model, get_default_qconfig_mapping(backend), example_inputs=example_inputs)
+    else:
+        model = torch.ao.quantization.QuantWrapper(model)
+        model.qconfig = torch.ao.quantization.get_default_qconfig(backend)
+        torch.ao.quantization.prepare(model, inplace=True)
+    if default_cfg is not None:
+        model.default_cfg = default_cfg
+    return model
+
+
+def calibrate(model, loader, num_batches=32, device='cpu'):
+    """ Run `num_batches` batches from `loader` through a prepared model to collect activation ranges
+
+    Returns:
+        the number of images seen
+    """
+    model.eval()
+    num_images = 0
+    with torch.no_grad():
+        for batch_idx, (input, _) in enumerate(loader):
+            if batch_idx >= num_batches:
+                break
+            model(input.to(device))
+            num_images += input.size(0)
+    return num_images
+
+
+def convert(model):
+    """ Convert a prepared and calibrated model to a quantized model
+    """
+    default_cfg = getattr(model, 'default_cfg', None)
+    model.eval()
+    if isinstance(model, torch.fx.GraphModule):
+        from torch.ao.quantization import quantize_fx
+        model = quantize_fx.convert_fx(model)
+    else:
+        torch.ao.quantization.convert(model, inplace=True)
+    if default_cfg is not None:
+        model.default_cfg = default_cfg
+    return model
+
+
+def quantize_model(model, loader, num_batches=32, backend='', input_size=None, mode='eager'):
+    """ prepare, calibrate and convert in one go, returns the quantized model
+    """
+    model = prepare(model, backend=backend, input_size=input_size, mode=mode)
+    calibrate(model, loader, num_batches=num_batches)
+    return convert(model)
@@ -0,0 +1,283 @@
+""" Model Registry
+
+Maps model names to their (lazily imported) entrypoint module and default config: pretrained weight URL and the
+data config (input size, interpolation, crop pct, mean/std) the weights were evaluated with. This module does not
+import torch, model listing and config lookups are cheap, the model modules are only imported on first use.
+"""
+import fnmatch
+import importlib
+import re
+
+__all__ = ['list_models', 'is_model', 'model_entrypoint', 'get_model_cfg']
+
+IMAGENET_DEFAULT_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_DEFAULT_STD = (0.229, 0.224, 0.225)
+IMAGENET_INCEPTION_MEAN = (0.5, 0.5, 0.5)
+IMAGENET_INCEPTION_STD = (0.5, 0.5, 0.5)
+
+
+def _cfg(module, url=None, **kwargs):
+    cfg = dict(
+        module=module, url=url, num_classes=1000, input_size=(3, 224, 224), interpolation='bicubic',
+        crop_pct=0.875, mean=IMAGENET_DEFAULT_MEAN, std=IMAGENET_DEFAULT_STD)
+    cfg.update(kwargs)
+    return cfg
+
+
+default_cfgs = {
+    # GenEfficientNet models (gen_efficientnet.py)
+    'mnasnet_050': _cfg('gen_efficientnet'),
+    'mnasnet_075': _cfg('gen_efficientnet'),
+    'mnasnet_100': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mnasnet_b1-74cb7081.pth'),
+    'mnasnet_b1': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mnasnet_b1-74cb7081.pth'),
+    'mnasnet_140': _cfg('gen_efficientnet'),
+    'mnasnet_small': _cfg('gen_efficientnet'),
+    'semnasnet_050': _cfg('gen_efficientnet'),
+    'semnasnet_075': _cfg('gen_efficientnet'),
+    'semnasnet_100': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mnasnet_a1-d9418771.pth'),
+    'mnasnet_a1': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mnasnet_a1-d9418771.pth'),
+    'semnasnet_140': _cfg('gen_efficientnet'),
+    'mobilenetv2_100': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_100_ra-b33bc2c4.pth'),
+    'mobilenetv2_110d': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_110d_ra-77090ade.pth'),
+    'mobilenetv2_120d': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_120d_ra-5987e2ed.pth'),
+    'mobilenetv2_140': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv2_140_ra-21a4e913.pth'),
+    'fbnetc_100': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/fbnetc_100-c345b898.pth',
+        interpolation='bilinear'),
+    'spnasnet_100': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/spnasnet_100-048bc3f4.pth',
+        interpolation='bilinear'),
+    'efficientnet_b0': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b0_ra-3dd342df.pth'),
+    'efficientnet_b1': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b1-533bc792.pth',
+        input_size=(3, 240, 240), crop_pct=0.882),
+    'efficientnet_b2': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b2_ra-bcdf34b7.pth',
+        input_size=(3, 260, 260), crop_pct=0.89),
+    'efficientnet_b3': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_b3_ra-a5e2fbc7.pth',
+        input_size=(3, 300, 300), crop_pct=0.904),
+    'efficientnet_b4': _cfg('gen_efficientnet', input_size=(3, 380, 380), crop_pct=0.922),
+    'efficientnet_b5': _cfg('gen_efficientnet', input_size=(3, 456, 456), crop_pct=0.934),
+    'efficientnet_b6': _cfg('gen_efficientnet', input_size=(3, 528, 528), crop_pct=0.942),
+    'efficientnet_b7': _cfg('gen_efficientnet', input_size=(3, 600, 600), crop_pct=0.949),
+    'efficientnet_b8': _cfg('gen_efficientnet', input_size=(3, 672, 672), crop_pct=0.954),
+    'efficientnet_l2': _cfg('gen_efficientnet', input_size=(3, 800, 800), crop_pct=0.961),
+    'efficientnet_es': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/efficientnet_es_ra-f111e99c.pth'),
+    'efficientnet_em': _cfg('gen_efficientnet', input_size=(3, 240, 240), crop_pct=0.882),
+    'efficientnet_el': _cfg('gen_efficientnet', input_size=(3, 300, 300), crop_pct=0.904),
+    'efficientnet_cc_b0_4e': _cfg('gen_efficientnet'),
+    'efficientnet_cc_b0_8e': _cfg('gen_efficientnet'),
+    'efficientnet_cc_b1_8e': _cfg('gen_efficientnet', input_size=(3, 240, 240), crop_pct=0.882),
+    'efficientnet_lite0': _cfg('gen_efficientnet'),
+    'efficientnet_lite1': _cfg('gen_efficientnet', input_size=(3, 240, 240), crop_pct=0.882),
+    'efficientnet_lite2': _cfg('gen_efficientnet', input_size=(3, 260, 260), crop_pct=0.89),
+    'efficientnet_lite3': _cfg('gen_efficientnet', input_size=(3, 300, 300), crop_pct=0.904),
+    'efficientnet_lite4': _cfg('gen_efficientnet', input_size=(3, 380, 380), crop_pct=0.922),
+    'tf_efficientnet_b0': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b0_aa-827b6e33.pth'),
+    'tf_efficientnet_b1': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b1_aa-ea7a6ee0.pth',
+        input_size=(3, 240, 240), crop_pct=0.88),
+    'tf_efficientnet_b2': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b2_aa-60c94f97.pth',
+        input_size=(3, 260, 260), crop_pct=0.89),
+    'tf_efficientnet_b3': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b3_aa-84b4657e.pth',
+        input_size=(3, 300, 300), crop_pct=0.904),
+    'tf_efficientnet_b4': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b4_aa-818f208c.pth',
+        input_size=(3, 380, 380), crop_pct=0.922),
+    'tf_efficientnet_b5': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b5_ra-9a3e5369.pth',
+        input_size=(3, 456, 456), crop_pct=0.934),
+    'tf_efficientnet_b6': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b6_aa-80ba17e4.pth',
+        input_size=(3, 528, 528), crop_pct=0.942),
+    'tf_efficientnet_b7': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b7_ra-6c08e654.pth',
+        input_size=(3, 600, 600), crop_pct=0.949),
+    'tf_efficientnet_b8': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b8_ra-572d5dd9.pth',
+        input_size=(3, 672, 672), crop_pct=0.954),
+    'tf_efficientnet_b0_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b0_ap-f262efe1.pth',
+        mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b1_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b1_ap-44ef0a3d.pth',
+        input_size=(3, 240, 240), crop_pct=0.88, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b2_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b2_ap-2f8e7636.pth',
+        input_size=(3, 260, 260), crop_pct=0.89, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b3_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b3_ap-aad25bdd.pth',
+        input_size=(3, 300, 300), crop_pct=0.904, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b4_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b4_ap-dedb23e6.pth',
+        input_size=(3, 380, 380), crop_pct=0.922, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b5_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b5_ap-9e82fae8.pth',
+        input_size=(3, 456, 456), crop_pct=0.934, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b6_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b6_ap-4ffb161f.pth',
+        input_size=(3, 528, 528), crop_pct=0.942, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b7_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b7_ap-ddb28fec.pth',
+        input_size=(3, 600, 600), crop_pct=0.949, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b8_ap': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b8_ap-00e169fa.pth',
+        input_size=(3, 672, 672), crop_pct=0.954, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_b0_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b0_ns-c0e6a31c.pth'),
+    'tf_efficientnet_b1_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b1_ns-99dd0c41.pth',
+        input_size=(3, 240, 240), crop_pct=0.88),
+    'tf_efficientnet_b2_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b2_ns-00306e48.pth',
+        input_size=(3, 260, 260), crop_pct=0.89),
+    'tf_efficientnet_b3_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b3_ns-9d44bf68.pth',
+        input_size=(3, 300, 300), crop_pct=0.904),
+    'tf_efficientnet_b4_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b4_ns-d6313a46.pth',
+        input_size=(3, 380, 380), crop_pct=0.922),
+    'tf_efficientnet_b5_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b5_ns-6f26d0cf.pth',
+        input_size=(3, 456, 456), crop_pct=0.934),
+    'tf_efficientnet_b6_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b6_ns-51548356.pth',
+        input_size=(3, 528, 528), crop_pct=0.942),
+    'tf_efficientnet_b7_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_b7_ns-1dbc32de.pth',
+        input_size=(3, 600, 600), crop_pct=0.949),
+    'tf_efficientnet_l2_ns_475': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_l2_ns_475-bebbd00a.pth',
+        input_size=(3, 475, 475), crop_pct=0.936),
+    'tf_efficientnet_l2_ns': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_l2_ns-df73bb44.pth',
+        input_size=(3, 800, 800), crop_pct=0.961),
+    'tf_efficientnet_es': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_es-ca1afbfe.pth',
+        mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_em': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_em-e78cfe58.pth',
+        input_size=(3, 240, 240), crop_pct=0.875, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_el': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_el-5143854e.pth',
+        input_size=(3, 300, 300), crop_pct=0.904, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_cc_b0_4e': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_cc_b0_4e-4362b6b2.pth',
+        mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_cc_b0_8e': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_cc_b0_8e-66184a25.pth',
+        mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_cc_b1_8e': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_cc_b1_8e-f7c79ae1.pth',
+        input_size=(3, 240, 240), crop_pct=0.88, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_lite0': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite0-0aa007d2.pth',
+        mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_lite1': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite1-bde8b488.pth',
+        input_size=(3, 240, 240), crop_pct=0.882, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_lite2': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite2-dcccb7df.pth',
+        input_size=(3, 260, 260), crop_pct=0.89, mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_lite3': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite3-b733e338.pth',
+        input_size=(3, 300, 300), crop_pct=0.904, interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_efficientnet_lite4': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_efficientnet_lite4-741542c3.pth',
+        input_size=(3, 380, 380), crop_pct=0.92, interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'mixnet_s': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_s-a907afbc.pth'),
+    'mixnet_m': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_m-4647fc68.pth'),
+    'mixnet_l': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_l-5a9a2ed8.pth'),
+    'mixnet_xl': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mixnet_xl_ra-aac3c00c.pth'),
+    'tf_mixnet_s': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mixnet_s-89d3354b.pth'),
+    'tf_mixnet_m': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mixnet_m-0f4d8805.pth'),
+    'tf_mixnet_l': _cfg('gen_efficientnet',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mixnet_l-6c92e0c8.pth'),
+
+    # MobileNetV3 models (mobilenetv3.py)
+    'mobilenetv3_rw': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv3_100-35495452.pth'),
+    'mobilenetv3_large_075': _cfg('mobilenetv3'),
+    'mobilenetv3_large_100': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/mobilenetv3_large_100_ra-f55367f5.pth'),
+    'mobilenetv3_large_minimal_100': _cfg('mobilenetv3'),
+    'mobilenetv3_small_075': _cfg('mobilenetv3'),
+    'mobilenetv3_small_100': _cfg('mobilenetv3'),
+    'mobilenetv3_small_minimal_100': _cfg('mobilenetv3'),
+    'tf_mobilenetv3_large_075': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_large_075-150ee8b0.pth',
+        interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_mobilenetv3_large_100': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_large_100-427764d5.pth',
+        interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_mobilenetv3_large_minimal_100': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_large_minimal_100-8596ae28.pth',
+        interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_mobilenetv3_small_075': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_small_075-da427f52.pth',
+        interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_mobilenetv3_small_100': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_small_100-37f49e2b.pth',
+        interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+    'tf_mobilenetv3_small_minimal_100': _cfg('mobilenetv3',
+        url='https://github.com/rwightman/pytorch-image-models/releases/download/v0.1-weights/tf_mobilenetv3_small_minimal_100-922a7843.pth',
+        interpolation='bilinear', mean=IMAGENET_INCEPTION_MEAN, std=IMAGENET_INCEPTION_STD),
+}
+
+
+def _natural_key(string_):
+    return [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', string_.lower())]
+
+
+def list_models(filter='', pretrained=False):
+    """ Return list of available model names, sorted alphabetically
+
+    Args:
+        filter (str): wildcard filter string that works with fnmatch
+        pretrained (bool): only include models with pretrained weights
+    """
+    models = default_cfgs.keys()
+    if filter:
+        models = fnmatch.filter(models, filter)
+    if pretrained:
+        models = [m for m in models if default_cfgs[m]['url']]
+    return list(sorted(models, key=_natural_key))
+
+
+def is_model(model_name):
+    return model_name in default_cfgs
+
+
+def model_entrypoint(model_name):
+    """ Fetch a model entrypoint function by name, importing its module on first use
+    """
+    module = importlib.import_module('geffnet.' + default_cfgs[model_name]['module'])
+    return getattr(module, model_name)
+
+
+def get_model_cfg(model_name):
+    """ Return a copy of the default config for a model
+    """
+    cfg = dict(default_cfgs[model_name])
+    del cfg['module']
+    return cfg
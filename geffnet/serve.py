@@ -0,0 +1,333 @@
+""" Dynamic micro-batching inference server
+
+Single image requests arriving on an asyncio front-end are queued and coalesced into batches, bounded by a max
+batch size and a max queue delay (how long the first request of a batch may wait for company). Each batch is
+run through the model on a thread pool (torch releases the GIL, one model shared by all threads) or a process
+pool (one model per worker process, built w/ create_model in the worker) and the results fanned back out to the
+waiting requests. Batching trades a little latency at low load for a lot of throughput at high load, batch of 1
+on CPU leaves most of the cores idle for the larger models.
+
+Preprocessing is a callable taking the raw (encoded image) request bytes and returning a CHW tensor, see
+`serve.py` for one built from `data.transforms_imagenet_eval` / `resolve_data_config`.
+
+The HTTP front-end is a minimal local stand-in (TCP or unix socket), not a production web server:
+    POST /predict   body = image file bytes -> {"top_k": [[class_idx, prob], ...], "batch_size": N}
+    GET /metrics    -> latency percentiles (ms), batch fill and counters as JSON
+"""
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import torch
+
+from .fuse import fuse_for_inference
+from .model_factory import create_model
+
+__all__ = ['ServeStats', 'MicroBatcher', 'ModelRunner', 'InferenceServer']
+
+
+class ServeStats:
+    """ Request latency percentiles and batch fill over a sliding window of the most recent requests / batches
+    """
+
+    def __init__(self, max_batch_size, window=10000):
+        self.max_batch_size = max_batch_size
+        self.latencies = deque(maxlen=window)
+        self.queue_times = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_errors = 0
+        self._lock = threading.Lock()
+
+    def update_batch(self, batch_size):
+        with self._lock:
+            self.batch_sizes.append(batch_size)
+            self.num_batches += 1
+
+    def update_request(self, latency, queue_time, error=False):
+        with self._lock:
+            self.latencies.append(latency)
+            self.queue_times.append(queue_time)
+            self.num_requests += 1
+            self.num_errors += int(error)
+
+    @staticmethod
+    def _percentile(values, pct):
+        if not values:
+            return 0.
+        values = sorted(values)
+        return values[max(0, int(math.ceil(pct / 100. * len(values))) - 1)]
+
+    def summary(self):
+        with self._lock:
+            latencies = list(self.latencies)
+            queue_times = list(self.queue_times)
+            batch_sizes = list(self.batch_sizes)
+            summary = dict(
+                num_requests=self.num_requests, num_batches=self.num_batches, num_errors=self.num_errors)
+        for pct in (50, 90, 99):
+            summary['latency_p%d_ms' % pct] = 1000. * self._percentile(latencies, pct)
+        summary['queue_p50_ms'] = 1000. * self._percentile(queue_times, 50)
+        summary['queue_p99_ms'] = 1000. * self._percentile(queue_times, 99)
+        mean_batch = sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.
+        summary['mean_batch_size'] = mean_batch
+        summary['batch_fill'] = mean_batch / self.max_batch_size
+        return summary
+
+
+_WORKER_MODEL = None
+
+
+def _init_worker(model_name, model_kwargs, num_threads, fuse_bn):
+    global _WORKER_MODEL
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    _WORKER_MODEL = create_model(model_name, **model_kwargs)
+    _WORKER_MODEL.eval()
+    if fuse_bn:
+        fuse_for_inference(_WORKER_MODEL)
+
+
+def _run_worker(batch):
+    with torch.no_grad():
+        return _WORKER_MODEL(batch)
+
+
+class ModelRunner:
+    """ Runs batches through a model on a thread or process pool
+
+    Args:
+        model: model instance (thread mode) or model name to build w/ create_model (either mode)
+        mode: 'thread' or 'process'
+        workers: number of batches that can be in flight at once
+        num_threads: torch threads per worker process (process mode only), 0 to leave as is
+        fuse_bn: fold BatchNorm layers into the preceding convs (see fuse_for_inference)
+        **model_kwargs: passed to create_model
+    """
+
+    def __init__(self, model, mode='thread', workers=1, num_threads=0, fuse_bn=False, **model_kwargs):
+        assert mode in ('thread', 'process')
+        self.mode = mode
+        self.workers = workers
+        if mode == 'process':
+            assert isinstance(model, str), 'Process mode builds the model in each worker, pass a model name'
+            self.model = None
+            self.executor = ProcessPoolExecutor(
+                workers, initializer=_init_worker, initargs=(model, model_kwargs, num_threads, fuse_bn))
+        else:
+            if isinstance(model, str):
+                model = create_model(model, **model_kwargs)
+            self.model = model.eval()
+            if fuse_bn:
+                fuse_for_inference(self.model)
+            self.executor = ThreadPoolExecutor(workers)
+        self.device = next(self.model.parameters()).device if self.model is not None else torch.device('cpu')
+
+    def _run(self, batch):
+        with torch.no_grad():
+            return self.model(batch.to(self.device)).cpu()
+
+    def submit(self, batch):
+        """ Returns a concurrent.futures.Future for the model output of `batch` """
+        if self.mode == 'process':
+            return self.executor.submit(_run_worker, batch)
+        return self.executor.submit(self._run, batch)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class MicroBatcher:
+    """ Coalesce single sample requests into batches for a ModelRunner
+
+    A batch is dispatched once `max_batch_size` requests are queued or the oldest queued request has waited
+    `max_delay` seconds, whichever comes first. Up to `runner.workers` batches are in flight at once, while
+    they run new requests keep queuing so the batches fill up under load.
+    """
+
+    def __init__(self, runner, max_batch_size=32, max_delay=0.005, stats=None):
+        self.runner = runner
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.stats = stats if stats is not None else ServeStats(max_batch_size)
+        self._queue = None
+        self._slots = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.runner.workers)
+        self._task = asyncio.ensure_future(self._batch_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, sample):
+        """ Queue a single CHW sample tensor
+
+        Returns:
+            (model output row for the sample, size of the batch it ran in, batch dispatch time)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((sample, future, time.perf_counter()))
+        return await future
+
+    async def _next_batch(self):
+        items = [await self._queue.get()]
+        deadline = items[0][2] + self.max_delay
+        while len(items) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                # drain whatever else is already waiting, no point in leaving it for the next batch
+                while len(items) < self.max_batch_size and not self._queue.empty():
+                    items.append(self._queue.get_nowait())
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _batch_loop(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                items = await self._next_batch()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            asyncio.ensure_future(self._run_batch(items))
+
+    async def _run_batch(self, items):
+        dispatch_time = time.perf_counter()
+        batch_size = len(items)
+        try:
+            batch = torch.stack([sample for sample, _, _ in items])
+            output = await asyncio.wrap_future(self.runner.submit(batch))
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        self.stats.update_batch(batch_size)
+        for i, (_, future, _) in enumerate(items):
+            if not future.done():
+                future.set_result((output[i], batch_size, dispatch_time))
+
+
+class InferenceServer:
+    """ Minimal asyncio HTTP front-end for a MicroBatcher
+
+    Args:
+        batcher: MicroBatcher
+        preprocess: callable, request body bytes -> CHW input tensor, run on the loop's default executor
+        top_k: number of (class, prob) pairs returned per request
+        max_body_size: larger request bodies are answered w/ 413 and the connection closed, without reading them
+    """
+
+    def __init__(self, batcher, preprocess, top_k=5, max_body_size=16 << 20):
+        self.batcher = batcher
+        self.preprocess = preprocess
+        self.top_k = top_k
+        self.max_body_size = max_body_size
+        self.stats = batcher.stats
+
+    async def predict(self, data):
+        """ Preprocess, batch and run a single encoded image, returns the JSON-able result dict """
+        start = time.perf_counter()
+        error = False
+        queue_time = 0.
+        try:
+            sample = await asyncio.get_running_loop().run_in_executor(None, self.preprocess, data)
+            queued = time.perf_counter()
+            output, batch_size, dispatch_time = await self.batcher.submit(sample)
+            queue_time = dispatch_time - queued
+            prob, idx = output.float().softmax(-1).topk(min(self.top_k, output.numel()))
+            return dict(top_k=[[i, p] for i, p in zip(idx.tolist(), prob.tolist())], batch_size=batch_size)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.stats.update_request(time.perf_counter() - start, queue_time, error=error)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path = request_line.decode('latin-1').split()[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body_size = int(headers.get('content-length', 0))
+                if body_size > self.max_body_size:
+                    payload = json.dumps(dict(error='Request body of %d bytes exceeds the %d byte limit' % (
+                        body_size, self.max_body_size))).encode()
+                    writer.write(b'HTTP/1.1 413 Payload Too Large\r\nContent-Type: application/json\r\n'
+                                 b'Content-Length: %d\r\nConnection: close\r\n\r\n' % len(payload) + payload)
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(body_size)
+
+                if method == 'POST' and path == '/predict':
+                    try:
+                        status, result = 200, await self.predict(body)
+                    except Exception as e:
+                        status, result = 400, dict(error=str(e))
+                elif method == 'GET' and path == '/metrics':
+                    status, result = 200, self.stats.summary()
+                else:
+                    status, result = 404, dict(error='Unknown endpoint %s %s' % (method, path))
+
+                payload = json.dumps(result).encode()
+                writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % (
+                    status, b'OK' if status == 200 else b'Error', len(payload)) + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8000, unix_socket=''):
+        """ Start the batcher and listen on a unix socket if given, else on host:port """
+        self.batcher.start()
+        if unix_socket:
+            return await asyncio.start_unix_server(self._handle, path=unix_socket)
+        return await asyncio.start_server(self._handle, host=host, port=port)
+
+    def serve_forever(self, host='127.0.0.1', port=8000, unix_socket=''):
+        """ Run the server on a new event loop until interrupted """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(self.start(host=host, port=port, unix_socket=unix_socket))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.run_until_complete(self.batcher.stop())
+            self.batcher.runner.shutdown()
+            asyncio.set_event_loop(None)
+            loop.close()
@@ -0,0 +1,153 @@
+""" Memory-mapped weight store
+
+A weight store is a directory with all tensors of a state dict packed into one flat, aligned binary blob
+(`weights.bin`) and a JSON index (`index.json`) of tensor name -> dtype, shape, byte offset. Loading memory-maps
+the blob (copy-on-write) and the tensors are views into the mapping, nothing is read until a page is touched.
+Binding the model parameters directly to those views (instead of copying with load_state_dict) means processes
+loading the same store share the weight pages via the OS page cache.
+"""
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+__all__ = ['save_weights', 'load_weights', 'bind_weights', 'is_weight_store', 'get_weight_store_dir']
+
+_INDEX_FILE = 'index.json'
+_BLOB_FILE = 'weights.bin'
+_ALIGN = 64
+
+_TORCH_TO_NUMPY = {
+    torch.float32: np.float32,
+    torch.float16: np.float16,
+    torch.float64: np.float64,
+    torch.int64: np.int64,
+    torch.int32: np.int32,
+    torch.uint8: np.uint8,
+    torch.bool: np.bool_,
+}
+
+
+def is_weight_store(path):
+    return bool(path) and os.path.isfile(os.path.join(path, _INDEX_FILE))
+
+
+def get_weight_store_dir():
+    """ Root dir for weight stores converted from pretrained URLs, $GEFFNET_WEIGHT_STORE or <torch hub dir>/geffnet
+    """
+    store_dir = os.environ.get('GEFFNET_WEIGHT_STORE', '')
+    if not store_dir:
+        if hasattr(torch.hub, 'get_dir'):
+            hub_dir = torch.hub.get_dir()
+        else:
+            hub_dir = os.path.join(torch.hub._get_torch_home(), 'hub')
+        store_dir = os.path.join(hub_dir, 'geffnet')
+    return store_dir
+
+
+def save_weights(state_dict, path):
+    """ Write a state dict to a weight store directory at `path` (created if necessary)
+    """
+    os.makedirs(path, exist_ok=True)
+    index = OrderedDict()
+    offset = 0
+    tmp_suffix = '.tmp%d' % os.getpid()
+    tmp_blob = os.path.join(path, _BLOB_FILE + tmp_suffix)
+    with open(tmp_blob, 'wb') as f:
+        for name, tensor in state_dict.items():
+            tensor = tensor.detach().cpu().contiguous()
+            assert tensor.dtype in _TORCH_TO_NUMPY, 'Unsupported dtype (%s) for %s' % (tensor.dtype, name)
+            data = tensor.numpy().tobytes()
+            pad = -offset % _ALIGN
+            f.write(b'\0' * pad)
+            offset += pad
+            index[name] = dict(dtype=str(tensor.dtype).replace('torch.', ''), shape=list(tensor.shape), offset=offset)
+            f.write(data)
+            offset += len(data)
+    tmp_index = os.path.join(path, _INDEX_FILE + tmp_suffix)
+    with open(tmp_index, 'w') as f:
+        json.dump(dict(version=1, size=offset, tensors=index), f)
+    # blob first, the index marks a complete store
+    os.replace(tmp_blob, os.path.join(path, _BLOB_FILE))
+    os.replace(tmp_index, os.path.join(path, _INDEX_FILE))
+
+
+def load_weights(path):
+    """ Memory-map a weight store, returns an OrderedDict state dict of tensors backed by the mapping
+    """
+    with open(os.path.join(path, _INDEX_FILE)) as f:
+        index = json.load(f)
+    state_dict = OrderedDict()
+    if not index['size']:
+        return state_dict
+    # copy-on-write, pages stay shared (and on disk) until written to
+    blob = np.memmap(os.path.join(path, _BLOB_FILE), dtype=np.uint8, mode='c', shape=(index['size'],))
+    for name, info in index['tensors'].items():
+        dtype = np.dtype(_TORCH_TO_NUMPY[getattr(torch, info['dtype'])])
+        numel = int(np.prod(info['shape'], dtype=np.int64))
+        offset = info['offset']
+        array = blob[offset:offset + numel * dtype.itemsize].view(dtype).reshape(info['shape'])
+        state_dict[name] = torch.from_numpy(array)
+    return state_dict
+
+
+def _is_meta(tensor):
+    return tensor.device.type == 'meta'
+
+
+def bind_weights(model, state_dict, strict=True):
+    """ Bind model parameters and buffers to the tensors in `state_dict` without copying
+
+    Tensors with matching shape and dtype are used as is (the parameters share memory with them), others are
+    converted. Meta device parameters and buffers are materialized, on the device of the bound tensors, or as
+    uninitialized CPU tensors if missing. Returns (missing_keys, unexpected_keys), raises RuntimeError on
+    mismatches if `strict`.
+    """
+    missing_keys = []
+    expected = set()
+    for module_name, module in model.named_modules():
+        prefix = module_name + '.' if module_name else ''
+        for name, param in list(module._parameters.items()):
+            if param is None:
+                continue
+            key = prefix + name
+            expected.add(key)
+            if key not in state_dict:
+                missing_keys.append(key)
+                if _is_meta(param):
+                    module._parameters[name] = torch.nn.Parameter(
+                        torch.empty(param.shape, dtype=param.dtype), requires_grad=param.requires_grad)
+                continue
+            value = state_dict[key]
+            if value.shape != param.shape:
+                raise RuntimeError('Size mismatch for {}: {} in weights, {} in model'.format(
+                    key, tuple(value.shape), tuple(param.shape)))
+            value = value.to(device=value.device if _is_meta(param) else param.device, dtype=param.dtype)
+            module._parameters[name] = torch.nn.Parameter(value, requires_grad=param.requires_grad)
+        for name, buf in list(module._buffers.items()):
+            if buf is None:
+                continue
+            key = prefix + name
+            expected.add(key)
+            if key not in state_dict:
+                if name == 'num_batches_tracked':
+                    # not present in older BatchNorm state, as per load_state_dict
+                    if _is_meta(buf):
+                        module._buffers[name] = torch.zeros(buf.shape, dtype=buf.dtype)
+                else:
+                    missing_keys.append(key)
+                    if _is_meta(buf):
+                        module._buffers[name] = torch.empty(buf.shape, dtype=buf.dtype)
+                continue
+            value = state_dict[key]
+            if value.shape != buf.shape:
+                raise RuntimeError('Size mismatch for {}: {} in weights, {} in model'.format(
+                    key, tuple(value.shape), tuple(buf.shape)))
+            module._buffers[name] = value.to(device=value.device if _is_meta(buf) else buf.device, dtype=buf.dtype)
+    unexpected_keys = [k for k in state_dict.keys() if k not in expected]
+    if strict and (missing_keys or unexpected_keys):
+        raise RuntimeError('Error binding weights, missing keys: {}, unexpected keys: {}'.format(
+            missing_keys, unexpected_keys))
+    return missing_keys, unexpected_keys
@@ -0,0 +1,76 @@
+""" MixNet MixedConv2d benchmark script
+This script compares the default split/cat MixedConv2d execution with the fused single grouped conv path
+for the MixNet models (outputs are checked for equivalence before timing).
+"""
+import argparse
+import time
+import torch
+
+import geffnet
+
+parser = argparse.ArgumentParser(description='MixNet MixedConv2d Benchmark')
+parser.add_argument('--models', default='mixnet_s,mixnet_m,mixnet_l,mixnet_xl', type=str,
+                    help='comma separated list of models to benchmark (default: mixnet_s,...,mixnet_xl)')
+parser.add_argument('-b', '--batch-size', default=1, type=int,
+                    metavar='N', help='mini-batch size (default: 1)')
+parser.add_argument('--img-size', default=224, type=int,
+                    metavar='N', help='Input image dimension (default: 224)')
+parser.add_argument('--warmup', default=5, type=int,
+                    metavar='N', help='number of warmup iterations (default: 5)')
+parser.add_argument('--iters', default=20, type=int,
+                    metavar='N', help='number of timed iterations (default: 20)')
+parser.add_argument('--num-threads', default=0, type=int,
+                    metavar='N', help='number of torch threads, 0 to leave as is (default: 0)')
+parser.add_argument('--num-gpu', type=int, default=0,
+                    help='Number of GPUS to use (default: 0, CPU)')
+parser.add_argument('--max-mac-waste', default=0.45, type=float,
+                    help='max fraction of zero padding MACs for a layer to be fused, 1.0 for all (default: 0.45)')
+parser.add_argument('--fuse-bn', action='store_true', default=False,
+                    help='Fold BatchNorm layers into convolutions before benchmarking')
+
+
+def time_model(model, x, args):
+    sync = torch.cuda.synchronize if x.is_cuda else lambda: None
+    with torch.no_grad():
+        for _ in range(args.warmup):
+            model(x)
+        sync()
+        start = time.time()
+        for _ in range(args.iters):
+            model(x)
+        sync()
+    return (time.time() - start) / args.iters
+
+
+def main():
+    args = parser.parse_args()
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+
+    for name in args.models.split(','):
+        model = geffnet.create_model(name)
+        if args.fuse_bn:
+            geffnet.fuse_for_inference(model)
+        model.eval()
+        x = torch.randn(args.batch_size, 3, args.img_size, args.img_size)
+        if args.num_gpu > 0:
+            model = model.cuda()
+            x = x.cuda()
+
+        with torch.no_grad():
+            out_split = model(x)
+            geffnet.set_mixed_conv_fused(model, True, max_mac_waste=1.)  # check every fusable layer
+            out_fused = model(x)
+        max_diff = (out_split - out_fused).abs().max().item()
+
+        geffnet.set_mixed_conv_fused(model, False)
+        split_time = time_model(model, x, args)
+        geffnet.set_mixed_conv_fused(model, True, max_mac_waste=args.max_mac_waste)
+        fused_time = time_model(model, x, args)
+
+        print('Model {:<12} split: {:8.3f} ms  fused: {:8.3f} ms  speedup: {:5.2f}x  max diff: {:.2e}'.format(
+            name, 1000 * split_time, 1000 * fused_time, split_time / fused_time, max_diff))
+
+
+if __name__ == '__main__':
+    main()
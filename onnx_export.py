@@ -1,3 +1,13 @@
+""" ONNX export script
+
+Exports a model to ONNX and verifies the exported graph against PyTorch in onnxruntime or Caffe2.
+
+With `--dynamic` the batch, height and width of the input are symbolic (ONNX dynamic axes) and the 'SAME' padding
+of the tf_* models is exported as shape dependent Pad ops, so one export serves any batch size and resolution.
+The export is then verified at several input shapes.
+
+    python onnx_export.py --model tf_efficientnet_b0 --dynamic ./tf_efficientnet_b0.onnx
+"""
 import argparse
 import os
 import time
@@ -6,7 +16,6 @@ import torch.nn as nn
 import numpy as np
 
 import onnx
-import caffe2.python.onnx.backend as onnx_caffe2
 
 import geffnet
 
@@ -27,6 +36,63 @@ parser.add_argument('--num-classes', type=int, default=1000,
                     help='Number classes in dataset')
 parser.add_argument('--checkpoint', default='', type=str, metavar='PATH',
                     help='path to latest checkpoint (default: none)')
+parser.add_argument('--dynamic', dest='dynamic', action='store_true',
+                    help='export w/ symbolic batch, height and width input dims')
+parser.add_argument('--opset', type=int, default=None,
+                    help='ONNX opset version (default: torch default, 11 w/ --dynamic)')
+parser.add_argument('--backend', default='', type=str, choices=['', 'onnxruntime', 'caffe2'],
+                    help='runtime for verifying the export (default: onnxruntime if installed, else caffe2)')
+parser.add_argument('--verify-shapes', default=None, type=str, nargs='+', metavar='BxS',
+                    help='batch x image size input shapes to verify, ie 1x224 4x256 (default: the export shape, '
+                         'plus two other batch sizes / resolutions w/ --dynamic)')
+
+
+def export_onnx(model, x, output, dynamic=False, opset=None):
+    """ Export `model` traced w/ input `x` to the ONNX file `output`, returns the traced output
+
+    With `dynamic`, the batch, height and width of the input are dynamic axes. The model must have been created
+    w/ `set_exportable(True, dynamic=True)` for the 'SAME' padding to follow the input size.
+    """
+    input_names = ["input0"]
+    output_names = ["output0"]
+    optional_args = dict(keep_initializers_as_inputs=True)  # pytorch 1.3 needs this for export to succeed
+    if dynamic:
+        optional_args['dynamic_axes'] = {
+            'input0': {0: 'batch', 2: 'height', 3: 'width'}, 'output0': {0: 'batch'}}
+        # shape dependent Pad (pads as an input) needs opset 11
+        optional_args['opset_version'] = opset or 11
+    elif opset:
+        optional_args['opset_version'] = opset
+    try:
+        torch_out = torch.onnx._export(
+            model, x, output, export_params=True, verbose=False,
+            input_names=input_names, output_names=output_names, **optional_args)
+    except TypeError:
+        # fallback to no keep_initializers arg for pytorch < 1.3
+        del optional_args['keep_initializers_as_inputs']
+        torch_out = torch.onnx._export(
+            model, x, output, export_params=True, verbose=False,
+            input_names=input_names, output_names=output_names, **optional_args)
+    return torch_out
+
+
+def create_backend(onnx_model, backend=''):
+    """ Returns a fn running the ONNX model on a numpy input in onnxruntime or Caffe2 """
+    if not backend:
+        try:
+            import onnxruntime
+            backend = 'onnxruntime'
+        except ImportError:
+            backend = 'caffe2'
+    if backend == 'onnxruntime':
+        import onnxruntime
+        session = onnxruntime.InferenceSession(onnx_model.SerializeToString())
+        input_name = session.get_inputs()[0].name
+        return backend, lambda x: session.run(None, {input_name: x})[0]
+    import caffe2.python.onnx.backend as onnx_caffe2
+    caffe2_backend = onnx_caffe2.prepare(onnx_model)
+    input_name = onnx_model.graph.input[0].name
+    return backend, lambda x: caffe2_backend.run({input_name: x})[0]
 
 
 def main():
@@ -38,7 +104,7 @@ def main():
         args.pretrained = False
 
     # create model
-    geffnet.config.set_exportable(True)
+    geffnet.config.set_exportable(True, dynamic=args.dynamic)
     print("==> Creating PyTorch {} model".format(args.model))
     model = geffnet.create_model(
         args.model,
@@ -49,35 +115,45 @@ def main():
 
     model.eval()
 
-    x = torch.randn((1, 3, args.img_size or 224, args.img_size or 224), requires_grad=True)
+    img_size = args.img_size or 224
+    x = torch.randn((1, 3, img_size, img_size), requires_grad=True)
     model(x)  # run model once before export trace
 
     print("==> Exporting model to ONNX format at '{}'".format(args.output))
-    input_names = ["input0"]
-    output_names = ["output0"]
-    optional_args = dict(keep_initializers_as_inputs=True)  # pytorch 1.3 needs this for export to succeed
-    try:
-        torch_out = torch.onnx._export(
-            model, x, args.output, export_params=True, verbose=False,
-            input_names=input_names, output_names=output_names, **optional_args)
-    except TypeError:
-        # fallback to no keep_initializers arg for pytorch < 1.3
-        torch_out = torch.onnx._export(
-            model, x, args.output, export_params=True, verbose=False,
-            input_names=input_names, output_names=output_names)
+    torch_out = export_onnx(model, x, args.output, dynamic=args.dynamic, opset=args.opset)
 
     print("==> Loading and checking exported model from '{}'".format(args.output))
     onnx_model = onnx.load(args.output)
     onnx.checker.check_model(onnx_model)  # assuming throw on error
     print("==> Passed")
 
-    print("==> Loading model into Caffe2 backend and comparing forward pass.".format(args.output))
-    caffe2_backend = onnx_caffe2.prepare(onnx_model)
-    B = {onnx_model.graph.input[0].name: x.data.numpy()}
-    c2_out = caffe2_backend.run(B)[0]
+    backend, run_fn = create_backend(onnx_model, args.backend)
+    print("==> Loading model into {} backend and comparing forward pass.".format(backend))
+    c2_out = run_fn(x.data.numpy())
     np.testing.assert_almost_equal(torch_out.data.numpy(), c2_out, decimal=5)
     print("==> Passed")
 
+    if args.verify_shapes:
+        shapes = [tuple(int(v) for v in s.lower().split('x')) for s in args.verify_shapes]
+    elif args.dynamic:
+        # another batch size, a larger and an odd (asymmetric 'SAME' pad) resolution
+        shapes = [(3, img_size + 32), (2, img_size - 31)]
+    else:
+        shapes = []
+    for batch_size, size in shapes:
+        print("==> Comparing forward pass at input shape ({}, 3, {}, {})".format(batch_size, size, size))
+        x = torch.randn((batch_size, 3, size, size))
+        with torch.no_grad():
+            torch_out = model(x)
+        start = time.time()
+        backend_out = run_fn(x.numpy())
+        elapsed = time.time() - start
+        assert backend_out.shape == tuple(torch_out.shape), \
+            'Output shape {} != {}'.format(backend_out.shape, tuple(torch_out.shape))
+        np.testing.assert_almost_equal(torch_out.numpy(), backend_out, decimal=5)
+        print("==> Passed ({:.1f} ms, max abs diff {:.2e})".format(
+            1000 * elapsed, np.abs(torch_out.numpy() - backend_out).max()))
+
 
 if __name__ == '__main__':
     main()
@@ -10,6 +10,33 @@ parser.add_argument("model", help="The ONNX model")
 parser.add_argument("--output", required=True, help="The optimized model output filename")
 
 
+# Optimizer passes to perform
+OPTIMIZER_PASSES = [
+    #'eliminate_deadend',
+    'eliminate_identity',
+    'eliminate_nop_dropout',
+    'eliminate_nop_pad',
+    'eliminate_nop_transpose',
+    'eliminate_unused_initializer',
+    'extract_constant_to_initializer',
+    'fuse_add_bias_into_conv',
+    'fuse_bn_into_conv',
+    'fuse_consecutive_concats',
+    'fuse_consecutive_reduce_unsqueeze',
+    'fuse_consecutive_squeezes',
+    'fuse_consecutive_transposes',
+    #'fuse_matmul_add_bias_into_gemm',
+    'fuse_pad_into_conv',
+    #'fuse_transpose_into_gemm',
+    #'lift_lexical_references',
+]
+
+
+def optimize(onnx_model, passes=OPTIMIZER_PASSES):
+    """ Apply the optimizer passes to a loaded ONNX model """
+    return optimizer.optimize(onnx_model, passes)
+
+
 def traverse_graph(graph, prefix=''):
     content = []
     indent = prefix + '  '
@@ -33,29 +60,7 @@ def main():
     onnx_model = onnx.load(args.model)
     num_original_nodes, original_graph_str = traverse_graph(onnx_model.graph)
 
-    # Optimizer passes to perform
-    passes = [
-        #'eliminate_deadend',
-        'eliminate_identity',
-        'eliminate_nop_dropout',
-        'eliminate_nop_pad',
-        'eliminate_nop_transpose',
-        'eliminate_unused_initializer',
-        'extract_constant_to_initializer',
-        'fuse_add_bias_into_conv',
-        'fuse_bn_into_conv',
-        'fuse_consecutive_concats',
-        'fuse_consecutive_reduce_unsqueeze',
-        'fuse_consecutive_squeezes',
-        'fuse_consecutive_transposes',
-        #'fuse_matmul_add_bias_into_gemm',
-        'fuse_pad_into_conv',
-        #'fuse_transpose_into_gemm',
-        #'lift_lexical_references',
-    ]
-
-    # Apply the optimization on the original serialized model
-    optimized_model = optimizer.optimize(onnx_model, passes)
+    optimized_model = optimize(onnx_model)
 
     num_optimized_nodes, optimzied_graph_str = traverse_graph(optimized_model.graph)
     print('==> The model after optimization:\n{}\n'.format(optimzied_graph_str))
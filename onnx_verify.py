@@ -0,0 +1,213 @@
+""" ONNX export parity and latency verification script
+
+Exports every model (or those matching --models) to ONNX in exportable mode, applies the onnx_optimize.py
+passes, then runs the original and optimized graphs in a local CPU runtime (onnxruntime, or Caffe2) against
+the PyTorch model. For each model the report has the graph sizes, max abs / rel errors with a histogram of the
+abs errors per decade, and the latency of the PyTorch model, original graph and optimized graph. Models that fail
+to export, check, optimize or match are reported, not skipped silently.
+
+    python onnx_verify.py --models 'efficientnet_*' 'tf_*' --output-dir ./onnx --report BENCHMARK.md --json onnx.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import statistics
+import time
+import traceback
+
+import numpy as np
+import torch
+
+import onnx
+
+import geffnet
+from onnx_export import export_onnx, create_backend
+from onnx_optimize import optimize
+
+parser = argparse.ArgumentParser(description='ONNX Export Verification')
+parser.add_argument('--models', default=['*'], type=str, nargs='+',
+                    help='model names or wildcard filters (default: all registered models)')
+parser.add_argument('--output-dir', default='./onnx', type=str, metavar='DIR',
+                    help='directory for the exported .onnx files (default: ./onnx)')
+parser.add_argument('--img-size', default=0, type=int, metavar='N',
+                    help='input image dimension, 0 for each model\'s native resolution (default: 0)')
+parser.add_argument('-b', '--batch-size', default=1, type=int, metavar='N',
+                    help='batch size for the parity check and timing (default: 1)')
+parser.add_argument('--dynamic', dest='dynamic', action='store_true',
+                    help='export w/ symbolic batch, height and width input dims')
+parser.add_argument('--opset', type=int, default=None,
+                    help='ONNX opset version (default: torch default, 11 w/ --dynamic)')
+parser.add_argument('--pretrained', action='store_true',
+                    help='export the pretrained weights (default: random init, parity and latency don\'t need them)')
+parser.add_argument('--backend', default='', type=str, choices=['', 'onnxruntime', 'caffe2'],
+                    help='runtime for the checks (default: onnxruntime if installed, else caffe2)')
+parser.add_argument('--atol', default=1e-4, type=float,
+                    help='abs tolerance of the parity check (default: 1e-4)')
+parser.add_argument('--rtol', default=1e-3, type=float,
+                    help='relative tolerance of the parity check (default: 1e-3)')
+parser.add_argument('--warmup', default=3, type=int, metavar='N',
+                    help='number of warmup iterations (default: 3)')
+parser.add_argument('--iters', default=20, type=int, metavar='N',
+                    help='number of timed iterations (default: 20)')
+parser.add_argument('--num-threads', default=0, type=int, metavar='N',
+                    help='number of torch threads, 0 to leave as is (default: 0)')
+parser.add_argument('--report', default='', type=str, metavar='PATH',
+                    help='write a markdown report, ie BENCHMARK.md')
+parser.add_argument('--json', default='', type=str, metavar='PATH',
+                    help='write the results to a JSON file')
+
+# abs error histogram bin edges, one bin per decade
+_ERR_BINS = [0.] + [10. ** e for e in range(-8, 0)] + [np.inf]
+
+
+def time_fn(fn, x, warmup=3, iters=20):
+    """ median latency (ms) of fn(x) """
+    for _ in range(warmup):
+        fn(x)
+    times = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn(x)
+        times.append(1000. * (time.perf_counter() - start))
+    return statistics.median(times)
+
+
+def compare(ref, out, atol, rtol):
+    """ error stats of `out` vs the reference output """
+    abs_err = np.abs(ref - out)
+    rel_err = abs_err / (np.abs(ref) + 1e-8)
+    hist, _ = np.histogram(abs_err, bins=_ERR_BINS)
+    return dict(
+        max_abs_err=float(abs_err.max()), mean_abs_err=float(abs_err.mean()), max_rel_err=float(rel_err.max()),
+        abs_err_hist=hist.tolist(), passed=bool(np.allclose(out, ref, atol=atol, rtol=rtol)))
+
+
+def verify_model(name, args):
+    """ Export, optimize and check one model, failures are recorded in the result status """
+    img_size = args.img_size or geffnet.get_model_cfg(name)['input_size'][-1]
+    result = dict(model=name, img_size=img_size, status='ok')
+    onnx_path = os.path.join(args.output_dir, name + '.onnx')
+    opt_path = os.path.join(args.output_dir, name + '-opt.onnx')
+    stage = 'create'
+    try:
+        geffnet.config.set_exportable(True, dynamic=args.dynamic)
+        model = geffnet.create_model(name, pretrained=args.pretrained)
+        model.eval()
+
+        torch.manual_seed(42)
+        x = torch.randn((args.batch_size, 3, img_size, img_size))
+        x_np = x.numpy()
+        with torch.no_grad():
+            ref = model(x).numpy()
+            result['torch_ms'] = time_fn(model, x, args.warmup, args.iters)
+
+            stage = 'export'
+            export_onnx(model, x, onnx_path, dynamic=args.dynamic, opset=args.opset)
+        stage = 'check'
+        onnx_model = onnx.load(onnx_path)
+        onnx.checker.check_model(onnx_model)
+        stage = 'optimize'
+        opt_model = optimize(onnx_model)
+        onnx.save(opt_model, opt_path)
+
+        for key, m in (('orig', onnx_model), ('opt', opt_model)):
+            stage = 'run ' + key
+            result['backend'], run_fn = create_backend(m, args.backend)
+            result[key] = compare(ref, run_fn(x_np), args.atol, args.rtol)
+            result[key]['nodes'] = len(m.graph.node)
+            result[key]['ms'] = time_fn(run_fn, x_np, args.warmup, args.iters)
+            if not result[key]['passed']:
+                result['status'] = 'mismatch (%s)' % key
+    except Exception as e:
+        msg = str(e).strip().splitlines()
+        result['status'] = '%s failed: %s' % (stage, msg[0] if msg else type(e).__name__)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        geffnet.config.set_exportable(False)
+    return result
+
+
+def _fmt(v, spec):
+    return format(v, spec) if v is not None else '-'
+
+
+def write_report(results, args, path):
+    lines = [
+        '# Model Performance Benchmarks',
+        '',
+        'Generated with:',
+        '```',
+        'python onnx_verify.py --models {} --batch-size {}{}{} --report {}'.format(
+            ' '.join("'%s'" % m for m in args.models), args.batch_size,
+            ' --img-size %d' % args.img_size if args.img_size else '', ' --dynamic' if args.dynamic else '', path),
+        '```',
+        '',
+        'Latencies are the median of {} CPU runs, batch size {}, {} threads, backend {}. Errors are vs the PyTorch '
+        'output of the same random input. `opt` graphs have the onnx_optimize.py passes applied.'.format(
+            args.iters, args.batch_size, torch.get_num_threads(),
+            next((r['backend'] for r in results if 'backend' in r), args.backend or '-')),
+        '',
+        '| Model | Res | Nodes | Nodes (opt) | Max abs err | Max rel err | PyTorch (ms) | ONNX (ms) | '
+        'ONNX opt (ms) | Opt speedup | Status |',
+        '|---|---|---|---|---|---|---|---|---|---|---|',
+    ]
+    for r in results:
+        orig = r.get('orig', {})
+        opt = r.get('opt', {})
+        speedup = orig['ms'] / opt['ms'] if orig and opt else None
+        max_abs = max(orig.get('max_abs_err', 0.), opt.get('max_abs_err', 0.)) if orig else None
+        max_rel = max(orig.get('max_rel_err', 0.), opt.get('max_rel_err', 0.)) if orig else None
+        lines.append('| {} | {} | {} | {} | {} | {} | {} | {} | {} | {} | {} |'.format(
+            r['model'], r['img_size'], orig.get('nodes', '-'), opt.get('nodes', '-'), _fmt(max_abs, '.2e'),
+            _fmt(max_rel, '.2e'), _fmt(r.get('torch_ms'), '.2f'), _fmt(orig.get('ms'), '.2f'),
+            _fmt(opt.get('ms'), '.2f'), _fmt(speedup, '.2f'), r['status']))
+
+    edges = ['0'] + ['1e%d' % e for e in range(-8, 0)] + ['inf']
+    lines.extend([
+        '',
+        '## Abs error histograms (optimized graph)',
+        '',
+        '| Model | ' + ' | '.join('<%s' % e for e in edges[1:]) + ' |',
+        '|---|' + '---|' * (len(edges) - 1),
+    ])
+    for r in results:
+        if 'opt' in r:
+            lines.append('| {} | {} |'.format(r['model'], ' | '.join(str(c) for c in r['opt']['abs_err_hist'])))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def main():
+    args = parser.parse_args()
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    all_models = geffnet.list_models()
+    model_names = []
+    for m in args.models:
+        model_names.extend(n for n in fnmatch.filter(all_models, m) if n not in model_names)
+    assert model_names, 'No models match %s' % args.models
+
+    results = []
+    for name in model_names:
+        result = verify_model(name, args)
+        results.append(result)
+        orig = result.get('orig', {})
+        opt = result.get('opt', {})
+        print('{:<32} {:<40} max abs err {} torch {} ms onnx {} ms opt {} ms'.format(
+            name, result['status'], _fmt(opt.get('max_abs_err'), '.2e'), _fmt(result.get('torch_ms'), '.2f'),
+            _fmt(orig.get('ms'), '.2f'), _fmt(opt.get('ms'), '.2f')))
+
+    num_failed = sum(r['status'] != 'ok' for r in results)
+    print('==> {} of {} models verified, {} failed'.format(len(results) - num_failed, len(results), num_failed))
+    if args.report:
+        write_report(results, args, args.report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
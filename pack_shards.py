@@ -0,0 +1,32 @@
+""" Image folder to packed shards conversion script
+
+Packs the images of a folder (class sub-folders, as read by data.Dataset) into large shard files of encoded
+image bytes + an index, for data.ShardDataset / ShardIterableDataset. Pass the output dir to validate.py in
+place of the image folder.
+"""
+import argparse
+
+from data import write_shards
+
+parser = argparse.ArgumentParser(description='Pack an image folder into shards')
+parser.add_argument('data', metavar='DIR',
+                    help='path to image folder')
+parser.add_argument('output', metavar='DIR',
+                    help='output directory for the shards and index')
+parser.add_argument('--shard-size', default=1024, type=int, metavar='MB',
+                    help='target shard size in MB (default: 1024)')
+parser.add_argument('-j', '--workers', default=16, type=int, metavar='N',
+                    help='number of file reading threads (default: 16)')
+parser.add_argument('--cache-index', dest='cache_index', action='store_true',
+                    help='load the image folder file list from a persistent index (built if needed)')
+
+
+def main():
+    args = parser.parse_args()
+    write_shards(
+        args.data, args.output, shard_size=args.shard_size << 20, num_workers=args.workers,
+        cache_index=args.cache_index)
+
+
+if __name__ == '__main__':
+    main()
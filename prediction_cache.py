@@ -0,0 +1,145 @@
+""" On-disk prediction cache for streaming, resumable validation
+
+A results directory holds memory-mapped .npy arrays keyed by sample index (top-k class indices and logits,
+per sample loss, target and optionally the full fp16 logits) plus a `meta.json` with the number of samples
+done. validate.py writes each batch as it goes and checkpoints `meta.json` every few batches, so a killed run
+resumes after the last checkpoint. Metrics (any top-k up to the cached k, per class accuracy) can be
+recomputed offline from the cache without running the model again:
+
+    python prediction_cache.py /path/to/results --topk 1 5 --per-class
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import torch.nn.functional as F
+
+_META_FILE = 'meta.json'
+
+
+class PredictionCache:
+    """ Memory-mapped per sample predictions
+
+    Args:
+        path: results directory, an existing cache w/ matching settings and info is resumed
+        num_samples: dataset size
+        num_classes: model output size
+        topk: number of top predictions kept per sample
+        save_logits: also keep the full logits (fp16)
+        **info: extra (JSON-able) run info stored in the meta file, ie model name
+    """
+
+    def __init__(self, path, num_samples=0, num_classes=1000, topk=5, save_logits=False, **info):
+        self.path = path
+        meta_path = os.path.join(path, _META_FILE)
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if num_samples:
+                # refuse to mix predictions of a different model / dataset / setup into the cache
+                for k, v in dict(num_samples=num_samples, num_classes=num_classes, topk=topk,
+                                 save_logits=save_logits, **info).items():
+                    assert self.meta.get(k) == v, \
+                        'Cached results in %s have %s=%s, not %s' % (path, k, self.meta.get(k), v)
+            mode = 'r+'
+        else:
+            assert num_samples, 'No cached results in %s' % path
+            os.makedirs(path, exist_ok=True)
+            self.meta = dict(
+                num_samples=num_samples, num_classes=num_classes, topk=topk, save_logits=save_logits,
+                num_done=0, **info)
+            mode = 'w+'
+        n, k, c = self.meta['num_samples'], self.meta['topk'], self.meta['num_classes']
+        self.topk_indices = self._open('topk_indices', mode, np.int32, (n, k))
+        self.topk_values = self._open('topk_values', mode, np.float32, (n, k))
+        self.losses = self._open('losses', mode, np.float32, (n,))
+        self.targets = self._open('targets', mode, np.int64, (n,))
+        self.logits = self._open('logits', mode, np.float16, (n, c)) if self.meta['save_logits'] else None
+        if mode == 'w+':
+            self.checkpoint(0)
+
+    def _open(self, name, mode, dtype, shape):
+        filename = os.path.join(self.path, name + '.npy')
+        if mode == 'w+':
+            return np.lib.format.open_memmap(filename, mode=mode, dtype=dtype, shape=shape)
+        return np.load(filename, mmap_mode=mode)
+
+    @property
+    def num_samples(self):
+        return self.meta['num_samples']
+
+    @property
+    def num_done(self):
+        return self.meta['num_done']
+
+    def update(self, start, output, target):
+        """ Write the model `output` (logits) and `target` of samples [start, start + batch size) """
+        end = start + output.size(0)
+        output = output.float()
+        values, indices = output.topk(self.meta['topk'], dim=1)
+        self.topk_indices[start:end] = indices.cpu().numpy()
+        self.topk_values[start:end] = values.cpu().numpy()
+        self.losses[start:end] = F.cross_entropy(output, target, reduction='none').cpu().numpy()
+        self.targets[start:end] = target.cpu().numpy()
+        if self.logits is not None:
+            self.logits[start:end] = output.half().cpu().numpy()
+        return end
+
+    def checkpoint(self, num_done):
+        """ Flush the arrays, then record the first `num_done` samples as complete """
+        for a in (self.topk_indices, self.topk_values, self.losses, self.targets, self.logits):
+            if a is not None:
+                a.flush()
+        self.meta['num_done'] = num_done
+        tmp_path = os.path.join(self.path, _META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, _META_FILE))
+
+    def correct(self, k=1):
+        """ bool array, target in the top-k predictions, for the completed samples """
+        n = self.num_done
+        assert k <= self.meta['topk'], 'Only the top-%d predictions are cached' % self.meta['topk']
+        return (self.topk_indices[:n, :k] == self.targets[:n, None]).any(axis=1)
+
+    def metrics(self, topk=(1, 5)):
+        n = self.num_done
+        results = dict(num_samples=n, loss=float(self.losses[:n].mean()) if n else 0.)
+        for k in topk:
+            results['prec%d' % k] = 100. * float(self.correct(k).mean()) if n else 0.
+        return results
+
+    def per_class_accuracy(self, k=1):
+        """ dict of class index -> top-k accuracy (%) """
+        correct = self.correct(k)
+        targets = self.targets[:self.num_done]
+        counts = np.bincount(targets, minlength=self.meta['num_classes'])
+        hits = np.bincount(targets, weights=correct, minlength=self.meta['num_classes'])
+        return {c: 100. * hits[c] / counts[c] for c in np.flatnonzero(counts).tolist()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metrics from cached validation results')
+    parser.add_argument('results', metavar='DIR',
+                        help='path to the results dir written by validate.py --results-dir')
+    parser.add_argument('--topk', type=int, nargs='+', default=[1, 5],
+                        help='top-k accuracies to report (default: 1 5)')
+    parser.add_argument('--per-class', dest='per_class', action='store_true',
+                        help='report the top-1 accuracy of each class')
+    args = parser.parse_args()
+
+    cache = PredictionCache(args.results)
+    if cache.num_done < cache.num_samples:
+        print('NOTE only {}/{} samples complete'.format(cache.num_done, cache.num_samples))
+    metrics = cache.metrics(topk=args.topk)
+    print(' * Loss {:.4f} '.format(metrics['loss']) + ' '.join(
+        'Prec@{} {:.3f}'.format(k, metrics['prec%d' % k]) for k in args.topk))
+    if args.per_class:
+        per_class = cache.per_class_accuracy(k=1)
+        for c in sorted(per_class, key=per_class.get):
+            print('{:5d} {:.2f}'.format(c, per_class[c]))
+
+
+if __name__ == '__main__':
+    main()
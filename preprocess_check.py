@@ -0,0 +1,128 @@
+""" Eval preprocessing check script
+
+Compares the default eval preprocessing (full decode, PIL Resize + CenterCrop) with the faster variants,
+JPEG draft (DCT scaled) decode and / or batched tensor resize + crop, over the images of a folder. Reports
+the preprocessing time of each and the pixel differences between them. For the end to end accuracy delta, run
+validate.py with and without --jpeg-draft / --tensor-resize.
+
+With --tf-preprocessing, the TensorFlow eval preprocessing is compared with its TensorFlow free
+reimplementation instead (requires TensorFlow). Add --top1 to also run the (pretrained) model on both outputs
+and report the top-1 accuracy of each over the checked images, ie
+
+    python preprocess_check.py /imagenet/validation/ --tf-preprocessing --top1 -m tf_efficientnet_b0 --num-images 500
+"""
+import argparse
+import time
+import torch
+from PIL import Image
+
+import geffnet
+from data import Dataset, resolve_data_config, transforms_imagenet_eval, decodes_image, BatchResizeCenterCrop
+from data.tf_eval_preprocessing import TfEvalPreprocessTransform
+
+parser = argparse.ArgumentParser(description='Eval preprocessing check')
+parser.add_argument('data', metavar='DIR',
+                    help='path to dataset')
+parser.add_argument('--model', '-m', metavar='MODEL', default='tf_efficientnet_b0',
+                    help='model architecture, for the data config (default: tf_efficientnet_b0)')
+parser.add_argument('--num-images', default=500, type=int, metavar='N',
+                    help='number of images to check (default: 500)')
+parser.add_argument('--jpeg-draft', dest='jpeg_draft', action='store_true',
+                    help='check JPEG draft decoding')
+parser.add_argument('--tensor-resize', dest='tensor_resize', action='store_true',
+                    help='check batched tensor resize + center crop')
+parser.add_argument('--tf-preprocessing', dest='tf_preprocessing', action='store_true',
+                    help='check the TensorFlow free TF eval preprocessing against TensorFlow')
+parser.add_argument('--top1', action='store_true',
+                    help='also compare the top-1 accuracy of the pretrained model on both outputs')
+parser.add_argument('--img-size', default=None, type=int,
+                    metavar='N', help='Input image dimension, uses model default if empty')
+parser.add_argument('--mean', type=float, nargs='+', default=None, metavar='MEAN',
+                    help='Override mean pixel value of dataset')
+parser.add_argument('--std', type=float,  nargs='+', default=None, metavar='STD',
+                    help='Override std deviation of of dataset')
+parser.add_argument('--crop-pct', type=float, default=None, metavar='PCT',
+                    help='Override default crop pct of 0.875')
+parser.add_argument('--interpolation', default='', type=str, metavar='NAME',
+                    help='Image resize interpolation type (overrides model)')
+
+
+def _load(filename, transform, load_bytes=False):
+    if load_bytes:
+        with open(filename, 'rb') as f:
+            return f.read()
+    img = Image.open(filename)
+    if not decodes_image(transform):
+        img = img.convert('RGB')
+    return img
+
+
+def main():
+    args = parser.parse_args()
+    if args.tf_preprocessing:
+        args.jpeg_draft = args.tensor_resize = False
+    elif not args.jpeg_draft and not args.tensor_resize:
+        args.jpeg_draft = True
+    data_config = resolve_data_config(None, args, default_cfg=geffnet.get_model_cfg(args.model))
+    img_size = data_config['input_size'][-2:]
+    if args.tf_preprocessing:
+        from data.tf_preprocessing import TfPreprocessTransform
+        transforms = [
+            TfPreprocessTransform(size=img_size, interpolation=data_config['interpolation']),
+            TfEvalPreprocessTransform(size=img_size, interpolation=data_config['interpolation'])]
+    else:
+        transforms = []
+        for check in (False, True):
+            transforms.append(transforms_imagenet_eval(
+                img_size,
+                crop_pct=data_config['crop_pct'],
+                interpolation=data_config['interpolation'],
+                use_prefetcher=True,
+                jpeg_draft=check and args.jpeg_draft,
+                tensor_resize=check and args.tensor_resize))
+    batch_resize = BatchResizeCenterCrop(
+        img_size, crop_pct=data_config['crop_pct'], interpolation=data_config['interpolation'])
+
+    samples = Dataset(args.data).imgs[:args.num_images]
+    if args.top1:
+        model = geffnet.create_model(args.model, pretrained=True)
+        model.eval()
+        mean = torch.tensor([x * 255 for x in data_config['mean']]).view(1, 3, 1, 1)
+        std = torch.tensor([x * 255 for x in data_config['std']]).view(1, 3, 1, 1)
+    times = [0., 0.]
+    max_diff = 0
+    sum_diff = 0.
+    num_changed = 0
+    num_correct = [0, 0]
+    for filename, target in samples:
+        outputs = []
+        for i, transform in enumerate(transforms):
+            start = time.time()
+            img = torch.from_numpy(transform(_load(filename, transform, args.tf_preprocessing)))
+            if i == 1 and args.tensor_resize:
+                img = batch_resize([img])[0]
+            outputs.append(img.float())
+            times[i] += time.time() - start
+        diff = (outputs[0] - outputs[1]).abs()
+        max_diff = max(max_diff, diff.max().item())
+        sum_diff += diff.mean().item()
+        num_changed += int(diff.max().item() > 0)
+        if args.top1:
+            with torch.no_grad():
+                output = model((torch.stack(outputs) - mean) / std)
+            for i, pred in enumerate(output.argmax(dim=1).tolist()):
+                num_correct[i] += int(pred == target)
+
+    num_images = len(samples)
+    print('Default: {:.2f} ms/img, checked: {:.2f} ms/img ({:.2f}x)'.format(
+        1000 * times[0] / num_images, 1000 * times[1] / num_images, times[0] / max(times[1], 1e-9)))
+    print('Pixel diff (0-255) mean {:.3f}, max {:.0f}, {}/{} images differ'.format(
+        sum_diff / num_images, max_diff, num_changed, num_images))
+    if args.top1:
+        top1 = [100. * c / num_images for c in num_correct]
+        print('Top-1 {} default: {:.3f}, checked: {:.3f} (delta {:+.3f})'.format(
+            args.model, top1[0], top1[1], top1[1] - top1[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+""" Post-training static INT8 quantization script
+
+Calibrates a model on a folder of images (a few hundred from the train set is plenty), converts it to INT8 and
+optionally validates it and saves it as TorchScript. CPU only.
+"""
+import argparse
+import time
+import torch
+
+import geffnet
+from geffnet.quantize import prepare, calibrate, convert
+from data import Dataset, create_loader, resolve_data_config
+from utils import accuracy, AverageMeter
+
+parser = argparse.ArgumentParser(description='PyTorch ImageNet Post-training Quantization')
+parser.add_argument('data', metavar='DIR',
+                    help='path to calibration images')
+parser.add_argument('--model', '-m', metavar='MODEL', default='tf_efficientnet_lite0',
+                    help='model architecture (default: tf_efficientnet_lite0)')
+parser.add_argument('--val-data', default='', type=str, metavar='DIR',
+                    help='path to validation dataset, validate the quantized model if set')
+parser.add_argument('-j', '--workers', default=4, type=int, metavar='N',
+                    help='number of data loading workers (default: 4)')
+parser.add_argument('-b', '--batch-size', default=32, type=int,
+                    metavar='N', help='mini-batch size (default: 32)')
+parser.add_argument('--calib-batches', default=16, type=int,
+                    metavar='N', help='number of calibration batches (default: 16)')
+parser.add_argument('--backend', default='', type=str,
+                    help='quantized engine, onednn, x86, fbgemm or qnnpack (default: first available in that order)')
+parser.add_argument('--mode', default='eager', type=str, choices=['eager', 'fx'],
+                    help='eager mode or FX graph mode quantization (default: eager)')
+parser.add_argument('--img-size', default=None, type=int,
+                    metavar='N', help='Input image dimension, uses model default if empty')
+parser.add_argument('--mean', type=float, nargs='+', default=None, metavar='MEAN',
+                    help='Override mean pixel value of dataset')
+parser.add_argument('--std', type=float,  nargs='+', default=None, metavar='STD',
+                    help='Override std deviation of of dataset')
+parser.add_argument('--crop-pct', type=float, default=None, metavar='PCT',
+                    help='Override default crop pct of 0.875')
+parser.add_argument('--interpolation', default='', type=str, metavar='NAME',
+                    help='Image resize interpolation type (overrides model)')
+parser.add_argument('--checkpoint', default='', type=str, metavar='PATH',
+                    help='path to float checkpoint (default: none, use pretrained weights)')
+parser.add_argument('--output', default='', type=str, metavar='PATH',
+                    help='save the quantized model as TorchScript to this file')
+parser.add_argument('--print-freq', '-p', default=10, type=int,
+                    metavar='N', help='print frequency (default: 10)')
+
+
+def _create_loader(data_dir, data_config, args):
+    return create_loader(
+        Dataset(data_dir),
+        input_size=data_config['input_size'],
+        batch_size=args.batch_size,
+        use_prefetcher=False,
+        interpolation=data_config['interpolation'],
+        mean=data_config['mean'],
+        std=data_config['std'],
+        num_workers=args.workers,
+        crop_pct=data_config['crop_pct'])
+
+
+def validate(model, loader, args):
+    batch_time = AverageMeter()
+    top1 = AverageMeter()
+    top5 = AverageMeter()
+    end = time.time()
+    with torch.no_grad():
+        for i, (input, target) in enumerate(loader):
+            output = model(input)
+            prec1, prec5 = accuracy(output, target, topk=(1, 5))
+            top1.update(prec1.item(), input.size(0))
+            top5.update(prec5.item(), input.size(0))
+            batch_time.update(time.time() - end)
+            end = time.time()
+            if i % args.print_freq == 0:
+                print('Test: [{0}/{1}]\t'
+                      'Time {batch_time.val:.3f} ({batch_time.avg:.3f}, {rate_avg:.3f}/s) \t'
+                      'Prec@1 {top1.val:.3f} ({top1.avg:.3f})\t'
+                      'Prec@5 {top5.val:.3f} ({top5.avg:.3f})'.format(
+                    i, len(loader), batch_time=batch_time, rate_avg=input.size(0) / batch_time.avg,
+                    top1=top1, top5=top5))
+    print(' * Prec@1 {top1.avg:.3f} ({top1a:.3f}) Prec@5 {top5.avg:.3f} ({top5a:.3f})'.format(
+        top1=top1, top1a=100-top1.avg, top5=top5, top5a=100.-top5.avg))
+
+
+def main():
+    args = parser.parse_args()
+
+    model = geffnet.create_model(
+        args.model, pretrained=not args.checkpoint, checkpoint_path=args.checkpoint)
+    data_config = resolve_data_config(model, args)
+
+    model = prepare(model, backend=args.backend, input_size=data_config['input_size'], mode=args.mode)
+    start = time.time()
+    num_images = calibrate(
+        model, _create_loader(args.data, data_config, args), num_batches=args.calib_batches)
+    print('=> Calibrated on {} images in {:.1f}s'.format(num_images, time.time() - start))
+    model = convert(model)
+
+    if args.val_data:
+        validate(model, _create_loader(args.val_data, data_config, args), args)
+
+    if args.output:
+        torch.jit.save(torch.jit.script(model), args.output)
+        print("=> Saved quantized TorchScript model to '{}'".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+""" Micro-batching inference server script
+
+Serves a model over a local HTTP (TCP or unix socket) endpoint, single image requests are coalesced into
+batches (see geffnet/serve.py). Preprocessing matches validate.py.
+
+    python serve.py --model tf_efficientnet_b3 --max-batch-size 16 --max-delay-ms 10
+    curl --data-binary @image.jpg http://127.0.0.1:8000/predict
+    curl http://127.0.0.1:8000/metrics
+"""
+import argparse
+import io
+
+import torch
+from PIL import Image
+
+import geffnet
+from geffnet.serve import ModelRunner, MicroBatcher, InferenceServer
+from data import transforms_imagenet_eval, resolve_data_config, decodes_image
+
+parser = argparse.ArgumentParser(description='PyTorch ImageNet Inference Server')
+parser.add_argument('--model', '-m', metavar='MODEL', default='efficientnet_b0',
+                    help='model architecture (default: efficientnet_b0)')
+parser.add_argument('--checkpoint', default='', type=str, metavar='PATH',
+                    help='path to checkpoint (default: none, use pretrained weights)')
+parser.add_argument('--num-classes', type=int, default=1000,
+                    help='Number classes in dataset')
+parser.add_argument('--img-size', default=None, type=int,
+                    metavar='N', help='Input image dimension, uses model default if empty')
+parser.add_argument('--mean', type=float, nargs='+', default=None, metavar='MEAN',
+                    help='Override mean pixel value of dataset')
+parser.add_argument('--std', type=float,  nargs='+', default=None, metavar='STD',
+                    help='Override std deviation of of dataset')
+parser.add_argument('--crop-pct', type=float, default=None, metavar='PCT',
+                    help='Override default crop pct of 0.875')
+parser.add_argument('--interpolation', default='', type=str, metavar='NAME',
+                    help='Image resize interpolation type (overrides model)')
+parser.add_argument('--jpeg-draft', dest='jpeg_draft', action='store_true',
+                    help='decode JPEGs at a reduced (DCT scaled) size that still covers the resize')
+parser.add_argument('--max-batch-size', default=32, type=int, metavar='N',
+                    help='max requests coalesced into one batch (default: 32)')
+parser.add_argument('--max-delay-ms', default=5., type=float, metavar='MS',
+                    help='max time the first request of a batch waits for more requests (default: 5)')
+parser.add_argument('--executor', default='thread', type=str, choices=['thread', 'process'],
+                    help='run batches on a thread pool (shared model) or process pool (model per worker)')
+parser.add_argument('--workers', default=1, type=int, metavar='N',
+                    help='number of batches in flight at once (default: 1)')
+parser.add_argument('--num-threads', default=0, type=int, metavar='N',
+                    help='number of torch threads (per worker for process pool), 0 to leave as is (default: 0)')
+parser.add_argument('--max-body-mb', default=16., type=float, metavar='MB',
+                    help='max request body size, larger requests are rejected w/ 413 (default: 16)')
+parser.add_argument('--top-k', default=5, type=int, metavar='N',
+                    help='number of top classes returned (default: 5)')
+parser.add_argument('--fuse-bn', dest='fuse_bn', action='store_true',
+                    help='fold BatchNorm layers into preceding convolutions')
+parser.add_argument('--host', default='127.0.0.1', type=str,
+                    help='host to listen on (default: 127.0.0.1)')
+parser.add_argument('--port', default=8000, type=int,
+                    help='port to listen on (default: 8000)')
+parser.add_argument('--unix-socket', default='', type=str, metavar='PATH',
+                    help='listen on a unix socket instead of host:port')
+parser.add_argument('--num-gpu', type=int, default=0,
+                    help='Number of GPUS to use (default: 0, CPU, thread pool only)')
+
+
+def main():
+    args = parser.parse_args()
+    if args.num_threads and args.executor == 'thread':
+        torch.set_num_threads(args.num_threads)
+
+    model_kwargs = dict(
+        num_classes=args.num_classes, pretrained=not args.checkpoint, checkpoint_path=args.checkpoint)
+    data_config = resolve_data_config(None, args, default_cfg=geffnet.get_model_cfg(args.model))
+
+    if args.executor == 'process':
+        # each worker builds its own model
+        runner = ModelRunner(
+            args.model, mode='process', workers=args.workers, num_threads=args.num_threads, fuse_bn=args.fuse_bn,
+            **model_kwargs)
+    else:
+        model = geffnet.create_model(args.model, **model_kwargs)
+        if args.num_gpu > 0:
+            model = model.cuda()
+        runner = ModelRunner(model, mode='thread', workers=args.workers, fuse_bn=args.fuse_bn)
+
+    transform = transforms_imagenet_eval(
+        img_size=data_config['input_size'][-2:],
+        crop_pct=data_config['crop_pct'],
+        interpolation=data_config['interpolation'],
+        mean=data_config['mean'],
+        std=data_config['std'],
+        jpeg_draft=args.jpeg_draft)
+
+    def preprocess(data):
+        img = Image.open(io.BytesIO(data))
+        if not decodes_image(transform):
+            img = img.convert('RGB')
+        return transform(img)
+
+    batcher = MicroBatcher(runner, max_batch_size=args.max_batch_size, max_delay=args.max_delay_ms / 1000.)
+    server = InferenceServer(
+        batcher, preprocess, top_k=args.top_k, max_body_size=int(args.max_body_mb * (1 << 20)))
+    print('=> Serving {} on {}'.format(
+        args.model, args.unix_socket or 'http://{}:{}'.format(args.host, args.port)))
+    server.serve_forever(host=args.host, port=args.port, unix_socket=args.unix_socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -29,8 +29,10 @@ setup(
         'Intended Audience :: Education',
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: Apache Software License',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Scientific/Engineering',
         'Topic :: Scientific/Engineering :: Artificial Intelligence',
         'Topic :: Software Development',
@@ -41,6 +43,6 @@ setup(
     # Note that this is a string of words separated by whitespace, not a list.
     keywords='pytorch pretrained models efficientnet mixnet mobilenetv3 mnasnet',
     packages=find_packages(exclude=['data']),
-    install_requires=['torch >= 1.2', 'torchvision'],
-    python_requires='>=3.6',
+    install_requires=['torch >= 2.0', 'torchvision >= 0.15'],
+    python_requires='>=3.8',
 )
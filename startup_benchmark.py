@@ -0,0 +1,54 @@
+""" Startup time benchmark script
+This script measures the cold start costs of a fresh process: `import geffnet`, `list_models()`, the
+first `create_model()` and the first forward pass. Each trial runs in a new Python interpreter.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+parser = argparse.ArgumentParser(description='Startup Time Benchmark')
+parser.add_argument('--model', '-m', metavar='MODEL', default='efficientnet_b0',
+                    help='model architecture (default: efficientnet_b0)')
+parser.add_argument('--trials', default=5, type=int,
+                    metavar='N', help='number of fresh interpreter runs (default: 5)')
+parser.add_argument('--img-size', default=224, type=int,
+                    metavar='N', help='Input image dimension (default: 224)')
+
+_TRIAL_SRC = '''
+import json, sys, time
+t0 = time.perf_counter()
+import geffnet
+t1 = time.perf_counter()
+models = geffnet.list_models()
+t2 = time.perf_counter()
+torch_imported = 'torch' in sys.modules
+model = geffnet.create_model({model!r})
+t3 = time.perf_counter()
+import torch
+with torch.no_grad():
+    model.eval()(torch.randn(1, 3, {img_size}, {img_size}))
+t4 = time.perf_counter()
+print(json.dumps(dict(
+    import_geffnet=t1 - t0, list_models=t2 - t1, create_model=t3 - t2, first_forward=t4 - t3,
+    torch_imported_by_list=torch_imported)))
+'''
+
+
+def main():
+    args = parser.parse_args()
+    src = _TRIAL_SRC.format(model=args.model, img_size=args.img_size)
+    results = []
+    for _ in range(args.trials):
+        out = subprocess.check_output([sys.executable, '-c', src])
+        results.append(json.loads(out.decode().strip().splitlines()[-1]))
+
+    print('Startup times for {} over {} trials (min / mean in ms):'.format(args.model, args.trials))
+    for k in ['import_geffnet', 'list_models', 'create_model', 'first_forward']:
+        vals = [r[k] * 1000 for r in results]
+        print('  {:<16} {:9.1f} / {:9.1f}'.format(k, min(vals), sum(vals) / len(vals)))
+    print('  torch imported by import + list_models: {}'.format(results[0]['torch_imported_by_list']))
+
+
+if __name__ == '__main__':
+    main()
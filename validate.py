@@ -10,8 +10,10 @@ import torch.nn as nn
 import torch.nn.parallel
 
 import geffnet
-from data import Dataset, create_loader, resolve_data_config
+from geffnet.helpers import checkpoint_weight_store
+from data import Dataset, ShardDataset, ShardIterableDataset, is_shard_dataset, create_loader, resolve_data_config
 from utils import accuracy, AverageMeter
+from prediction_cache import PredictionCache
 
 torch.backends.cudnn.benchmark = True
 
@@ -42,8 +44,44 @@ parser.add_argument('--checkpoint', default='', type=str, metavar='PATH',
                     help='path to latest checkpoint (default: none)')
 parser.add_argument('--pretrained', dest='pretrained', action='store_true',
                     help='use pre-trained model')
+parser.add_argument('--mmap', dest='mmap', action='store_true',
+                    help='memory-map pretrained weights via a local weight store instead of loading a copy')
+parser.add_argument('--init', default='', type=str, choices=['', 'skip', 'meta'],
+                    help='model init mode, \'skip\' or \'meta\' to avoid initializing weights that will be loaded')
 parser.add_argument('--torchscript', dest='torchscript', action='store_true',
                     help='convert model torchscript for inference')
+parser.add_argument('--channels-last', dest='channels_last', action='store_true',
+                    help='run the model and data pipeline in channels_last (NHWC) memory format')
+parser.add_argument('--fuse-bn', dest='fuse_bn', action='store_true',
+                    help='fold BatchNorm layers into preceding convolutions before inference')
+parser.add_argument('--static-same-pad', dest='static_same_pad', action='store_true',
+                    help='precompute TF \'SAME\' padding for the fixed validation input size')
+parser.add_argument('--cache-index', dest='cache_index', action='store_true',
+                    help='load the dataset file list from a persistent index next to the dataset (built if needed)')
+parser.add_argument('--stream-shards', dest='stream_shards', action='store_true',
+                    help='stream a packed shard dataset sequentially (per worker shards) instead of random access')
+parser.add_argument('--jpeg-draft', dest='jpeg_draft', action='store_true',
+                    help='decode JPEGs at a reduced (DCT scaled) size that still covers the resize')
+parser.add_argument('--tensor-resize', dest='tensor_resize', action='store_true',
+                    help='batched tensor resize + center crop in the prefetcher instead of PIL in the workers, '
+                         'approximates the PIL output')
+parser.add_argument('--collate-buffers', type=int, default=0, metavar='N',
+                    help='collate into a ring of N preallocated batch buffers per worker, 0 to disable, at least 4 w/ workers '
+                         '(default: 0)')
+parser.add_argument('--pin-memory', dest='pin_memory', action='store_true',
+                    help='pin batch memory for faster host to device copies')
+parser.add_argument('--fp16', dest='fp16', action='store_true',
+                    help='run the model and normalized input batches in half precision (CUDA only)')
+parser.add_argument('--results-dir', default='', type=str, metavar='DIR',
+                    help='stream predictions to a (resumable) on-disk cache in this dir')
+parser.add_argument('--save-logits', dest='save_logits', action='store_true',
+                    help='also cache the full fp16 logits (w/ --results-dir)')
+parser.add_argument('--checkpoint-freq', default=50, type=int, metavar='N',
+                    help='batches between results cache checkpoints (default: 50)')
+parser.add_argument('--cpu-procs', type=int, default=1, metavar='N',
+                    help='CPU data-parallel validation over N processes, each pinned to 1/N of the cores, sharing '
+                         'one memory-mapped copy of the weights (--channels-last and --fuse-bn copy them) '
+                         '(default: 1)')
 parser.add_argument('--num-gpu', type=int, default=1,
                     help='Number of GPUS to use')
 parser.add_argument('--tf-preprocessing', dest='tf_preprocessing', action='store_true',
@@ -52,11 +90,17 @@ parser.add_argument('--no-cuda', dest='no_cuda', action='store_true',
                     help='')
 
 
-def main():
-    args = parser.parse_args()
+def validate(args, rank=0, num_procs=1, result_queue=None):
+    """ Validate the model on the dataset, or with `num_procs` > 1, on shard `rank` of the dataset
 
-    if not args.checkpoint and not args.pretrained:
-        args.pretrained = True
+    A shard process is pinned to its share of the available cores and runs its own intra-op thread pool.
+    Its metric sums are put on `result_queue` for the parent to reduce.
+    """
+    if num_procs > 1:
+        cores = sorted(os.sched_getaffinity(0))
+        cores = cores[rank * len(cores) // num_procs:(rank + 1) * len(cores) // num_procs]
+        os.sched_setaffinity(0, cores)
+        torch.set_num_threads(len(cores))
 
     if args.torchscript:
         geffnet.config.set_scriptable(True)
@@ -67,16 +111,29 @@ def main():
         num_classes=args.num_classes,
         in_chans=3,
         pretrained=args.pretrained,
-        checkpoint_path=args.checkpoint)
+        checkpoint_path=args.checkpoint,
+        mmap=args.mmap,
+        init=args.init,
+        channels_last=args.channels_last)
+
+    if args.fuse_bn:
+        model = geffnet.fuse_for_inference(model)
+
+    if rank == 0:
+        print('Model %s created, param count: %d' %
+              (args.model, sum([m.numel() for m in model.parameters()])))
+
+    data_config = resolve_data_config(model, args, verbose=rank == 0)
+
+    if args.static_same_pad:
+        geffnet.set_same_padding_input_size(model, data_config['input_size'])
 
     if args.torchscript:
         torch.jit.optimized_execution(True)
         model = torch.jit.script(model)
 
-    print('Model %s created, param count: %d' %
-          (args.model, sum([m.numel() for m in model.parameters()])))
-
-    data_config = resolve_data_config(model, args)
+    if args.fp16:
+        model = model.half()
 
     criterion = nn.CrossEntropyLoss()
 
@@ -87,17 +144,48 @@ def main():
             model = model.cuda()
         criterion = criterion.cuda()
 
+    if is_shard_dataset(args.data):
+        shard_dataset_cls = ShardIterableDataset if args.stream_shards else ShardDataset
+        dataset = shard_dataset_cls(args.data, load_bytes=args.tf_preprocessing)
+    else:
+        dataset = Dataset(args.data, load_bytes=args.tf_preprocessing, cache_index=args.cache_index)
+
+    cache = None
+    start_index = 0
+    sampler = None
+    if num_procs > 1:
+        assert not isinstance(dataset, torch.utils.data.IterableDataset), \
+            'Multi-process validation needs a map-style dataset'
+        sampler = range(rank * len(dataset) // num_procs, (rank + 1) * len(dataset) // num_procs)
+    elif args.results_dir:
+        assert not isinstance(dataset, torch.utils.data.IterableDataset), \
+            'The results cache needs a map-style dataset'
+        cache = PredictionCache(
+            args.results_dir, len(dataset), num_classes=args.num_classes, save_logits=args.save_logits,
+            model=args.model, data=args.data)
+        start_index = cache.num_done
+        if start_index:
+            print('=> Resuming at sample {}/{} from {}'.format(start_index, len(dataset), args.results_dir))
+            sampler = range(start_index, len(dataset))
     loader = create_loader(
-        Dataset(args.data, load_bytes=args.tf_preprocessing),
+        dataset,
         input_size=data_config['input_size'],
         batch_size=args.batch_size,
-        use_prefetcher=not args.no_cuda,
+        use_prefetcher=True,
         interpolation=data_config['interpolation'],
         mean=data_config['mean'],
         std=data_config['std'],
         num_workers=args.workers,
         crop_pct=data_config['crop_pct'],
-        tensorflow_preprocessing=args.tf_preprocessing)
+        tensorflow_preprocessing=args.tf_preprocessing,
+        channels_last=args.channels_last,
+        jpeg_draft=args.jpeg_draft,
+        collate_buffers=args.collate_buffers,
+        pin_memory=args.pin_memory,
+        device='cpu' if args.no_cuda else 'cuda',
+        fp16=args.fp16,
+        tensor_resize=args.tensor_resize,
+        sampler=sampler)
 
     batch_time = AverageMeter()
     losses = AverageMeter()
@@ -106,16 +194,18 @@ def main():
 
     model.eval()
     end = time.time()
+    sample_idx = start_index
     with torch.no_grad():
         for i, (input, target) in enumerate(loader):
-            if not args.no_cuda:
-                target = target.cuda()
-                input = input.cuda()
-
             # compute output
             output = model(input)
             loss = criterion(output, target)
 
+            if cache is not None:
+                sample_idx = cache.update(sample_idx, output, target)
+                if (i + 1) % args.checkpoint_freq == 0:
+                    cache.checkpoint(sample_idx)
+
             # measure accuracy and record loss
             prec1, prec5 = accuracy(output.data, target, topk=(1, 5))
             losses.update(loss.item(), input.size(0))
@@ -126,7 +216,7 @@ def main():
             batch_time.update(time.time() - end)
             end = time.time()
 
-            if i % args.print_freq == 0:
+            if rank == 0 and i % args.print_freq == 0:
                 print('Test: [{0}/{1}]\t'
                       'Time {batch_time.val:.3f} ({batch_time.avg:.3f}, {rate_avg:.3f}/s) \t'
                       'Loss {loss.val:.4f} ({loss.avg:.4f})\t'
@@ -136,9 +226,71 @@ def main():
                     rate_avg=input.size(0) / batch_time.avg,
                     loss=losses, top1=top1, top5=top5))
 
+    if result_queue is not None:
+        result_queue.put(dict(
+            count=top1.count, loss_sum=losses.sum, top1_sum=top1.sum, top5_sum=top5.sum, time=batch_time.sum))
+        return
+
+    if cache is not None:
+        cache.checkpoint(sample_idx)
+        if start_index:
+            # averages over the whole dataset, incl the samples of previous runs
+            metrics = cache.metrics(topk=(1, 5))
+            top1.avg, top5.avg = metrics['prec1'], metrics['prec5']
+
     print(' * Prec@1 {top1.avg:.3f} ({top1a:.3f}) Prec@5 {top5.avg:.3f} ({top5a:.3f})'.format(
         top1=top1, top1a=100-top1.avg, top5=top5, top5a=100.-top5.avg))
 
 
+def validate_cpu_procs(args):
+    """ CPU data-parallel validation, one process per core set, each on a disjoint shard of the dataset """
+    num_procs = args.cpu_procs
+    assert args.no_cuda, 'Multi-process validation is CPU only (--no-cuda)'
+    assert not args.results_dir, 'The results cache is not supported w/ multi-process validation'
+    # every process binds the same memory-mapped weight store, converted once here
+    if args.pretrained:
+        args.mmap = True
+        geffnet.create_model(args.model, num_classes=args.num_classes, pretrained=True, mmap=True, init='meta')
+    elif args.checkpoint:
+        args.checkpoint = checkpoint_weight_store(args.checkpoint)
+    if args.channels_last or args.fuse_bn:
+        print('=> Warning: --channels-last / --fuse-bn copy the weights in each process, '
+              'they are no longer shared')
+
+    ctx = torch.multiprocessing.get_context('spawn')
+    result_queue = ctx.SimpleQueue()
+    start = time.time()
+    torch.multiprocessing.spawn(_validate_proc, args=(num_procs, args, result_queue), nprocs=num_procs)
+    elapsed = time.time() - start
+    results = [result_queue.get() for _ in range(num_procs)]
+
+    count = sum(r['count'] for r in results)
+    loss = sum(r['loss_sum'] for r in results) / count
+    top1 = sum(r['top1_sum'] for r in results) / count
+    top5 = sum(r['top5_sum'] for r in results) / count
+    print(' * {} procs, {} images in {:.1f}s ({:.3f}/s), Loss {:.4f}'.format(
+        num_procs, count, elapsed, count / elapsed, loss))
+    print(' * Prec@1 {top1:.3f} ({top1a:.3f}) Prec@5 {top5:.3f} ({top5a:.3f})'.format(
+        top1=top1, top1a=100-top1, top5=top5, top5a=100.-top5))
+
+
+def _validate_proc(rank, num_procs, args, result_queue):
+    validate(args, rank=rank, num_procs=num_procs, result_queue=result_queue)
+
+
+def main():
+    args = parser.parse_args()
+
+    if not args.checkpoint and not args.pretrained:
+        args.pretrained = True
+    assert not (args.fp16 and args.no_cuda), \
+        '--fp16 requires CUDA, half precision CPU conv support depends on the PyTorch version'
+
+    if args.cpu_procs > 1:
+        validate_cpu_procs(args)
+    else:
+        validate(args)
+
+
 if __name__ == '__main__':
     main()